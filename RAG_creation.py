@@ -1,96 +1,217 @@
-from langchain_community.document_loaders import DirectoryLoader
-# Changed from TextLoader to PyPDFLoader
-from langchain_community.document_loaders import PyPDFLoader 
+from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_openai import AzureOpenAIEmbeddings, AzureChatOpenAI
+from langchain_openai import AzureChatOpenAI
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import argparse
+import glob
+import hashlib
+import json
 import os
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from annIndex import VECTOR_BACKEND, export_from_chroma, exported_index_version
+from bm25Index import BM25Index
+from embeddingService import get_embedding_service
+from indexVersion import bump_index_version, read_index_version
+
 load_dotenv()
 
 # Define the path where the ChromaDB will be persisted
 CHROMA_DB_PATH = "./chroma_vector_db"
 
+# Records which PDFs (by content hash) are already in the index and which chunk ids they produced.
+MANIFEST_FILE = "ingest_manifest.json"
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks per add_texts call
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_and_split(path: str) -> List[Tuple[str, Dict]]:
+    """
+    Runs in a worker process: parses one PDF and splits it into chunks.
+    Returns plain (text, metadata) pairs so results are cheap to pickle.
+    """
+    documents = PyPDFLoader(path).load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len
+    )
+    return [(chunk.page_content, chunk.metadata) for chunk in text_splitter.split_documents(documents)]
+
+
+def _chunk_ids(path: str, file_hash: str, count: int) -> List[str]:
+    # Path is part of the id so two identical files in different folders do not collide.
+    path_digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+    return [f"{file_hash[:24]}-{path_digest}-{i}" for i in range(count)]
+
+
+def load_manifest(db_path: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(db_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(db_path: str, manifest: Dict[str, Dict]):
+    os.makedirs(db_path, exist_ok=True)
+    path = os.path.join(db_path, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
 # --- RAG Insertion Class ---
 class RagVectorDB:
     def __init__(self):
-        
-        # 1. Define Embedding Model
-        self.embedding_model = AzureOpenAIEmbeddings(
-            azure_deployment="text-embedding-ada-002",
-            openai_api_version="2024-05-01-preview" 
-        )
-        
+
+        # 1. Define Embedding Model (batched, rate-limited and cached; re-ingested chunks are not re-embedded)
+        self.embedding_model = get_embedding_service()
+
         # 2. Define LLM Model (Uses environment variable for deployment name)
         # Note: You should ensure AZURE_OPENAI_CHAT_DEPLOYMENT or similar is set in your .env
         self.llm = AzureChatOpenAI(
-            azure_deployment=os.getenv("AZURE_OPENAI_ENDPOINT"), 
+            azure_deployment=os.getenv("AZURE_OPENAI_ENDPOINT"),
             api_version="2024-05-01-preview"
         )
-        
-    def create_vector_db(self, doc_directory: str, db_path: str = CHROMA_DB_PATH) -> Chroma:
+
+    def create_vector_db(
+        self,
+        doc_directory: str,
+        db_path: str = CHROMA_DB_PATH,
+        full: bool = False,
+        workers: Optional[int] = None,
+        export_mmap: bool = VECTOR_BACKEND == "mmap",
+    ) -> Chroma:
         """
-        Loads PDF documents, splits them, and indexes them into a persistent ChromaDB.
+        Indexes the PDFs under doc_directory into a persistent ChromaDB.
+
+        By default only new or changed PDFs (by content hash) are parsed and
+        embedded, and chunks of PDFs that were removed are deleted. Parsing and
+        splitting run in a process pool; each file's chunks are written to the
+        store as soon as that file is done. full=True rebuilds from scratch.
+        export_mmap=True refreshes the memory-mapped read index (annIndex.py).
         """
-        
-        print("--- Step 1: Loading PDF Documents ---")
-        try:
-            # 1. UPDATED: Change glob to search for .pdf files
-            # 2. UPDATED: Change loader_cls to PyPDFLoader
-            loader = DirectoryLoader(
-                path=doc_directory, 
-                glob="**/*.pdf", 
-                loader_cls=PyPDFLoader
+        vector_db = Chroma(
+            embedding_function=self.embedding_model,
+            persist_directory=db_path
+        )
+
+        # Lexical index for hybrid retrieval, kept in step with the vector store (same chunk ids).
+        bm25_index = BM25Index(db_path)
+
+        manifest = {} if full else load_manifest(db_path)
+        if full:
+            print("--- Full rebuild: dropping existing collection ---")
+            bm25_index.clear()
+            vector_db.delete_collection()
+            vector_db = Chroma(
+                embedding_function=self.embedding_model,
+                persist_directory=db_path
             )
-            documents = loader.load()
-            
-            if not documents:
-                print(f"Loaded 0 documents. Please check that '{doc_directory}' contains .pdf files.")
-                return None
-                
-            print(f"Loaded {len(documents)} document pages from {doc_directory}.")
-            
-        except Exception as e:
-            print(f"Error loading documents (Did you install 'pypdf'?): {e}")
+
+        print("--- Step 1: Scanning PDF Documents ---")
+        paths = sorted(glob.glob(os.path.join(doc_directory, "**", "*.pdf"), recursive=True))
+        if not paths and not manifest:
+            print(f"Loaded 0 documents. Please check that '{doc_directory}' contains .pdf files.")
             return None
 
-        print("--- Step 2: Splitting Documents ---")
-        # Split documents into smaller, meaningful chunks for better retrieval
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        chunks = text_splitter.split_documents(documents)
-        print(f"Split documents into {len(chunks)} chunks.")
-
-        print("--- Step 3: Indexing (Creating Embeddings and Vector Store) ---")
-        # Create and persist the Chroma vector store using Azure Embeddings
-        vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embedding_model, 
-            persist_directory=db_path       
-        )
-        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            hashes = dict(zip(paths, pool.map(_file_sha256, paths)))
+
+        removed = [p for p in manifest if p not in hashes]
+        to_process = [p for p in paths if manifest.get(p, {}).get("sha256") != hashes[p]]
+        print(f"{len(paths)} PDFs found: {len(to_process)} new/changed, {len(removed)} removed, "
+              f"{len(paths) - len(to_process)} unchanged.")
+
+        if not to_process and not removed:
+            print("VectorDB is already up to date.")
+            if export_mmap and read_index_version(db_path) != exported_index_version(db_path):
+                export_from_chroma(db_path)
+            return vector_db
+
+        # Drop chunks of removed files and stale chunks of changed files.
+        stale_ids = [chunk_id for p in removed + to_process for chunk_id in manifest.get(p, {}).get("chunk_ids", [])]
+        if stale_ids:
+            vector_db.delete(ids=stale_ids)
+            bm25_index.delete(stale_ids)
+            print(f"Deleted {len(stale_ids)} stale chunks.")
+        for p in removed:
+            manifest.pop(p, None)
+
+        print("--- Step 2: Parsing, Splitting and Indexing ---")
+        total_chunks = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_load_and_split, p): p for p in to_process}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    manifest.pop(path, None)
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        print(f"Error loading '{path}' (Did you install 'pypdf'?): {e}")
+                        continue
+
+                    ids = _chunk_ids(path, hashes[path], len(chunks))
+                    for start in range(0, len(chunks), INGEST_BATCH_SIZE):
+                        batch = chunks[start:start + INGEST_BATCH_SIZE]
+                        batch_ids = ids[start:start + INGEST_BATCH_SIZE]
+                        texts = [text for text, _ in batch]
+                        metadatas = [metadata for _, metadata in batch]
+                        vector_db.add_texts(texts=texts, metadatas=metadatas, ids=batch_ids)
+                        bm25_index.add(batch_ids, texts, metadatas)
+
+                    manifest[path] = {"sha256": hashes[path], "chunk_ids": ids}
+                    # Saved per file so an interrupted run resumes where it stopped.
+                    save_manifest(db_path, manifest)
+                    total_chunks += len(chunks)
+                    print(f"Indexed {len(chunks)} chunks from {path}.")
+        finally:
+            save_manifest(db_path, manifest)
+            # Invalidates caches holding answers/results built from the previous index.
+            bump_index_version(db_path)
+
         vector_db.persist()
-        print(f"Successfully created and persisted VectorDB at {db_path}.")
-        
+        print(f"Successfully indexed {total_chunks} chunks into VectorDB at {db_path}.")
+
+        if export_mmap:
+            export_from_chroma(db_path)
+
         return vector_db
 
 
 if __name__ == "__main__":
-    # Ensure your .env file has AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and 
+    # Ensure your .env file has AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and
     # AZURE_OPENAI_CHAT_DEPLOYMENT (or similar) set.
-    
-    rag_service = RagVectorDB()
-    
+    parser = argparse.ArgumentParser(description="Build or update the RAG vector database from PDFs.")
     # Use the absolute path if 'docs' is not a sibling of the script
     # If the docs folder is a sibling of the script, r"docs" is correct.
-    chroma_db = rag_service.create_vector_db(doc_directory=r"docs")
+    parser.add_argument("--docs", default=r"docs", help="folder containing the PDFs")
+    parser.add_argument("--db", default=CHROMA_DB_PATH, help="ChromaDB persist directory")
+    parser.add_argument("--full", action="store_true", help="drop the index and re-ingest every PDF")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count)")
+    parser.add_argument("--export-mmap", action="store_true", default=VECTOR_BACKEND == "mmap",
+                        help="also refresh the memory-mapped read index (default when RAG_VECTOR_BACKEND=mmap)")
+    args = parser.parse_args()
+
+    rag_service = RagVectorDB()
+    chroma_db = rag_service.create_vector_db(doc_directory=args.docs, db_path=args.db, full=args.full,
+                                             workers=args.workers, export_mmap=args.export_mmap)
 
     if chroma_db:
         print("\nRAG DB created successfully. Ready for retrieval.")
     else:
-        print("\nRAG DB creation failed.")
\ No newline at end of file
+        print("\nRAG DB creation failed.")
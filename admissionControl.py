@@ -0,0 +1,200 @@
+"""
+Admission control for /chat streams.
+
+- At most ADMISSION_MAX_STREAMS turns stream from the ADK backends at once.
+  Further turns wait in a bounded queue with two lanes: replies to a tool
+  confirmation (the agent is blocked on the user) are admitted before new
+  prompts. A full lane, or a wait longer than ADMISSION_QUEUE_TIMEOUT, is
+  answered at once with 503 and a Retry-After estimate.
+- New prompts also spend a token from a bucket per user (or per session when
+  the client sends no userId); an empty bucket is answered with 429.
+- Every admitted turn holds a Ticket whose release() is idempotent, so it can
+  be called from both the stream's finally block and a background task.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Optional
+
+import metrics
+from ttlCache import TTLCache
+
+ADMISSION_MAX_STREAMS = int(os.getenv("ADMISSION_MAX_STREAMS", "64"))  # 0 disables the cap
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))  # waiting turns per lane
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "30"))  # 0 disables rate limiting
+USER_BURST = int(os.getenv("USER_BURST", "10"))
+RATE_LIMIT_KEYS_MAX = int(os.getenv("RATE_LIMIT_KEYS_MAX", "100000"))
+
+PRIORITY_CONFIRMATION = 0
+PRIORITY_PROMPT = 1
+
+STREAMS_ADMITTED = metrics.gauge("admission_streams_active", "Chat turns currently holding an admission slot")
+QUEUE_DEPTH = metrics.gauge("admission_queue_depth", "Chat turns waiting for an admission slot")
+QUEUE_WAIT_SECONDS = metrics.histogram("admission_queue_wait_seconds", "Time a chat turn waited for an admission slot")
+REJECTED = metrics.counter("admission_rejected_total", "Chat turns refused by admission control")
+REJECTED_RATE_LIMITED = metrics.counter("admission_rejected_rate_limited_total", "Chat turns refused with 429 (token bucket empty)")
+REJECTED_QUEUE_FULL = metrics.counter("admission_rejected_queue_full_total", "Chat turns refused with 503 (wait queue full)")
+REJECTED_QUEUE_TIMEOUT = metrics.counter("admission_rejected_queue_timeout_total", "Chat turns refused with 503 (waited too long)")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))  # Retry-After takes whole seconds
+        self.reason = reason
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Spends one token. Returns 0 on success, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    """An admission slot. release() may be called any number of times."""
+
+    __slots__ = ("_controller", "released", "queued_seconds", "admitted_at")
+
+    def __init__(self, controller: "AdmissionController", queued_seconds: float = 0.0):
+        self._controller = controller
+        self.released = False
+        self.queued_seconds = queued_seconds
+        self.admitted_at = time.monotonic()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(time.monotonic() - self.admitted_at)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_streams: int = ADMISSION_MAX_STREAMS,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        rate_per_minute: float = USER_RATE_PER_MINUTE,
+        burst: int = USER_BURST,
+    ):
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.rate_per_minute = rate_per_minute
+        self.burst = max(1, burst)
+        self.active = 0
+        self._lanes = (deque(), deque())  # indexed by priority; futures waiting for a slot
+        self._buckets = TTLCache(max_entries=RATE_LIMIT_KEYS_MAX, ttl=max(60.0, 60.0 * self.burst / rate_per_minute) if rate_per_minute > 0 else None)
+        self._hold_seconds = 5.0  # moving average of how long a turn keeps its slot, for Retry-After
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def _reject(self, counter: metrics.Counter, status_code: int, retry_after: float, reason: str) -> AdmissionRejected:
+        REJECTED.inc()
+        counter.inc()
+        return AdmissionRejected(status_code, retry_after, reason)
+
+    def _check_rate(self, key: str):
+        if self.rate_per_minute <= 0:
+            return
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_minute, self.burst)
+            self._buckets.set(key, bucket)
+        wait = bucket.take()
+        if wait:
+            raise self._reject(REJECTED_RATE_LIMITED, 429, wait, "Too many requests, slow down")
+
+    def _retry_after(self) -> float:
+        """Rough time until the queue ahead of a new turn has drained."""
+        return self._hold_seconds * (self.waiting + 1) / max(1, self.max_streams)
+
+    async def acquire(self, key: str, priority: int = PRIORITY_PROMPT) -> Ticket:
+        """
+        Admits one chat turn. `key` identifies the user for rate limiting;
+        confirmation replies are not rate limited. Raises AdmissionRejected.
+        """
+        if priority != PRIORITY_CONFIRMATION:
+            self._check_rate(key)
+        if self.max_streams <= 0 or (self.active < self.max_streams and not self.waiting):
+            self.active += 1
+            STREAMS_ADMITTED.set(self.active)
+            QUEUE_WAIT_SECONDS.observe(0.0)
+            return Ticket(self, 0.0)
+
+        lane: Deque[asyncio.Future] = self._lanes[priority]
+        if len(lane) >= self.queue_size:
+            raise self._reject(REJECTED_QUEUE_FULL, 503, self._retry_after(), "Server busy, queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.append(waiter)
+        QUEUE_DEPTH.set(self.waiting)
+        started = time.monotonic()
+        try:
+            # Not wait_for: it returns the result, dropping the cancellation, when the slot is
+            # handed over in the same iteration the turn is cancelled. wait() leaves the waiter alone.
+            await asyncio.wait((waiter,), timeout=self.queue_timeout)
+            if not waiter.done():
+                raise TimeoutError
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on.
+                self._release()
+            else:
+                waiter.cancel()
+                try:
+                    lane.remove(waiter)
+                except ValueError:
+                    pass
+            QUEUE_DEPTH.set(self.waiting)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject(REJECTED_QUEUE_TIMEOUT, 503, self._retry_after(), "Server busy, try again later") from None
+        waited = time.monotonic() - started
+        QUEUE_WAIT_SECONDS.observe(waited)
+        return Ticket(self, waited)
+
+    def _release(self, held_seconds: Optional[float] = None):
+        if held_seconds is not None:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+        self.active -= 1
+        # Hand the slot to the first live waiter, confirmation lane first.
+        for lane in self._lanes:
+            while lane:
+                waiter = lane.popleft()
+                if not waiter.done():
+                    self.active += 1
+                    waiter.set_result(None)
+                    QUEUE_DEPTH.set(self.waiting)
+                    STREAMS_ADMITTED.set(self.active)
+                    return
+        QUEUE_DEPTH.set(self.waiting)
+        STREAMS_ADMITTED.set(self.active)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_streams": self.max_streams,
+            "waiting_confirmations": len(self._lanes[PRIORITY_CONFIRMATION]),
+            "waiting_prompts": len(self._lanes[PRIORITY_PROMPT]),
+            "rate_limited_keys": len(self._buckets),
+        }
@@ -11,15 +11,22 @@ from google.genai import types
 from google.adk.tools.agent_tool import AgentTool
 import uuid
 import asyncio
+from dotenv import load_dotenv
 
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
-from mcp import StdioServerParameters
+# Loaded once, here, before the sub-agent modules read their configuration.
+load_dotenv()
 
+from .concurrency import BoundedAgentTool, concurrent_tools
 from .mathAgent import math_agent
-from .ragAgent import ragAgent
+from .ragAgent import prefetch_retrieval, ragAgent, warm_up as warm_up_rag
+from .traceCallbacks import AGENT_CALLBACKS, trace_tool_end, trace_tool_start
+from .warmup import schedule_warmup
 # --- Tool Definitions ---
 
+# from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
+# from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+# from mcp import StdioServerParameters
+#
 # mixed_toolset = MCPToolset(
 #     connection_params=StdioConnectionParams(
 #         server_params=StdioServerParameters(
@@ -77,14 +84,10 @@ def send_email(recipient: str, content: str, tool_context: ToolContext) -> dict:
 
 # --- Optional callback before every tool ---
 def before_tool_callback(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext):
-    print("--------------------------------------------------89")
-    print(f"[Callback] Tool '{tool.name}' started with args: {args}")
-    print("--------------------------------------------------91")
+    trace_tool_start(tool, args, tool_context)
     return None
 def after_root_tool_callback(tool: BaseTool, args: Dict[str, Any],tool_response: Dict, tool_context: ToolContext):
-    print("--------------------------------------------------94")
-    print(f"[Callback] : Tool {tool.name} is completed with response : /n {tool_response} ")
-    print("--------------------------------------------------96")
+    trace_tool_end(tool, args, tool_context, tool_response)
     return None
 
 # --- Create the LlmAgent ---
@@ -104,6 +107,7 @@ root_agent = Agent(
             
             # GENERAL INSTRUCTIONS:
             - Prioritize using tools to fulfill the user's request.
+            - When a request needs several independent tools or subagents (e.g. a policy lookup, marketing copy and a calculation), call them together in the same step instead of one after another.
             - If an email requires human approval, do not continue with other tasks until approval is received.
             - Always respond to the user with the final answer derived from the tool results or your knowledge.
             
@@ -112,14 +116,23 @@ root_agent = Agent(
           
            
    ''',
+     # Independent calls from one model turn run concurrently: blocking tools are
+     # offloaded to threads, and each session gets TOOL_CONCURRENCY_PER_SESSION slots.
      tools=[
-        AgentTool(agent=math_agent),
-        AgentTool(agent=ragAgent),
-        send_email,
-        generate_marketing_text
+        BoundedAgentTool(agent=math_agent),
+        BoundedAgentTool(agent=ragAgent),
+        *concurrent_tools([send_email, generate_marketing_text]),
     ],
     model="gemini-2.5-flash",
     before_tool_callback=before_tool_callback,
     after_tool_callback=after_root_tool_callback,
+    **{
+        **AGENT_CALLBACKS,  # agent / model spans for per-turn latency tracing
+        # Starts RAG retrieval for the user's text while the root model decides whether it needs it.
+        "before_agent_callback": [AGENT_CALLBACKS["before_agent_callback"], prefetch_retrieval],
+    },
     generate_content_config=types.GenerateContentConfig(temperature=0.1),
 )
+
+# Pre-load the RAG clients in the background once the server is up (AGENTS_WARMUP=false disables it).
+schedule_warmup({"rag_knowledge_expert": warm_up_rag})
@@ -0,0 +1,108 @@
+"""
+Concurrent execution of agent tools and sub-agents.
+
+When the model asks for several function calls in one turn, ADK runs the async
+ones together, but a plain function tool blocks the event loop and everything
+queues behind it. offload() turns a blocking tool into an async one that runs
+in a thread pool, and BoundedAgentTool wraps a sub-agent; both take a slot
+from a per-session semaphore so one session cannot flood the pool.
+
+AgentTool runs its sub-agent in a session of its own, so tools called inside a
+sub-agent count against that session, not the caller's (no nested deadlock).
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.tool_context import ToolContext
+
+TOOL_CONCURRENCY_PER_SESSION = int(os.getenv("TOOL_CONCURRENCY_PER_SESSION", "4"))
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", "16"))
+
+_POOL = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="agent-tool")
+
+
+class SessionLimiter:
+    """One asyncio.Semaphore per session, dropped once no call of that session is running or waiting."""
+
+    def __init__(self, limit: int = TOOL_CONCURRENCY_PER_SESSION):
+        self.limit = limit
+        self._slots: Dict[str, List] = {}  # session id -> [semaphore, calls holding or waiting]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session_id: str):
+        entry = self._slots.get(session_id)
+        if entry is None:
+            entry = self._slots[session_id] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._slots.pop(session_id, None)
+
+
+LIMITER = SessionLimiter()
+
+
+def _session_id(tool_context) -> str:
+    try:
+        return tool_context.session.id
+    except AttributeError:
+        return getattr(tool_context, "invocation_id", None) or ""
+
+
+def offload(func: Callable) -> Callable:
+    """
+    Wraps a tool so it runs off the event loop (sync functions go to the tool
+    thread pool) and within its session's concurrency limit. The wrapper keeps
+    the tool's name, docstring and parameters, plus a `tool_context` parameter
+    that ADK fills in.
+    """
+    if getattr(func, "_offloaded", False):
+        return func
+    signature = inspect.signature(func)
+    takes_context = "tool_context" in signature.parameters
+    is_async = inspect.iscoroutinefunction(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, tool_context: ToolContext = None, **kwargs):
+        if takes_context:
+            kwargs["tool_context"] = tool_context
+        async with LIMITER.slot(_session_id(tool_context)):
+            if is_async:
+                return await func(*args, **kwargs)
+            call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(_POOL, call)
+
+    if not takes_context:
+        parameters = list(signature.parameters.values())
+        parameters.append(inspect.Parameter("tool_context", inspect.Parameter.KEYWORD_ONLY, annotation=ToolContext))
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        wrapper.__annotations__ = {**func.__annotations__, "tool_context": ToolContext}
+    wrapper._offloaded = True
+    return wrapper
+
+
+def concurrent_tools(tools: List) -> List:
+    """offload() every plain function in a tools list; tool objects are left as they are."""
+    return [offload(tool) if inspect.isfunction(tool) else tool for tool in tools]
+
+
+class BoundedAgentTool(AgentTool):
+    """AgentTool that holds one of the session's slots while the sub-agent runs."""
+
+    async def run_async(self, *, args, tool_context: ToolContext):
+        async with LIMITER.slot(_session_id(tool_context)):
+            return await super().run_async(args=args, tool_context=tool_context)
@@ -1,9 +1,11 @@
 from google.adk.agents import LlmAgent
-from langchain.chat_models import init_chat_model
-from dotenv import load_dotenv
+from typing import Dict, Union
+import ast
+import math
+import operator
 import os
 
-load_dotenv()
+from .traceCallbacks import AGENT_CALLBACKS, TOOL_CALLBACKS
 
 # llm_model = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
 
@@ -22,19 +24,94 @@ def power(base: float, exponent: float) -> float:
     return base ** exponent
 
 
+# --- Whole-expression evaluation (one tool call instead of one per operation) ---
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPRESSION_NODES = 200
+MAX_EXPONENT = 1000
+
+
+def _checked_power(base: float, exponent: float) -> float:
+    if abs(exponent) > MAX_EXPONENT:
+        raise ValueError(f"exponent {exponent:g} is too large (limit {MAX_EXPONENT})")
+    return math.pow(base, exponent)
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _checked_power,
+}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_FUNCTIONS = {
+    "sqrt": math.sqrt, "abs": abs, "round": lambda x, digits=0: round(x, int(digits)), "min": min, "max": max,
+    "floor": math.floor, "ceil": math.ceil, "log": math.log, "log10": math.log10, "exp": math.exp,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+}
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+def _evaluate_node(node: ast.AST) -> float:
+    if isinstance(node, ast.Expression):
+        return _evaluate_node(node.body)
+    # Numbers are evaluated as floats so huge integer intermediates cannot be built.
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return float(node.value)
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return _BINARY_OPERATORS[type(node.op)](_evaluate_node(node.left), _evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate_node(node.operand))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+            and not node.keywords):
+        return float(_FUNCTIONS[node.func.id](*(_evaluate_node(arg) for arg in node.args)))
+    raise ValueError(f"unsupported element '{ast.dump(node)[:40]}'")
+
+
+def evaluate_expression(expression: str) -> Union[float, Dict[str, str]]:
+    """
+    Evaluates a whole arithmetic expression in one step, e.g. "3.5 * 12 + 2^10".
+    Supports + - * / // % ** (or ^), parentheses, pi, e and
+    sqrt, abs, round, min, max, floor, ceil, log, log10, exp, sin, cos, tan.
+    input: expression (string) - the arithmetic expression.
+    """
+    # Users write 2^10 for powers; replaced before parsing so it also gets power precedence.
+    expression = expression.replace("^", "**").replace("×", "*").replace("÷", "/").strip()
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        return {"error": f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters."}
+    try:
+        tree = ast.parse(expression, mode="eval")
+        if sum(1 for _ in ast.walk(tree)) > MAX_EXPRESSION_NODES:
+            return {"error": "Expression is too complex."}
+        result = _evaluate_node(tree)
+        if not math.isfinite(result):
+            return {"error": f"The result of '{expression}' is too large to represent."}
+        return result
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError, OverflowError) as e:
+        return {"error": f"Could not evaluate '{expression}': {e}"}
+
+
 # Create the LlmAgent
 math_agent = LlmAgent(
     name="math_agent",
     instruction=(
         "You are a math expert agent. Your main goal is to solve math queries.\n\n"
         "INSTRUCTIONS:\n"
+        "- Prefer evaluate_expression: write the whole calculation as one arithmetic expression "
+        "and evaluate it in a single call.\n"
         "- Use multiply_numbers to multiply values.\n"
         "- Use add_numbers to add values.\n"
         "- Use power to compute exponentiation.\n"
         "- Use as many tools as needed depending on the user query.\n"
         "- Provide the final answer directly after computing."
     ),
-    tools=[ multiply_numbers,add_numbers,power ],
+    tools=[ evaluate_expression,multiply_numbers,add_numbers,power ],
     model="gemini-2.0-flash",
+    **AGENT_CALLBACKS,
+    **TOOL_CALLBACKS,
 )
 
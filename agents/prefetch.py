@@ -0,0 +1,145 @@
+"""
+Speculative retrieval, started with the root agent's turn.
+
+For a factual question the retriever only runs after two model round trips
+(root_agent -> rag_knowledge_expert -> chroma_db_retriever). A before-agent
+callback on root_agent starts a search for the user's own text on a small
+thread pool as soon as the turn begins, concurrently with the root model
+call, and keeps it per session for PREFETCH_TTL seconds.
+
+The retriever tool asks take() first. When the query the RAG agent wrote
+shares enough words with the prefetched text (PREFETCH_MIN_OVERLAP, overlap
+coefficient of their content words), it gets the prefetched passages,
+waiting for the search if it is still running. An unused prefetch is simply
+replaced by the session's next turn or expires; at most
+PREFETCH_MAX_INFLIGHT searches run at once, further turns skip the prefetch.
+
+The tool runs in a sub-agent session of its own (AgentTool), so the root
+session is found through a contextvar set by the callback: it follows the
+run's task into sub-agents and, via copy_context, into tool threads.
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, FrozenSet, List, Optional
+
+import metrics
+from ttlCache import TTLCache
+
+PREFETCH_ENABLED = os.getenv("RAG_PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_K = int(os.getenv("RAG_PREFETCH_K", "8"))  # covers tool calls with k up to this
+PREFETCH_TTL = float(os.getenv("RAG_PREFETCH_TTL", "60"))
+PREFETCH_MIN_OVERLAP = float(os.getenv("RAG_PREFETCH_MIN_OVERLAP", "0.5"))
+PREFETCH_MIN_WORDS = int(os.getenv("RAG_PREFETCH_MIN_WORDS", "2"))  # shorter messages ("hi", "yes") are not searched
+PREFETCH_MAX_INFLIGHT = int(os.getenv("RAG_PREFETCH_MAX_INFLIGHT", "8"))
+PREFETCH_WAIT = float(os.getenv("RAG_PREFETCH_WAIT", "10"))  # longest a tool call waits for a running prefetch
+PREFETCH_MAX_SESSIONS = int(os.getenv("RAG_PREFETCH_MAX_SESSIONS", "10000"))
+
+PREFETCH_STARTED = metrics.counter("rag_prefetch_started_total", "Speculative retrievals started for a user turn")
+PREFETCH_SKIPPED = metrics.counter("rag_prefetch_skipped_total", "Turns whose prefetch was skipped (too many running)")
+PREFETCH_HITS = metrics.counter("rag_prefetch_hits_total", "Retriever calls answered by the session's prefetch")
+PREFETCH_MISSES = metrics.counter("rag_prefetch_misses_total", "Retriever calls whose query did not match the prefetch")
+PREFETCH_WAIT_SECONDS = metrics.histogram("rag_prefetch_wait_seconds", "Time a retriever call waited for a running prefetch")
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from have how i in is it me my of on or our please "
+    "should tell the to us was we what when where which who why will with would you your".split()
+)
+
+_SESSION: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rag_prefetch_session", default=None)
+
+
+def content_words(text: str) -> FrozenSet[str]:
+    return frozenset(w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS)
+
+
+def overlap(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Overlap coefficient: shared words over the smaller set."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class Prefetch:
+    __slots__ = ("text", "words", "k", "future")
+
+    def __init__(self, text: str, k: int, future: Future):
+        self.text = text
+        self.words = content_words(text)
+        self.k = k
+        self.future = future
+
+
+class RetrievalPrefetcher:
+    def __init__(
+        self,
+        search: Callable[[str, int], List[str]],
+        k: int = PREFETCH_K,
+        ttl: float = PREFETCH_TTL,
+        min_overlap: float = PREFETCH_MIN_OVERLAP,
+        max_inflight: int = PREFETCH_MAX_INFLIGHT,
+        enabled: bool = PREFETCH_ENABLED,
+    ):
+        self.search = search
+        self.k = k
+        self.min_overlap = min_overlap
+        self.max_inflight = max_inflight
+        self.enabled = enabled
+        self._sessions = TTLCache(max_entries=PREFETCH_MAX_SESSIONS, ttl=ttl)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix="rag-prefetch")
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, text: str) -> Optional[Prefetch]:
+        """Starts searching for `text` on behalf of the session's current turn (replacing any earlier prefetch)."""
+        _SESSION.set(session_id)
+        if not self.enabled or len(content_words(text)) < PREFETCH_MIN_WORDS:
+            self._sessions.pop(session_id)
+            return None
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                PREFETCH_SKIPPED.inc()
+                self._sessions.pop(session_id)
+                return None
+            self._inflight += 1
+        PREFETCH_STARTED.inc()
+        future = self._pool.submit(contextvars.copy_context().run, self.search, text, self.k)
+        future.add_done_callback(self._done)
+        prefetch = Prefetch(text, self.k, future)
+        self._sessions.set(session_id, prefetch)
+        return prefetch
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._inflight -= 1
+
+    def take(self, query: str, k: int) -> Optional[List[str]]:
+        """The prefetched passages if `query` matches what the current session's turn prefetched, else None."""
+        session_id = _SESSION.get()
+        prefetch = self._sessions.get(session_id) if session_id is not None else None
+        if prefetch is None:
+            return None
+        if k > prefetch.k or overlap(content_words(query), prefetch.words) < self.min_overlap:
+            PREFETCH_MISSES.inc()
+            return None
+        started = time.monotonic()
+        try:
+            results = prefetch.future.result(timeout=PREFETCH_WAIT)
+        except Exception as e:
+            print(f"RAG prefetch for '{prefetch.text[:40]}' failed: {e!r}")
+            self._sessions.pop(session_id)
+            PREFETCH_MISSES.inc()
+            return None
+        PREFETCH_WAIT_SECONDS.observe(time.monotonic() - started)
+        PREFETCH_HITS.inc()
+        return results[:k]
+
+    def drop(self, session_id: str):
+        self._sessions.pop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -1,41 +1,106 @@
 from google.adk.agents import LlmAgent
-from dotenv import load_dotenv
-from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 import os
-import chromadb # Import for conceptual RAG
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_chroma import Chroma
+import threading
 
-load_dotenv()
+import tracing
+from retrievalCache import RetrievalCache
 
+from .concurrency import offload
+from .prefetch import RetrievalPrefetcher
+from .traceCallbacks import AGENT_CALLBACKS, TOOL_CALLBACKS
 
 
-RAG_EMBEDDING_MODEL = AzureOpenAIEmbeddings(
-        azure_deployment="text-embedding-ada-002",
-        openai_api_version="2024-05-01-preview" 
-    )
-    
-    # 2. Load the persistent vector database (only once)
-PERSISTENT_VECTOR_DB = Chroma(
-        embedding_function=RAG_EMBEDDING_MODEL,
-        persist_directory="./chroma_vector_db"
-    )
+RAG_DB_PATH = "./chroma_vector_db"
+RAG_MULTI_QUERY_MAX = int(os.getenv("RAG_MULTI_QUERY_MAX", "8"))  # queries searched per multi_query_retriever call
+
+_UNAVAILABLE = "ERROR: The RAG knowledge base is unavailable. Cannot perform search."
+_NO_CONTEXT = "No specific context found for this query in the knowledge base."
+
+# Query -> embedding and (query, k, index version) -> results caches, shared by every call in this process.
+RAG_RETRIEVAL_CACHE = RetrievalCache(RAG_DB_PATH)
+
+# The embedding client, vector store and BM25 index are opened on first use (or by
+# warm_up()), so importing the agents needs neither credentials nor the database.
+_HYBRID_RETRIEVER = None
+_RETRIEVER_LOCK = threading.Lock()
+
+
+def _load_vector_db(embedding_function):
+    from annIndex import VECTOR_BACKEND, MMapVectorStore
+
+    # RAG_VECTOR_BACKEND=mmap serves reads from the memory-mapped export instead of Chroma.
+    if VECTOR_BACKEND == "mmap":
+        vector_db = MMapVectorStore.open(RAG_DB_PATH, embedding_function=embedding_function)
+        if vector_db is not None:
+            return vector_db
+
+    from langchain_chroma import Chroma
 
+    return Chroma(embedding_function=embedding_function, persist_directory=RAG_DB_PATH)
 
 
-def chroma_db_retriever(query: str) -> List[str]:
+def get_hybrid_retriever():
+    """BM25 + vector retrieval over the same chunks (BM25 index is written by RagVectorDB), built once."""
+    global _HYBRID_RETRIEVER
+    if _HYBRID_RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _HYBRID_RETRIEVER is None:
+                from bm25Index import BM25Index
+                from embeddingService import get_embedding_service
+                from hybridRetriever import HybridRetriever, load_default_reranker
+
+                embedding_model = RAG_RETRIEVAL_CACHE.wrap_embeddings(get_embedding_service())
+                _HYBRID_RETRIEVER = HybridRetriever(
+                    _load_vector_db(embedding_model),
+                    BM25Index(RAG_DB_PATH),
+                    reranker=load_default_reranker(),
+                    db_path=RAG_DB_PATH,
+                )
+    return _HYBRID_RETRIEVER
+
+
+def warm_up():
+    """Opens the retriever's clients ahead of the first tool call."""
+    get_hybrid_retriever()
+
+
+
+@tracing.traced("rag.retriever")
+def chroma_db_retriever(query: str, k: int = 5) -> List[str]:
     """
     Retrieves the top 'k' most relevant documents from the  knowledge base 
-    based on the user's query.
+    based on the user's query. Matches both meaning and exact terms
+    (IDs, part numbers, acronyms).
+    k: number of passages to return (use more for broad questions).
     """
-    if PERSISTENT_VECTOR_DB is None:
-        return ["ERROR: The RAG knowledge base is unavailable. Cannot perform search."]
-        
+    prefetched = RAG_PREFETCH.take(query, k)
+    tracing.annotate(k=k, prefetch_hit=prefetched is not None)
+    if prefetched is not None:
+        return prefetched
+    return _retrieve(query, k)
+
 
-    # Perform the similarity search on the pre-loaded DB instance
-    results = PERSISTENT_VECTOR_DB.similarity_search(query, k=5)
+def _retrieve(query: str, k: int) -> List[str]:
+    cached = RAG_RETRIEVAL_CACHE.get(query, k)
+    tracing.annotate(cache_hit=cached is not None)
+    if cached is not None:
+        return cached
+    index_version = RAG_RETRIEVAL_CACHE.version
 
+    try:
+        retriever = get_hybrid_retriever()
+    except Exception as e:
+        print(f"RAG knowledge base failed to load: {e!r}")
+        return [_UNAVAILABLE]
+
+    # Hybrid lexical + vector search on the shared DB instance
+    context = _format_results(retriever.search(query, k=k))
+    RAG_RETRIEVAL_CACHE.put(query, k, context, version=index_version)
+    return context
+
+
+def _format_results(results) -> List[str]:
     # Format the results into a clean list of strings for the LLM
     context = []
     for r in results:
@@ -53,11 +118,77 @@ def chroma_db_retriever(query: str) -> List[str]:
         )
     
     if not context:
-        return ["No specific context found for this query in the knowledge base."]
-
+        context = [_NO_CONTEXT]
     return context
 
 
+@tracing.traced("rag.multi_retriever")
+def multi_query_retriever(queries: List[str], k: int = 5) -> Dict[str, List[str]]:
+    """
+    Retrieves the top 'k' passages for each of several queries in one search,
+    e.g. one query per part of a multi-part question. Returns the passages
+    grouped by query. Passages are numbered; a passage that an earlier query
+    already returned is listed again only by its number and source.
+    """
+    queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q][:RAG_MULTI_QUERY_MAX]
+    grouped: Dict[str, List[str]] = {}
+    for query in queries:
+        found = RAG_PREFETCH.take(query, k)
+        grouped[query] = found if found is not None else RAG_RETRIEVAL_CACHE.get(query, k)
+    missing = [query for query, found in grouped.items() if found is None]
+    tracing.annotate(queries=len(queries), k=k, searched=len(missing))
+
+    if missing:
+        index_version = RAG_RETRIEVAL_CACHE.version
+        try:
+            retriever = get_hybrid_retriever()
+        except Exception as e:
+            print(f"RAG knowledge base failed to load: {e!r}")
+            return {query: [_UNAVAILABLE] for query in queries}
+        # One embedding request and one vectorized top-k for all the queries
+        for query, results in zip(missing, retriever.search_many(missing, k=k)):
+            grouped[query] = _format_results(results)
+            RAG_RETRIEVAL_CACHE.put(query, k, grouped[query], version=index_version)
+    return _cite_once(grouped)
+
+
+def _cite_once(grouped: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Numbers the passages across queries; repeats keep their number and citation but not the text."""
+    numbers: Dict[str, int] = {}
+    cited: Dict[str, List[str]] = {}
+    repeated = 0
+    for query, passages in grouped.items():
+        cited[query] = []
+        for passage in passages:
+            if passage == _NO_CONTEXT:
+                cited[query].append(passage)
+            elif passage in numbers:
+                source = passage.partition("): ")[0] + ")"
+                cited[query].append(f"[{numbers[passage]}] {source}: same passage as above")
+                repeated += 1
+            else:
+                numbers[passage] = len(numbers) + 1
+                cited[query].append(f"[{numbers[passage]}] {passage}")
+    tracing.annotate(passages=len(numbers), repeated=repeated)
+    return cited
+
+
+# Per-session speculative search for the user's text, read first by chroma_db_retriever.
+RAG_PREFETCH = RetrievalPrefetcher(tracing.traced("rag.prefetch")(_retrieve))
+
+
+def prefetch_retrieval(callback_context):
+    """root_agent before_agent_callback: starts retrieval for the user's text alongside the first model call."""
+    content = callback_context.user_content
+    text = " ".join(p.text for p in (content.parts or []) if p.text) if content is not None else ""
+    try:
+        session_id = callback_context.session.id
+    except AttributeError:
+        session_id = callback_context.invocation_id
+    RAG_PREFETCH.start(session_id, text)
+    return None
+
+
 # --- 3. Create the Pure RAG LlmAgent ---
 ragAgent = LlmAgent(
     name="rag_knowledge_expert",
@@ -67,6 +198,8 @@ ragAgent = LlmAgent(
         "INSTRUCTIONS:\n"
         "- **ALWAYS** use the **chroma_db_retriever** tool to find context before answering "
         "any factual question, even if you think you know the answer.\n"
+        "- When a question has several distinct parts, call **multi_query_retriever** once with one "
+        "query per part instead of calling chroma_db_retriever repeatedly.\n"
         "- When providing the final answer, structure it clearly and **cite the exact Source Document (File Name and Page)** "
         "from the retrieved context for every piece of information used.\n"
         "- **MANDATORY FORMATTING:** For the first piece of factual information cited in your final response, "
@@ -74,7 +207,10 @@ ragAgent = LlmAgent(
         "- Only generate your final response after synthesizing the context retrieved by the tool."
     ),
     tools=[
-        chroma_db_retriever, 
+        offload(chroma_db_retriever),  # retrieval blocks on I/O; keep it off the event loop
+        offload(multi_query_retriever),
     ],
     model="gemini-2.5-flash", 
+    **AGENT_CALLBACKS,
+    **TOOL_CALLBACKS,
 )
\ No newline at end of file
@@ -1,19 +1,18 @@
 from google.adk.agents import LlmAgent
-from langchain.chat_models import init_chat_model
-from dotenv import load_dotenv
+from typing import Dict, List
 import os
 
-load_dotenv()
-
 # llm_model = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
 
+PRODUCT_PRICES = {"pizza": 15.00, "soda": 2.50, "fries": 5.00}
+
+
 def get_product_price(product_name: str) -> float:
     """
     Retrieves the price of a product from an inventory.
     input: product_name (string) - The name of the product.
     """
-    prices = {"pizza": 15.00, "soda": 2.50, "fries": 5.00}
-    return prices.get(product_name.lower(), 0.00)
+    return PRODUCT_PRICES.get(product_name.lower(), 0.00)
 
 
 def calculate_total_cost(price: float, quantity: int, tax_rate: float = 0.10) -> float:
@@ -28,6 +27,39 @@ def calculate_total_cost(price: float, quantity: int, tax_rate: float = 0.10) ->
     return subtotal + tax_amount
 
 
+# --- Batch variants: one call for any number of items ---
+def get_product_prices(product_names: List[str]) -> Dict[str, float]:
+    """
+    Retrieves the prices of several products in one call.
+    input: product_names (list of strings) - The names of the products.
+    Unknown products have a price of 0.0.
+    """
+    return {name: get_product_price(name) for name in product_names}
+
+
+def quote_order(product_names: List[str], quantities: List[int], tax_rate: float = 0.10) -> Dict:
+    """
+    Prices a whole order in one call: looks up every product and computes the
+    per-item and grand totals, including tax.
+    input: product_names (list of strings) - The products ordered.
+           quantities (list of ints) - How many of each product, in the same order.
+           tax_rate (float) - The tax rate (e.g., 0.10 for 10%).
+    """
+    if len(product_names) != len(quantities):
+        return {"error": "product_names and quantities must have the same length."}
+    items = []
+    for name, quantity in zip(product_names, quantities):
+        price = get_product_price(name)
+        items.append({
+            "product": name,
+            "unit_price": price,
+            "quantity": quantity,
+            "total": round(calculate_total_cost(price, quantity, tax_rate), 2),
+            "known_product": name.lower() in PRODUCT_PRICES,
+        })
+    return {"items": items, "grand_total": round(sum(item["total"] for item in items), 2), "tax_rate": tax_rate}
+
+
 # Create the LlmAgent
 research_agent = LlmAgent(
     name="research_agent",
@@ -35,11 +67,13 @@ research_agent = LlmAgent(
        "You are an expert at handling prices and costs. Your main goal is to answer the user's question.\n\n"
         "use the available tool(s) to answer the question"
         "INSTRUCTIONS:\n"
-        "- Use the get_product_price tool to get the price of an item first."
-        "- Use the calculate_total_cost tool to compute the final cost, including a 10% tax."
+        "- For the cost of an order (one or many items), call quote_order once with every product and quantity; "
+        "it returns each item's total and the grand total including the 10% tax.\n"
+        "- For prices only, call get_product_prices once with all the product names.\n"
+        "- Use get_product_price and calculate_total_cost only for a single item.\n"
         "- Give the final answer directly without any further modifications."
     ),
-    tools=[get_product_price,calculate_total_cost],
+    tools=[quote_order,get_product_prices,get_product_price,calculate_total_cost],
     model="gemini-2.0-flash",
 )
 
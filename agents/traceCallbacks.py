@@ -0,0 +1,116 @@
+"""
+ADK callbacks that record agent, model and tool spans (see tracing.py).
+
+The proxy puts its traceparent in the run's state (tracing.TRACE_STATE_KEY),
+so the first agent of a run joins the proxy's trace. While an agent or tool
+runs, its span is the current one, so sub-agents (AgentTool runs them in the
+same task), retrieval and embedding spans nest under it.
+
+Open spans are kept by invocation and agent / function call id until the
+matching after-callback ends them.
+"""
+from typing import Any, Dict, Optional
+
+import tracing
+from ttlCache import TTLCache
+
+# (kind, invocation id, agent name or function call id) -> (span, parent to restore)
+_OPEN = TTLCache(max_entries=10000, ttl=3600)
+
+
+def _start(key, name: str, parent, **attributes):
+    if parent is None:
+        parent = tracing.current()
+    span = tracing.start_span(name, parent=parent, **attributes)
+    _OPEN.set(key, (span, tracing.current()))
+    tracing.activate(span)
+    return span
+
+
+def _end(key, error: Optional[str] = None):
+    entry = _OPEN.pop(key)
+    if entry is None:
+        return None
+    span, previous = entry
+    if error:
+        span.error = error
+    span.end()
+    tracing.activate(previous)
+    return span
+
+
+def _run_parent(callback_context) -> Optional[tracing.SpanContext]:
+    """The span this run belongs to: the current one, or the proxy's from the run state."""
+    parent = tracing.current()
+    if parent is not None:
+        return parent
+    try:
+        return tracing.parse_traceparent(callback_context.state.get(tracing.TRACE_STATE_KEY))
+    except AttributeError:
+        return None
+
+
+def trace_agent_start(callback_context):
+    key = ("agent", callback_context.invocation_id, callback_context.agent_name)
+    _start(key, f"agent.{callback_context.agent_name}", _run_parent(callback_context),
+           invocation_id=callback_context.invocation_id)
+    return None
+
+
+def trace_agent_end(callback_context):
+    _end(("agent", callback_context.invocation_id, callback_context.agent_name))
+    return None
+
+
+def trace_model_start(callback_context, llm_request):
+    key = ("model", callback_context.invocation_id, callback_context.agent_name)
+    model = getattr(llm_request, "model", None)
+    span = tracing.start_span(f"model.{callback_context.agent_name}", parent=_run_parent(callback_context), model=model)
+    _OPEN.set(key, (span, None))
+    return None
+
+
+def trace_model_end(callback_context, llm_response):
+    """Streaming runs call this for every partial response; the last one ends the span."""
+    key = ("model", callback_context.invocation_id, callback_context.agent_name)
+    entry = _OPEN.get(key)
+    if entry is None:
+        return None
+    span = entry[0]
+    if getattr(llm_response, "partial", False):
+        if not span.events:
+            span.event("first_chunk")
+        return None
+    _OPEN.pop(key)
+    usage = getattr(llm_response, "usage_metadata", None)
+    if usage is not None:
+        span.set(prompt_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
+    error = getattr(llm_response, "error_code", None)
+    if error:
+        span.error = str(error)
+    span.end()
+    return None
+
+
+def trace_tool_start(tool, args: Dict[str, Any], tool_context):
+    key = ("tool", tool_context.invocation_id, tool_context.function_call_id)
+    _start(key, f"tool.{tool.name}", None, agent=tool_context.agent_name)
+    return None
+
+
+def trace_tool_end(tool, args: Dict[str, Any], tool_context, tool_response):
+    error = tool_response.get("error") if isinstance(tool_response, dict) else None
+    _end(("tool", tool_context.invocation_id, tool_context.function_call_id), error=error)
+    return None
+
+
+AGENT_CALLBACKS = {
+    "before_agent_callback": trace_agent_start,
+    "after_agent_callback": trace_agent_end,
+    "before_model_callback": trace_model_start,
+    "after_model_callback": trace_model_end,
+}
+TOOL_CALLBACKS = {
+    "before_tool_callback": trace_tool_start,
+    "after_tool_callback": trace_tool_end,
+}
@@ -0,0 +1,51 @@
+"""
+Background warm-up for the agents' heavy clients.
+
+The embedding client, vector store and indexes are created on first tool use.
+schedule_warmup() pre-loads them on a daemon thread a moment after the agents
+are imported (i.e. once the ADK server has loaded the app), so the first real
+request does not pay for it and startup itself is not slowed down.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+AGENTS_WARMUP = os.getenv("AGENTS_WARMUP", "true").lower() == "true"
+AGENTS_WARMUP_DELAY = float(os.getenv("AGENTS_WARMUP_DELAY", "2"))  # seconds after import before loading
+
+_started = False
+_lock = threading.Lock()
+
+
+def run_warmups(warmers: Dict[str, Callable[[], None]]):
+    """Runs each warmer in turn; a failure is logged and left for the first real call to retry."""
+    for name, warm in warmers.items():
+        started = time.perf_counter()
+        try:
+            warm()
+        except Exception as e:
+            print(f"Warm-up of '{name}' failed (will retry on first use): {e!r}")
+            continue
+        print(f"Warm-up of '{name}' done in {time.perf_counter() - started:.2f}s")
+
+
+def schedule_warmup(
+    warmers: Dict[str, Callable[[], None]], delay: float = AGENTS_WARMUP_DELAY
+) -> Optional[threading.Thread]:
+    """Starts the warm-up thread once per process. Returns None when disabled or already started."""
+    global _started
+    if not AGENTS_WARMUP:
+        return None
+    with _lock:
+        if _started:
+            return None
+        _started = True
+
+    def run():
+        time.sleep(delay)
+        run_warmups(warmers)
+
+    thread = threading.Thread(target=run, name="agents-warmup", daemon=True)
+    thread.start()
+    return thread
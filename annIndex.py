@@ -0,0 +1,496 @@
+"""
+Read-only, memory-mapped vector index exported from the Chroma RAG store.
+
+`export_from_chroma` writes the persisted collection into <db>/mmap_index/ as
+plain .npy/.bin files: a normalized float32 (or int8 + per-row scale) matrix
+whose rows are grouped by IVF list, the IVF centroids, and one column per
+metadata key. `MMapVectorStore` opens those files with mmap, so every worker
+process shares one copy of the index through the page cache, and answers
+top-k queries with vectorized NumPy scoring behind the same
+`similarity_search` interface as the LangChain Chroma store.
+
+Select it with RAG_VECTOR_BACKEND=mmap; re-export after each ingest
+(RAG_creation.py --export-mmap does it automatically).
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from indexVersion import read_index_version
+
+try:
+    from langchain_core.documents import Document
+except ImportError:  # offline benchmarks
+    class Document:
+        def __init__(self, page_content: str, metadata: Optional[Dict] = None, id: Optional[str] = None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+            self.id = id
+
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")  # chroma | mmap
+ANN_DTYPE = os.getenv("RAG_ANN_DTYPE", "float32")  # float32 | int8
+ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))  # IVF lists scanned per query
+ANN_MIN_IVF_ROWS = int(os.getenv("RAG_ANN_MIN_IVF_ROWS", "20000"))  # smaller indexes are scanned exhaustively
+ANN_RELOAD_INTERVAL = 1.0  # seconds between checks for a newer export
+
+ANN_DIR = "mmap_index"
+CURRENT_FILE = "CURRENT"
+CHROMA_COLLECTION = "langchain"  # LangChain's default collection name
+KEEP_EXPORTS = 2  # the current export and the one before it (other processes may still have it mapped)
+
+_BLOCK_ROWS = 65536
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 64
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _default_nlist(count: int) -> int:
+    return int(np.sqrt(count)) if count >= ANN_MIN_IVF_ROWS else 0
+
+
+# --- Writing ---
+def _train_ivf(vectors, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the rows."""
+    rng = np.random.default_rng(seed)
+    count = vectors.shape[0]
+    sample = np.sort(rng.choice(count, size=min(count, nlist * _KMEANS_SAMPLE_PER_LIST), replace=False))
+    x = _normalize(np.asarray(vectors[sample], dtype=np.float32))
+    centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = np.bincount(assign, minlength=nlist) > 0
+        centroids[filled] = _normalize(sums[filled])
+    return centroids
+
+
+def _assign(vectors, centroids: np.ndarray) -> np.ndarray:
+    assign = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], _BLOCK_ROWS // 8):
+        block = _normalize(np.asarray(vectors[start:start + _BLOCK_ROWS // 8], dtype=np.float32))
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _write_strings(prefix: str, values):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    with open(prefix + ".bin", "wb") as f:
+        position = 0
+        for i, value in enumerate(values):
+            data = (value or "").encode("utf-8")
+            f.write(data)
+            position += len(data)
+            offsets[i + 1] = position
+    np.save(prefix + ".offsets.npy", offsets)
+
+
+def _write_metadata(directory: str, metadatas) -> List[str]:
+    """One int32 code column per metadata key (-1 when absent) plus the list of distinct values."""
+    keys = sorted({key for metadata in metadatas for key in (metadata or {})})
+    for i, key in enumerate(keys):
+        codes = np.full(len(metadatas), -1, dtype=np.int32)
+        values, lookup = [], {}
+        for row, metadata in enumerate(metadatas):
+            if not metadata or key not in metadata:
+                continue
+            value = metadata[key]
+            code = lookup.get((type(value).__name__, value))
+            if code is None:
+                code = lookup[(type(value).__name__, value)] = len(values)
+                values.append(value)
+            codes[row] = code
+        np.save(os.path.join(directory, f"meta_{i}.codes.npy"), codes)
+        with open(os.path.join(directory, f"meta_{i}.values.json"), "w", encoding="utf-8") as f:
+            json.dump(values, f)
+    return keys
+
+
+def build_index(
+    db_path: str,
+    ids: Sequence[str],
+    vectors,
+    texts: Sequence[str],
+    metadatas: Sequence[Dict],
+    dtype: str = ANN_DTYPE,
+    nlist: Optional[int] = None,
+    index_version: Optional[str] = None,
+) -> str:
+    """
+    Writes a new export under <db_path>/mmap_index/ and makes it current.
+    vectors: (n, dim) array-like; a np.memmap works and is read block by block.
+    Returns the export directory.
+    """
+    if dtype not in ("float32", "int8"):
+        raise ValueError(f"Unsupported dtype '{dtype}' (expected float32 or int8)")
+    count, dim = vectors.shape
+    nlist = _default_nlist(count) if nlist is None else min(nlist, count)
+
+    root = os.path.join(db_path, ANN_DIR)
+    name = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(root, name + ".tmp")
+    os.makedirs(tmp_dir)
+
+    if nlist:
+        centroids = _train_ivf(vectors, nlist)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+        np.save(os.path.join(tmp_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp_dir, "list_offsets.npy"), offsets)
+    else:
+        order = np.arange(count)
+
+    # Rows are stored in IVF-list order so each list is one contiguous slice of the file.
+    matrix = np.lib.format.open_memmap(os.path.join(tmp_dir, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, dim))
+    scales = None
+    if dtype == "int8":
+        scales = np.lib.format.open_memmap(os.path.join(tmp_dir, "scales.npy"), mode="w+", dtype=np.float32, shape=(count,))
+    for start in range(0, count, _BLOCK_ROWS):
+        rows = order[start:start + _BLOCK_ROWS]
+        block = _normalize(np.asarray(vectors[rows], dtype=np.float32))
+        if scales is None:
+            matrix[start:start + len(rows)] = block
+        else:
+            scale = np.abs(block).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            matrix[start:start + len(rows)] = np.round(block / scale[:, None]).astype(np.int8)
+            scales[start:start + len(rows)] = scale
+    matrix.flush()
+    del matrix
+    if scales is not None:
+        scales.flush()
+        del scales
+
+    _write_strings(os.path.join(tmp_dir, "ids"), [ids[i] for i in order])
+    _write_strings(os.path.join(tmp_dir, "texts"), [texts[i] for i in order])
+    keys = _write_metadata(tmp_dir, [metadatas[i] for i in order])
+
+    manifest = {
+        "count": int(count),
+        "dim": int(dim),
+        "dtype": dtype,
+        "nlist": int(nlist),
+        "metadata_keys": keys,
+        "index_version": read_index_version(db_path) if index_version is None else index_version,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    final_dir = os.path.join(root, name)
+    os.rename(tmp_dir, final_dir)
+    current = os.path.join(root, CURRENT_FILE)
+    with open(current + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(current + ".tmp", current)
+    _remove_old_exports(root, keep=name)
+    return final_dir
+
+
+def exported_index_version(db_path: str) -> str:
+    """Index version the current export was built from, or "" if there is none."""
+    root = os.path.join(db_path, ANN_DIR)
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        with open(os.path.join(root, name, "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["index_version"]
+    except (OSError, ValueError, KeyError):
+        return ""
+
+
+def _remove_old_exports(root: str, keep: str):
+    exports = sorted(
+        entry for entry in os.listdir(root)
+        if entry != keep and not entry.endswith(".tmp") and os.path.isdir(os.path.join(root, entry))
+    )
+    for entry in exports[:max(0, len(exports) - (KEEP_EXPORTS - 1))]:
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def export_from_chroma(
+    db_path: str,
+    dtype: str = ANN_DTYPE,
+    nlist: Optional[int] = None,
+    collection_name: str = CHROMA_COLLECTION,
+    batch_size: int = 5000,
+) -> Optional[str]:
+    """Copies the persisted Chroma collection into a new mmap export. Returns its directory."""
+    import chromadb
+
+    index_version = read_index_version(db_path)
+    collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    count = collection.count()
+    if not count:
+        print(f"Collection '{collection_name}' in {db_path} is empty; nothing to export.")
+        return None
+
+    started = time.perf_counter()
+    os.makedirs(os.path.join(db_path, ANN_DIR), exist_ok=True)
+    raw_path = os.path.join(db_path, ANN_DIR, f"raw-{uuid.uuid4().hex[:8]}.npy")
+    raw = None
+    ids, texts, metadatas = [], [], []
+    try:
+        for offset in range(0, count, batch_size):
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+            if raw is None:
+                # Staged on disk so exporting a large collection does not need it all in RAM.
+                raw = np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.float32, shape=(count, embeddings.shape[1]))
+            raw[len(ids):len(ids) + len(embeddings)] = embeddings
+            ids.extend(batch["ids"])
+            texts.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+        raw.flush()
+        export_dir = build_index(db_path, ids, raw[:len(ids)], texts, metadatas, dtype=dtype, nlist=nlist,
+                                 index_version=index_version)
+    finally:
+        del raw
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    print(f"Exported {len(ids)} chunks to {export_dir} ({dtype}) in {time.perf_counter() - started:.1f}s.")
+    return export_dir
+
+
+# --- Reading ---
+class _StringColumn:
+    def __init__(self, prefix: str):
+        self.offsets = np.load(prefix + ".offsets.npy", mmap_mode="r")
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        self.data = np.memmap(prefix + ".bin", dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[int(self.offsets[row]):int(self.offsets[row + 1])].tobytes().decode("utf-8")
+
+
+class _MetadataColumn:
+    def __init__(self, directory: str, i: int):
+        self.codes = np.load(os.path.join(directory, f"meta_{i}.codes.npy"), mmap_mode="r")
+        with open(os.path.join(directory, f"meta_{i}.values.json"), "r", encoding="utf-8") as f:
+            self.values = json.load(f)
+        self._lookup = {(type(v).__name__, v): code for code, v in enumerate(self.values)}
+
+    def code(self, value) -> int:
+        return self._lookup.get((type(value).__name__, value), -2)  # -2 never matches a row
+
+
+class _ExportFiles:
+    """Everything mapped for one export; swapped as a unit when a newer export appears."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.count = self.manifest["count"]
+        self.nlist = self.manifest["nlist"]
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.scales = None
+        if self.manifest["dtype"] == "int8":
+            self.scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode="r")
+        if self.nlist:
+            self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(directory, "list_offsets.npy"))
+        self.ids = _StringColumn(os.path.join(directory, "ids"))
+        self.texts = _StringColumn(os.path.join(directory, "texts"))
+        self.metadata = {key: _MetadataColumn(directory, i) for i, key in enumerate(self.manifest["metadata_keys"])}
+
+    def score(self, start: int, end: int, queries: np.ndarray) -> np.ndarray:
+        """Scores of rows [start, end) against a (dim, m) query matrix, shape (end - start, m)."""
+        if self.scales is None:
+            return self.vectors[start:end] @ queries
+        return (self.vectors[start:end].astype(np.float32) @ queries) * self.scales[start:end, None]
+
+    def row_metadata(self, row: int) -> Dict:
+        metadata = {}
+        for key, column in self.metadata.items():
+            code = column.codes[row]
+            if code >= 0:
+                metadata[key] = column.values[code]
+        return metadata
+
+    def where_mask(self, where: Dict, start: int, end: int) -> np.ndarray:
+        """Chroma-style filter ({key: value}, $eq/$ne/$in/$nin, $and/$or) evaluated on rows [start, end)."""
+        mask = np.ones(end - start, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self.where_mask(sub, start, end)
+                continue
+            if key == "$or":
+                any_mask = np.zeros(end - start, dtype=bool)
+                for sub in condition:
+                    any_mask |= self.where_mask(sub, start, end)
+                mask &= any_mask
+                continue
+
+            operator, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            column = self.metadata.get(key)
+            codes = column.codes[start:end] if column else np.full(end - start, -1, dtype=np.int32)
+            if operator in ("$eq", "$ne"):
+                matches = codes == (column.code(value) if column else -2)
+            elif operator in ("$in", "$nin"):
+                matches = np.isin(codes, [column.code(v) for v in value] if column else [])
+            else:
+                raise ValueError(f"Unsupported filter operator '{operator}' for the mmap vector backend")
+            mask &= ~matches if operator in ("$ne", "$nin") else matches
+        return mask
+
+
+class MMapVectorStore:
+    def __init__(self, db_path: str, embedding_function=None, nprobe: int = ANN_NPROBE):
+        self.db_path = db_path
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self._root = os.path.join(db_path, ANN_DIR)
+        self._current = self._read_current()
+        if not self._current:
+            raise FileNotFoundError(f"No mmap export under {self._root}; run `python annIndex.py --db {db_path}`")
+        self._files = _ExportFiles(os.path.join(self._root, self._current))
+        self._checked_at = time.monotonic()
+        if self._files.manifest["index_version"] != read_index_version(db_path):
+            print(f"Warning: the mmap export in {self._root} is older than the Chroma index; re-export it.")
+
+    @classmethod
+    def open(cls, db_path: str, embedding_function=None, nprobe: int = ANN_NPROBE) -> Optional["MMapVectorStore"]:
+        """Returns None (after logging why) when no export exists, so callers can fall back to Chroma."""
+        try:
+            return cls(db_path, embedding_function=embedding_function, nprobe=nprobe)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"mmap vector backend unavailable: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return self._files.count
+
+    def _read_current(self) -> str:
+        try:
+            with open(os.path.join(self._root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def _maybe_reload(self) -> _ExportFiles:
+        now = time.monotonic()
+        if now - self._checked_at >= ANN_RELOAD_INTERVAL:
+            self._checked_at = now
+            current = self._read_current()
+            if current and current != self._current:
+                self._files = _ExportFiles(os.path.join(self._root, current))
+                self._current = current
+        return self._files
+
+    def search_by_vector(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict] = None, nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k (row, cosine similarity), best first."""
+        return self._search(self._maybe_reload(), [embedding], k, filter, nprobe)[0]
+
+    def search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], k: int = 4, filter: Optional[Dict] = None, nprobe: Optional[int] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """search_by_vector for several queries at once: one top-k list per embedding, in order."""
+        return self._search(self._maybe_reload(), embeddings, k, filter, nprobe)
+
+    def _search(self, files: _ExportFiles, embeddings, k: int, filter: Optional[Dict], nprobe: Optional[int]):
+        """
+        Scores all queries as one matrix: each block of rows is read and scored
+        once against every query that probes it, and the top-k is taken per
+        column (the filter mask is also computed once per block).
+        """
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        if not len(queries):
+            return []
+        if files.nlist:
+            probe = min(nprobe or self.nprobe, files.nlist)
+            probed = np.argpartition(-(queries @ files.centroids.T), probe - 1, axis=1)[:, :probe]
+            ranges = [
+                (int(files.list_offsets[c]), int(files.list_offsets[c + 1]), np.flatnonzero((probed == c).any(axis=1)))
+                for c in np.unique(probed)
+            ]
+        else:
+            ranges = [(0, files.count, np.arange(len(queries)))]
+
+        rows_parts = [[] for _ in range(len(queries))]
+        score_parts = [[] for _ in range(len(queries))]
+        for range_start, range_end, members in ranges:
+            for start in range(range_start, range_end, _BLOCK_ROWS):
+                end = min(range_end, start + _BLOCK_ROWS)
+                scores = files.score(start, end, queries[members].T)
+                rows = np.arange(start, end)
+                if filter:
+                    mask = files.where_mask(filter, start, end)
+                    scores, rows = scores[mask], rows[mask]
+                if len(rows) > k:
+                    top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                    rows, scores = rows[top], np.take_along_axis(scores, top, axis=0)
+                else:
+                    rows = np.broadcast_to(rows[:, None], scores.shape)
+                for column, query in enumerate(members):
+                    rows_parts[query].append(rows[:, column])
+                    score_parts[query].append(scores[:, column])
+
+        results = []
+        for row_list, score_list in zip(rows_parts, score_parts):
+            if not row_list:
+                results.append([])
+                continue
+            rows, scores = np.concatenate(row_list), np.concatenate(score_list)
+            best = np.argsort(-scores, kind="stable")[:k]
+            results.append([(int(rows[i]), float(scores[i])) for i in best])
+        return results
+
+    def _document(self, files: _ExportFiles, row: int) -> Document:
+        return Document(page_content=files.texts[row], metadata=files.row_metadata(row), id=files.ids[row])
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict] = None
+    ) -> List[Tuple[Document, float]]:
+        files = self._maybe_reload()
+        hits = self._search(files, [embedding], k, filter, None)[0]
+        return [(self._document(files, row), score) for row, score in hits]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], k: int = 4, filter: Optional[Dict] = None
+    ) -> List[List[Document]]:
+        """One result list per embedding; a row hit by several queries is decoded once and shared."""
+        files = self._maybe_reload()
+        documents: Dict[int, Document] = {}
+        results = []
+        for hits in self._search(files, embeddings, k, filter, None):
+            for row, _ in hits:
+                if row not in documents:
+                    documents[row] = self._document(files, row)
+            results.append([documents[row] for row, _ in hits])
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma RAG collection to a memory-mapped index.")
+    parser.add_argument("--db", default="./chroma_vector_db", help="ChromaDB persist directory")
+    parser.add_argument("--dtype", default=ANN_DTYPE, choices=["float32", "int8"])
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: sqrt(n), 0 = exhaustive scan)")
+    args = parser.parse_args()
+    export_from_chroma(args.db, dtype=args.dtype, nlist=args.nlist)
@@ -0,0 +1,257 @@
+"""
+Pool of ADK backend processes behind the proxy.
+
+- A session's state lives in one ADK process, so every session is pinned to a
+  backend. The candidates come from a consistent-hash ring on the session id;
+  a new session goes to the least busy (fewest open streams) of its first
+  BACKEND_CHOICES candidates, and the choice is remembered. A proxy worker that
+  has not seen the session asks those candidates which one holds it.
+- Backends are health-checked in the background and on connection errors. The
+  sessions of a backend that goes away fail over to the next candidate (the
+  session is re-created there). A draining backend takes no new sessions but
+  keeps serving the ones it has.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+import metrics
+from ttlCache import TTLCache
+
+ADK_BACKENDS = [u.strip().rstrip("/") for u in os.getenv("ADK_BACKENDS", "http://localhost:8000").split(",") if u.strip()]
+ADK_APP_NAME = os.getenv("ADK_APP_NAME", "agents")
+BACKEND_VNODES = int(os.getenv("BACKEND_VNODES", "64"))  # ring points per backend
+BACKEND_CHOICES = int(os.getenv("BACKEND_CHOICES", "2"))  # ring candidates compared for a new session
+BACKEND_HEALTH_PATH = os.getenv("BACKEND_HEALTH_PATH", "/list-apps")
+BACKEND_HEALTH_INTERVAL = float(os.getenv("BACKEND_HEALTH_INTERVAL", "5"))
+BACKEND_HEALTH_TIMEOUT = float(os.getenv("BACKEND_HEALTH_TIMEOUT", "2"))
+BACKEND_FAILURE_THRESHOLD = int(os.getenv("BACKEND_FAILURE_THRESHOLD", "2"))  # consecutive failures before a backend is out
+SESSION_AFFINITY_MAX = int(os.getenv("SESSION_AFFINITY_MAX", "100000"))
+SESSION_AFFINITY_TTL = float(os.getenv("SESSION_AFFINITY_TTL", str(24 * 3600)))
+
+BACKENDS_HEALTHY = metrics.gauge("proxy_backends_healthy", "ADK backends currently passing health checks")
+BACKEND_ERRORS = metrics.counter("proxy_backend_errors_total", "Failed health checks and upstream connection errors")
+BACKEND_FAILOVERS = metrics.counter("proxy_backend_failovers_total", "Sessions moved off an unavailable backend")
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class Backend:
+    __slots__ = ("url", "healthy", "draining", "outstanding", "failures")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True  # until a check says otherwise
+        self.draining = False
+        self.outstanding = 0  # open /run_sse streams
+        self.failures = 0
+
+    @property
+    def accepts_new_sessions(self) -> bool:
+        return self.healthy and not self.draining
+
+    def to_dict(self) -> Dict:
+        return {"url": self.url, "healthy": self.healthy, "draining": self.draining, "outstanding": self.outstanding}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class BackendPool:
+    def __init__(
+        self,
+        urls: List[str] = ADK_BACKENDS,
+        client: Optional[httpx.AsyncClient] = None,
+        app_name: str = ADK_APP_NAME,
+        vnodes: int = BACKEND_VNODES,
+        choices: int = BACKEND_CHOICES,
+    ):
+        if not urls:
+            raise ValueError("At least one ADK backend URL is required")
+        self.client = client
+        self.app_name = app_name
+        self.choices = max(1, choices)
+        self.backends: Dict[str, Backend] = {url: Backend(url) for url in urls}
+        ring = sorted((_hash(f"{url}#{i}"), url) for url in self.backends for i in range(vnodes))
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_urls = [url for _, url in ring]
+        self._affinity = TTLCache(max_entries=SESSION_AFFINITY_MAX, ttl=SESSION_AFFINITY_TTL)
+        self._health_task: Optional[asyncio.Task] = None
+
+    # --- Routing ---
+    def _candidates(self, session_id: str) -> Iterator[Backend]:
+        """Distinct backends in ring order, starting at the session's hash."""
+        start = bisect.bisect(self._ring_hashes, _hash(session_id))
+        seen = set()
+        for i in range(len(self._ring_urls)):
+            url = self._ring_urls[(start + i) % len(self._ring_urls)]
+            if url not in seen:
+                seen.add(url)
+                yield self.backends[url]
+                if len(seen) == len(self.backends):
+                    return
+
+    def place(self, session_id: str) -> Backend:
+        """Backend for a new session: the least busy of its first `choices` ring candidates."""
+        candidates = [b for b in self._candidates(session_id) if b.accepts_new_sessions][:self.choices]
+        if not candidates:
+            # Everything is draining: still better than refusing the session.
+            candidates = [b for b in self._candidates(session_id) if b.healthy][:1]
+        if not candidates:
+            raise NoBackendAvailable("No healthy ADK backend")
+        return min(candidates, key=lambda b: b.outstanding)  # ties keep ring order
+
+    async def route(self, session_id: str, user_id: str) -> Tuple[Backend, bool]:
+        """
+        Backend that holds the session. Returns (backend, created): created is
+        True when the session had to be created there (unknown session, or
+        failover from a backend that went away).
+        """
+        url = self._affinity.get(session_id)
+        if url is not None:
+            backend = self.backends.get(url)
+            if backend is not None and backend.healthy:
+                return backend, False
+            BACKEND_FAILOVERS.inc()
+            print(f"Session '{session_id}' fails over from {url}.")
+        else:
+            backend = await self._find_session(session_id, user_id)
+            if backend is not None:
+                self._affinity.set(session_id, backend.url)
+                return backend, False
+
+        backend = self.place(session_id)
+        await self.create_session(backend, session_id, user_id)
+        return backend, True
+
+    async def _find_session(self, session_id: str, user_id: str) -> Optional[Backend]:
+        """Asks the backends `place` could have picked whether they hold the session."""
+        candidates = [b for b in self._candidates(session_id) if b.healthy][:self.choices + 1]
+        for backend in candidates:
+            try:
+                resp = await self.client.get(self._session_url(backend, user_id, session_id))
+            except httpx.HTTPError:
+                self.report_failure(backend)
+                continue
+            if resp.status_code == 200:
+                return backend
+        return None
+
+    def _session_url(self, backend: Backend, user_id: str, session_id: str) -> str:
+        return f"{backend.url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}"
+
+    async def create_session(self, backend: Backend, session_id: str, user_id: str):
+        """Creates the session on the backend and pins it there. Raises httpx errors."""
+        payload = {"app_name": self.app_name, "user_id": user_id, "session_id": session_id}
+        try:
+            resp = await self.client.post(self._session_url(backend, user_id, session_id), json=payload)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            self.report_failure(backend)
+            raise
+        if resp.status_code != 409:  # already exists there
+            resp.raise_for_status()
+        self._affinity.set(session_id, backend.url)
+
+    async def restore_session(self, backend: Backend, session_id: str, user_id: str, events: List[Dict]) -> bool:
+        """
+        Re-creates an empty session on the backend with `events` as its history
+        (e.g. a turn the proxy answered itself) and pins it there. Returns False,
+        leaving the session alone, if it already has events or the backend does
+        not accept initial events. Raises httpx errors.
+        """
+        url = self._session_url(backend, user_id, session_id)
+        resp = await self.client.get(url)
+        if resp.status_code == 200:
+            if resp.json().get("events"):
+                return False
+            (await self.client.delete(url)).raise_for_status()
+        elif resp.status_code != 404:
+            resp.raise_for_status()
+        resp = await self.client.post(
+            f"{backend.url}/apps/{self.app_name}/users/{user_id}/sessions",
+            json={"session_id": session_id, "events": events},
+        )
+        resp.raise_for_status()
+        self._affinity.set(session_id, backend.url)
+        return len(resp.json().get("events") or ()) == len(events)
+
+    def run_url(self, backend: Backend) -> str:
+        return f"{backend.url}/run_sse"
+
+    @contextmanager
+    def stream(self, backend: Backend):
+        """Counts an open stream against the backend for least-busy placement."""
+        backend.outstanding += 1
+        try:
+            yield
+        finally:
+            backend.outstanding -= 1
+
+    # --- Health ---
+    def report_failure(self, backend: Backend):
+        BACKEND_ERRORS.inc()
+        backend.failures += 1
+        if backend.healthy and backend.failures >= BACKEND_FAILURE_THRESHOLD:
+            backend.healthy = False
+            print(f"ADK backend {backend.url} marked unhealthy.")
+        self._update_gauge()
+
+    def report_success(self, backend: Backend):
+        backend.failures = 0
+        if not backend.healthy:
+            backend.healthy = True
+            print(f"ADK backend {backend.url} is healthy again.")
+        self._update_gauge()
+
+    def _update_gauge(self):
+        BACKENDS_HEALTHY.set(sum(1 for b in self.backends.values() if b.healthy))
+
+    async def check_health(self):
+        await asyncio.gather(*(self._probe(b) for b in self.backends.values()))
+
+    async def _probe(self, backend: Backend):
+        try:
+            resp = await self.client.get(backend.url + BACKEND_HEALTH_PATH, timeout=BACKEND_HEALTH_TIMEOUT)
+            ok = resp.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            self.report_success(backend)
+        else:
+            self.report_failure(backend)
+
+    async def _health_loop(self, interval: float):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = BACKEND_HEALTH_INTERVAL):
+        self._update_gauge()
+        if self._health_task is None and interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop(interval))
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    # --- Admin ---
+    def drain(self, url: str, draining: bool = True) -> Backend:
+        """Stops (or resumes) placing new sessions on a backend; its current sessions stay."""
+        backend = self.backends.get(url.rstrip("/"))
+        if backend is None:
+            raise KeyError(url)
+        backend.draining = draining
+        return backend
+
+    def status(self) -> List[Dict]:
+        return [b.to_dict() for b in self.backends.values()]
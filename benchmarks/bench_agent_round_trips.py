@@ -0,0 +1,123 @@
+"""
+Model calls and latency per typical math / pricing query, before and after the
+whole-expression and batch tools.
+
+The real math_agent and research_agent (their tools and instructions) run on a
+stub model that replays a scripted tool plan and waits --model-latency seconds
+per call:
+  before  one tool call per model turn with the original tools
+          (multiply_numbers / add_numbers / power, get_product_price /
+          calculate_total_cost), the way Gemini orchestrates them today;
+  after   a single evaluate_expression / quote_order / get_product_prices call.
+The tool results are checked for errors, so the plans really run. Requires
+google-adk.
+
+Usage:
+    python benchmarks/bench_agent_round_trips.py [--model-latency 0.7] [--runs 3]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import AsyncGenerator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from agents.mathAgent import math_agent  # noqa: E402
+from agents.researchAgent import research_agent  # noqa: E402
+
+APP = "bench_agent_round_trips"
+
+QUERIES = [
+    (math_agent, "What is 3.5 * 12 + 2^10?", {
+        "before": [[("multiply_numbers", {"a": 3.5, "b": 12})], [("power", {"base": 2, "exponent": 10})],
+                   [("add_numbers", {"a": 42, "b": 1024})]],
+        "after": [[("evaluate_expression", {"expression": "3.5 * 12 + 2^10"})]],
+    }),
+    (math_agent, "What is (17 + 4) * 3^2 - 5 * 6?", {
+        "before": [[("add_numbers", {"a": 17, "b": 4})], [("power", {"base": 3, "exponent": 2})],
+                   [("multiply_numbers", {"a": 21, "b": 9})], [("multiply_numbers", {"a": 5, "b": 6})],
+                   [("add_numbers", {"a": 189, "b": -30})]],
+        "after": [[("evaluate_expression", {"expression": "(17 + 4) * 3^2 - 5 * 6"})]],
+    }),
+    (research_agent, "How much do 3 pizzas and 4 sodas cost with tax?", {
+        "before": [[("get_product_price", {"product_name": "pizza"})], [("get_product_price", {"product_name": "soda"})],
+                   [("calculate_total_cost", {"price": 15.0, "quantity": 3})],
+                   [("calculate_total_cost", {"price": 2.5, "quantity": 4})]],
+        "after": [[("quote_order", {"product_names": ["pizza", "soda"], "quantities": [3, 4]})]],
+    }),
+    (research_agent, "What are the prices of pizza, soda and fries?", {
+        "before": [[("get_product_price", {"product_name": name})] for name in ("pizza", "soda", "fries")],
+        "after": [[("get_product_prices", {"product_names": ["pizza", "soda", "fries"]})]],
+    }),
+]
+
+BEFORE_TOOLS = {"math_agent": {"multiply_numbers", "add_numbers", "power"},
+                "research_agent": {"get_product_price", "calculate_total_cost"}}
+
+
+class ScriptedModel(BaseLlm):
+    """Returns plan[i] on the i-th call of a run, then a final text answer."""
+
+    plan: list = []
+    latency: float = 0.0
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        step = sum(1 for c in llm_request.contents if c.role == "model" and any(p.function_call for p in c.parts or []))
+        if step < len(self.plan):
+            parts = [types.Part(function_call=types.FunctionCall(name=n, args=a)) for n, a in self.plan[step]]
+        else:
+            parts = [types.Part(text="done")]
+        yield LlmResponse(content=types.Content(role="model", parts=parts))
+
+
+async def run_query(agent, query: str, plan, variant: str, latency: float):
+    model = ScriptedModel(model="stub", plan=plan, latency=latency)
+    tools = agent.tools
+    if variant == "before":
+        tools = [t for t in agent.tools if getattr(t, "__name__", "") in BEFORE_TOOLS[agent.name]]
+    runner = InMemoryRunner(agent=agent.model_copy(update={"model": model, "tools": tools}), app_name=APP)
+    session = await runner.session_service.create_session(app_name=APP, user_id="bench")
+    message = types.Content(role="user", parts=[types.Part(text=query)])
+    started = time.perf_counter()
+    async for event in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+        for response in event.get_function_responses():
+            if "error" in (response.response or {}):
+                raise SystemExit(f"{response.name} failed for {query!r}: {response.response}")
+    return model.calls, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-latency", type=float, default=0.7, help="seconds per stub model call")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # stub models report no token usage
+
+    print(f"{'query':<52}{'variant':<8}{'model calls':>12}{'p50 s':>8}")
+    totals = {"before": [0, 0.0], "after": [0, 0.0]}
+    for agent, query, plans in QUERIES:
+        for variant in ("before", "after"):
+            results = [asyncio.run(run_query(agent, query, plans[variant], variant, args.model_latency))
+                       for _ in range(args.runs)]
+            calls, p50 = results[0][0], statistics.median(r[1] for r in results)
+            totals[variant][0] += calls
+            totals[variant][1] += p50
+            print(f"{query[:50]:<52}{variant:<8}{calls:>12}{p50:>8.2f}")
+    for variant, (calls, seconds) in totals.items():
+        print(f"{'total':<52}{variant:<8}{calls:>12}{seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
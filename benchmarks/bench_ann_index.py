@@ -0,0 +1,170 @@
+"""
+Query latency and memory of the memory-mapped vector index vs Chroma.
+
+For each corpus size a synthetic clustered set of unit vectors is written once,
+then loaded into:
+  chroma       a persistent Chroma collection (HNSW), queried by embedding
+  mmap-flat    the mmap export scanned exhaustively (also the exact ground truth)
+  mmap-ivf     the mmap export with IVF lists, float32
+  mmap-ivf-i8  the same with int8 vectors
+Every backend is queried in its own process so the reported RSS (after open and
+after the queries) belongs to that backend alone. recall@k is measured against
+mmap-flat.
+
+Requires numpy (and chromadb for the chroma rows). The 1M row needs several GB
+of disk; pass --sizes to trim.
+
+Usage:
+    python benchmarks/bench_ann_index.py [--sizes 10000 100000 1000000] [--dim 384] [--queries 200]
+                                         [--backends chroma mmap-flat mmap-ivf mmap-ivf-i8]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annIndex  # noqa: E402
+
+BACKENDS = ("chroma", "mmap-flat", "mmap-ivf", "mmap-ivf-i8")
+K = 10
+CHROMA_BATCH = 5000
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_corpus(workdir: str, size: int, dim: int, n_queries: int, seed: int = 0):
+    """Clustered unit vectors staged in an .npy file, plus queries drawn near random rows."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, size // 1000), dim)).astype(np.float32)
+    vectors = np.lib.format.open_memmap(os.path.join(workdir, "vectors.npy"), mode="w+", dtype=np.float32, shape=(size, dim))
+    for start in range(0, size, 65536):
+        n = min(65536, size - start)
+        block = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+        vectors[start:start + n] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    vectors.flush()
+    queries = vectors[rng.integers(0, size, n_queries)] + 0.3 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    np.save(os.path.join(workdir, "queries.npy"), queries.astype(np.float32))
+    return vectors
+
+
+def corpus_columns(size: int):
+    ids = [str(i) for i in range(size)]
+    texts = [f"chunk {i}" for i in range(size)]
+    metadatas = [{"source": f"doc{i // 50}.pdf", "page": i % 50} for i in range(size)]
+    return ids, texts, metadatas
+
+
+def build(workdir: str, backend: str, vectors, columns):
+    ids, texts, metadatas = columns
+    path = os.path.join(workdir, backend)
+    started = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=path).get_or_create_collection(
+            annIndex.CHROMA_COLLECTION, metadata={"hnsw:space": "cosine"}
+        )
+        for start in range(0, len(ids), CHROMA_BATCH):
+            end = start + CHROMA_BATCH
+            collection.add(ids=ids[start:end], embeddings=np.asarray(vectors[start:end]).tolist(),
+                           documents=texts[start:end], metadatas=metadatas[start:end])
+    else:
+        nlist = 0 if backend == "mmap-flat" else max(1, int(np.sqrt(len(ids))))
+        dtype = "int8" if backend.endswith("-i8") else "float32"
+        annIndex.build_index(path, ids, vectors, texts, metadatas, dtype=dtype, nlist=nlist, index_version="bench")
+    return time.perf_counter() - started
+
+
+def child(backend: str, path: str, queries_path: str, nprobe: int):
+    """Runs in a fresh process: open the backend, query, print JSON."""
+    queries = np.load(queries_path)
+    rss_start = rss_mb()
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=path).get_collection(annIndex.CHROMA_COLLECTION)
+
+        def search(q):
+            return collection.query(query_embeddings=[q.tolist()], n_results=K)["ids"][0]
+    else:
+        store = annIndex.MMapVectorStore(path, nprobe=nprobe)
+
+        def search(q):
+            return [store._files.ids[row] for row, _ in store.search_by_vector(q, k=K)]
+
+    search(queries[0])  # first query pays for lazy loading
+    rss_open = rss_mb()
+    latencies, results = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append(search(q))
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(json.dumps({
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+        "rss_open_mb": rss_open - rss_start,
+        "rss_end_mb": rss_mb() - rss_start,
+        "results": results,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=annIndex.ANN_NPROBE)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "PATH", "QUERIES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, nprobe=args.nprobe)
+        return
+
+    backends = ["mmap-flat"] + [b for b in args.backends if b != "mmap-flat"]
+    print(f"{'size':>9} {'backend':<12}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}{'RSS open MB':>13}{'RSS end MB':>12}{f'recall@{K}':>11}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            vectors = make_corpus(workdir, size, args.dim, args.queries)
+            columns = corpus_columns(size)
+            exact = None
+            for backend in backends:
+                build_seconds = build(workdir, backend, vectors, columns)
+                out = subprocess.run(
+                    [sys.executable, __file__, "--nprobe", str(args.nprobe), "--child", backend,
+                     os.path.join(workdir, backend), os.path.join(workdir, "queries.npy")],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                if exact is None:
+                    exact = r["results"]
+                recall = statistics.mean(len(set(got) & set(want)) / K for got, want in zip(r["results"], exact))
+                if backend in args.backends:
+                    print(f"{size:>9} {backend:<12}{build_seconds:>9.1f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+                          f"{r['rss_open_mb']:>13.1f}{r['rss_end_mb']:>12.1f}{recall:>11.3f}")
+            del vectors
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: prompt tokens of the conversation context per turn, joining the
+recent turns and top-k hits as before (get_recent_conversation + get_context)
+versus contextAssembly.assemble_context with a token budget, plus the time
+assembly takes.
+
+The conversation is synthetic: each turn is a short question and a long AI
+answer, stored the way ChatContextManager stores them (500-character splits
+with 50 characters of overlap, sharing a message_id). Retrieval is simulated
+by taking the splits of the most recent answers, best first, as a similarity
+search over a long history would return them. Needs no credentials or Chroma.
+
+Usage:
+    python benchmarks/bench_context_assembly.py [--turns 20] [--answer-chars 3000] [--budget 1500] [--top-k 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextAssembly import assemble_context  # noqa: E402
+from embeddingService import estimate_tokens  # noqa: E402
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+class Doc:
+    def __init__(self, page_content: str, metadata: dict):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def split_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Word-boundary splits with overlap, like RecursiveCharacterTextSplitter on prose."""
+    words = text.split()
+    chunks, start = [], 0
+    while start < len(words):
+        end, length = start, 0
+        while end < len(words) and length + len(words[end]) + 1 <= size:
+            length += len(words[end]) + 1
+            end += 1
+        chunks.append(" ".join(words[start:end]))
+        if end >= len(words):
+            break
+        back, length = end, 0
+        while back > start + 1 and length + len(words[back - 1]) + 1 <= overlap:
+            length += len(words[back - 1]) + 1
+            back -= 1
+        start = back
+    return chunks
+
+
+def answer(turn: int, chars: int, rng: random.Random) -> str:
+    sentences = []
+    while sum(len(s) + 1 for s in sentences) < chars:
+        sentences.append(f"For request {turn}, clause {rng.randint(1, 500)} allows item {rng.randint(1, 99)} with a receipt.")
+    return " ".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--answer-chars", type=int, default=3000)
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--recent-n", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    history, docs = [], []
+    naive, assembled, seconds = [], [], []
+    for turn in range(args.turns):
+        question = f"What can I claim for request {turn}?"
+        reply = answer(turn, args.answer_chars, rng)
+        history += [{"role": "user", "message": question}, {"role": "ai", "message": reply}]
+        docs.append(Doc(question, {"role": "user", "created_at": turn, "message_id": f"q{turn}", "chunk_index": 0}))
+        docs += [Doc(chunk, {"role": "ai_response", "created_at": turn, "message_id": f"a{turn}", "chunk_index": i})
+                 for i, chunk in enumerate(split_text(reply))]
+
+        recent = history[-args.recent_n:]
+        hits = sorted(docs, key=lambda d: (-d.metadata["created_at"], d.metadata["chunk_index"]))[:args.top_k]
+        before = "\n".join(f"{m['role']}: {m['message']}" for m in recent)
+        before += "\n" + "\n".join(f"{d.metadata['role']}: {d.page_content}" for d in hits)
+        naive.append(estimate_tokens(before))
+
+        started = time.perf_counter()
+        result = assemble_context(recent, hits, args.budget)
+        seconds.append(time.perf_counter() - started)
+        assembled.append(result.tokens)
+
+    print(f"{'':<28}{'mean':>10}{'max':>10}")
+    print(f"{'joined context tokens':<28}{statistics.mean(naive):>10.0f}{max(naive):>10}")
+    print(f"{'assembled context tokens':<28}{statistics.mean(assembled):>10.0f}{max(assembled):>10}")
+    print(f"{'tokens saved per turn':<28}{statistics.mean(n - a for n, a in zip(naive, assembled)):>10.0f}")
+    print(f"{'assembly time (ms)':<28}{1000 * statistics.mean(seconds):>10.2f}{1000 * max(seconds):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
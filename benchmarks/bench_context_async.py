@@ -0,0 +1,99 @@
+"""
+Event-loop latency under concurrent ChatContextManager traffic.
+
+Runs N simulated users that each add a message, add an AI response and fetch
+context, once through the sync API called directly from coroutines (what a
+FastAPI handler would do today) and once through the async API. A probe task
+sleeps 10 ms in a loop and records how late it wakes up: with a healthy event
+loop that lag stays flat as users are added.
+
+Uses the local hashing embedder and a temporary Chroma directory, so no
+credentials are needed. Requires chromadb/langchain to be installed.
+
+Usage:
+    python benchmarks/bench_context_async.py [--users 50 200 500] [--embed-latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["EMBEDDING_BACKEND"] = "local"
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+# AzureChatOpenAI validates these at construction; summarization is never reached below.
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.invalid")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "offline")
+os.environ.setdefault("OPENAI_API_VERSION", "2024-05-01-preview")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contextManager  # noqa: E402
+from contextManager import ChatContextManager  # noqa: E402
+from embeddingService import EmbeddingService, LocalHashEmbedder  # noqa: E402
+
+contextManager.MAX_DOCS_PER_USER = 10 ** 9
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def sync_user(manager, user_id):
+    manager.add_user_message(user_id, f"What is the leave policy for team {user_id}?")
+    manager.add_ai_response(user_id, "Employees get 24 days of paid leave per year. " * 20)
+    manager.get_context(user_id, "leave policy")
+
+
+async def async_user(manager, user_id):
+    await manager.aadd_user_message(user_id, f"What is the leave policy for team {user_id}?")
+    await manager.aadd_ai_response(user_id, "Employees get 24 days of paid leave per year. " * 20)
+    await manager.aget_context(user_id, "leave policy", recent_n=5)
+
+
+async def run(manager, users, user_fn):
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(user_fn(manager, f"user-{i}") for i in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "lag_p50_ms": 1000 * statistics.median(lags) if lags else 0.0,
+        "lag_p99_ms": 1000 * lags[int(0.99 * (len(lags) - 1))] if lags else 0.0,
+        "lag_max_ms": 1000 * lags[-1] if lags else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="simulated embedding request latency (s)")
+    args = parser.parse_args()
+
+    embedder = EmbeddingService(provider=LocalHashEmbedder(latency=args.embed_latency), cache_path=None)
+
+    print(f"{'api':<6}{'users':>7}{'elapsed s':>11}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for users in args.users:
+        for name, user_fn in (("sync", sync_user), ("async", async_user)):
+            with tempfile.TemporaryDirectory() as tmp:
+                manager = ChatContextManager(persist_directory=tmp)
+                manager.embedding_model = embedder
+                manager.vector_db._embedding_function = embedder
+                r = asyncio.run(run(manager, users, user_fn))
+                manager.close()
+            print(f"{name:<6}{users:>7}{r['elapsed']:>11.2f}{r['lag_p50_ms']:>12.1f}{r['lag_p99_ms']:>12.1f}{r['lag_max_ms']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: peak proxy RSS and request latency for 5-20 MB images, sent
+- inline:    base64 in the /chat JSON (imgData), as before /upload existed
+- upload:    raw body to POST /upload, then /chat with the returned imageHash
+- reference: a follow-up /chat turn that only sends the imageHash again
+
+Every (mode, size) pair runs against a fresh `uvicorn main:app` (with a
+private BLOB_CACHE_DIR) in front of one fake ADK backend, so the RSS peaks do
+not carry over. Latency is measured until the /chat stream ends. Images are
+random-noise PNGs (Pillow) so that downscaling has real work to do; without
+Pillow they are random bytes behind a PNG signature.
+
+Usage:
+    python benchmarks/bench_image_upload.py [--sizes 5,10,20] [--proxy-env IMAGE_MAX_DIMENSION=0 ...]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import ProcessSampler, start_backends, start_proxy, wait_until_up  # noqa: E402
+
+MODES = ("inline", "upload", "reference")
+
+
+def make_image(size_mb: float) -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\x89PNG\r\n\x1a\n" + os.urandom(int(size_mb * 2 ** 20))
+    side = int(math.sqrt(size_mb * 2 ** 20 / 3))  # random RGB pixels do not compress
+    out = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+async def read_chat(client: httpx.AsyncClient, url: str, body: dict) -> int:
+    async with client.stream("POST", url + "/chat", json=body) as resp:
+        async for _ in resp.aiter_bytes():
+            pass
+        return resp.status_code
+
+
+async def run_mode(args, mode: str, image: bytes, backend_urls) -> dict:
+    args.proxy_env = args.extra_env + [f"BLOB_CACHE_DIR={tempfile.mkdtemp(prefix='blobs-')}"]
+    proxy = start_proxy(args, backend_urls)
+    url = f"http://127.0.0.1:{args.proxy_port}"
+    try:
+        await wait_until_up(url, "/metrics")
+        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
+            session_id = f"upload-{mode}-{len(image)}"
+            await client.post(url + "/createSession", json={"sessionId": session_id})
+            await read_chat(client, url, {"sessionId": session_id, "text": "warm up"})
+
+            image_hash = None
+            if mode == "reference":
+                resp = await client.post(url + "/upload", content=image, headers={"Content-Type": "image/png"})
+                image_hash = resp.json()["imageHash"]
+
+            sampler = ProcessSampler(proxy.pid)
+            baseline = sampler.rss()
+            sampling = asyncio.create_task(sampler.run(interval=0.01))
+            started = time.perf_counter()
+            body = {"sessionId": session_id, "text": "What is in this picture?"}
+            if mode == "inline":
+                body["imgData"] = base64.b64encode(image).decode("ascii")
+            elif mode == "upload":
+                resp = await client.post(url + "/upload", content=image, headers={"Content-Type": "image/png"})
+                image_hash = resp.json()["imageHash"]
+            if image_hash is not None:
+                body["imageHash"] = image_hash
+            status = await read_chat(client, url, body)
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.05)
+            sampling.cancel()
+        return {
+            "status": status,
+            "latency_ms": round(1000 * elapsed, 1),
+            "peak_rss_delta_mb": round((max(sampler.peak_rss, baseline) - baseline) / 2 ** 20, 1),
+        }
+    finally:
+        proxy.terminate()
+        proxy.wait(timeout=10)
+
+
+async def run(args):
+    import signal
+
+    backends, backend_urls = start_backends(args)
+    try:
+        for url in backend_urls:
+            await wait_until_up(url, "/list-apps")
+        print(f"{'size_mb':>8}{'mode':>11}{'status':>8}{'latency_ms':>12}{'peak_rss_delta_mb':>19}")
+        for size in args.sizes:
+            image = make_image(size)
+            for mode in MODES:
+                result = await run_mode(args, mode, image, backend_urls)
+                print(f"{len(image) / 2 ** 20:>8.1f}{mode:>11}{result['status']:>8}{result['latency_ms']:>12}"
+                      f"{result['peak_rss_delta_mb']:>19}")
+    finally:
+        os.killpg(backends.pid, signal.SIGTERM)
+        backends.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,10,20", help="image sizes in MB, comma separated")
+    parser.add_argument("--backend-port", type=int, default=8720)
+    parser.add_argument("--proxy-port", type=int, default=8710)
+    parser.add_argument("--proxy-env", dest="extra_env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the proxy (repeatable)")
+    args = parser.parse_args()
+    args.sizes = [float(s) for s in args.sizes.split(",")]
+    # Fake backend settings used by bench_load.start_backends: answer at once.
+    args.backends, args.tokens_per_second, args.tool_delay, args.first_byte_delay = 1, 1000.0, 0.0, 0.0
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
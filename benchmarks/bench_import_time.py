@@ -0,0 +1,103 @@
+"""
+Cold-start profile of the agents package, based on `python -X importtime`.
+
+Imports the module (default: agents.agent, what the ADK server loads) in fresh
+interpreters, reports the median wall time and the top-level packages with the
+largest cumulative import time. The warm-up thread is disabled so only the
+import itself is measured.
+
+With --record the summary is appended to benchmarks/results/import_time.jsonl
+together with the current git commit, so cold start can be tracked over time.
+
+Usage:
+    python benchmarks/bench_import_time.py [--module agents.agent] [--repeat 5] [--top 15] [--record]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, "benchmarks", "results", "import_time.jsonl")
+
+
+def import_once(module: str):
+    env = dict(os.environ, AGENTS_WARMUP="false", PYTHONDONTWRITEBYTECODE="")
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"`import {module}` failed:\n{tail}")
+    return elapsed, proc.stderr
+
+
+def parse_importtime(stderr: str):
+    """Returns {top-level package: cumulative microseconds} from -X importtime output."""
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # Nested imports are indented; only roots are counted so nothing is counted twice.
+        if not name.startswith("  "):
+            packages[name.strip().split(".")[0]] += int(cumulative_us)
+    return packages
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="agents.agent")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--record", action="store_true", help="append the result to benchmarks/results/import_time.jsonl")
+    args = parser.parse_args()
+
+    import_once(args.module)  # fill the bytecode cache first
+    walls, profiles = [], []
+    for _ in range(args.repeat):
+        wall, stderr = import_once(args.module)
+        walls.append(wall)
+        profiles.append(parse_importtime(stderr))
+
+    packages = {name: statistics.median(p.get(name, 0) for p in profiles) for name in profiles[0]}
+    total_ms = sum(packages.values()) / 1000
+    print(f"import {args.module}: wall p50 {1000 * statistics.median(walls):.0f} ms "
+          f"(min {1000 * min(walls):.0f}), imports {total_ms:.0f} ms over {args.repeat} runs")
+    print(f"{'package':<32}{'cumulative ms':>14}{'share':>8}")
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for name, us in top:
+        print(f"{name:<32}{us / 1000:>14.1f}{100 * us / 1000 / total_ms if total_ms else 0:>7.1f}%")
+
+    if args.record:
+        os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+        with open(RESULTS, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "commit": git_commit(),
+                "module": args.module,
+                "wall_ms_p50": round(1000 * statistics.median(walls), 1),
+                "imports_ms": round(total_ms, 1),
+                "top": {name: round(us / 1000, 1) for name, us in top},
+                "python": sys.version.split()[0],
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }) + "\n")
+        print(f"Recorded in {RESULTS}")
+
+
+if __name__ == "__main__":
+    main()
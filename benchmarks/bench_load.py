@@ -0,0 +1,424 @@
+"""
+End-to-end load test of the proxy in main.py against local fake ADK backends.
+
+Starts benchmarks/fake_adk_server.py (replaying the recorded transcripts at
+--tokens-per-second) and `uvicorn main:app` as subprocesses, then runs
+--clients simulated browsers that speak the home.html protocol: create a
+session, post /chat, read the `\\n\\n`-separated JSON frames, and on a
+tool_confirmation frame drop the stream and post the confirmation reply.
+With --transport ws the browsers keep one /ws connection each instead and
+send the same turns over it (--ws-framing picks the subprotocol); --transport
+both runs the two back to back and prints them side by side.
+
+Reports throughput, time to first text frame and the gap between text frames
+(p50/p99) per stream, proxy CPU time per stream, peak proxy RSS and peak open
+proxy file descriptors, i.e. sockets held per concurrent session (read from
+/proc, so Linux only). With --record the summary is appended to
+benchmarks/results/load_test.jsonl with the current git commit, and compared
+against the last recorded run with the same settings.
+
+Usage:
+    python benchmarks/bench_load.py [--clients 50] [--turns 3] [--backends 2] [--tokens-per-second 50]
+                                   [--transport sse|ws|both] [--ws-framing compact|json]
+                                   [--proxy-env ADMISSION_MAX_STREAMS=32 ...] [--record]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(ROOT, "benchmarks", "fake_adk_server.py")
+TRANSCRIPTS = sorted(glob.glob(os.path.join(ROOT, "benchmarks", "transcripts", "*.sse")))
+REPLY_TRANSCRIPT = os.path.join(ROOT, "benchmarks", "transcripts", "confirmation_reply.sse")
+RESULTS = os.path.join(ROOT, "benchmarks", "results", "load_test.jsonl")
+CHARS_PER_TOKEN = 4
+
+
+class ProcessSampler:
+    """Samples CPU time and RSS of a process from /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_rss = 0
+        self.peak_fds = 0
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> float:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._ticks  # utime + stime
+        except (OSError, IndexError):
+            return float("nan")
+
+    def rss(self) -> int:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def fds(self) -> int:
+        try:
+            return len(os.listdir(f"/proc/{self.pid}/fd"))
+        except OSError:
+            return 0
+
+    async def run(self, interval: float = 0.2):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss())
+            self.peak_fds = max(self.peak_fds, self.fds())
+            await asyncio.sleep(interval)
+
+
+class Stats:
+    def __init__(self):
+        self.ttft = []  # seconds from POST to the first text frame
+        self.gaps = []  # seconds between consecutive text frames
+        self.streams = 0
+        self.turns = 0
+        self.confirmations = 0
+        self.text_chars = 0
+        self.errors = {}
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def text(self, text: str, started: float, last):
+        """Records one text event; returns its arrival time."""
+        now = time.perf_counter()
+        if last is None:
+            self.ttft.append(now - started)
+        else:
+            self.gaps.append(now - last)
+        self.text_chars += len(text or "")
+        return now
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def read_stream(client: httpx.AsyncClient, url: str, body: dict, stats: Stats):
+    """Posts one /chat request and reads it like home.html. Returns the tool_confirmation frame, if any."""
+    started = time.perf_counter()
+    last = None
+    async with client.stream("POST", url + "/chat", json=body) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            stats.error(f"http_{resp.status_code}")
+            return None
+        stats.streams += 1
+        buffer = ""
+        async for chunk in resp.aiter_text():
+            buffer += chunk
+            *frames, buffer = buffer.split("\n\n")
+            for frame in frames:
+                frame = frame.strip()
+                if not frame:
+                    continue
+                data = json.loads(frame)
+                if data.get("type") == "text":
+                    last = stats.text(data.get("text"), started, last)
+                elif data.get("type") == "tool_confirmation":
+                    return data  # leaving the block closes the stream, like reader.cancel()
+    if last is None:
+        stats.error("no_text")
+    return None
+
+
+def prompt(index: int, turn: int) -> str:
+    return f"What is the travel reimbursement policy for international trips? ({index}/{turn})"
+
+
+async def browser(client: httpx.AsyncClient, url: str, index: int, args, stats: Stats):
+    session_id = f"load-{os.getpid()}-{index}"
+    resp = await client.post(url + "/createSession", json={"sessionId": session_id})
+    if resp.status_code != 200 or resp.json().get("status") != "success":
+        stats.error("create_session")
+        return
+    for turn in range(args.turns):
+        body = {
+            "sessionId": session_id,
+            "text": prompt(index, turn),
+            "imgData": None,
+            "confirmationId": None,
+            "approvedValue": None,
+        }
+        try:
+            confirmation = await read_stream(client, url, body, stats)
+            if confirmation is not None:
+                stats.confirmations += 1
+                await asyncio.sleep(args.think_time)
+                reply = {"sessionId": session_id, "approvedValue": "yes",
+                         "confirmationId": confirmation.get("confirmation_id")}
+                await read_stream(client, url, reply, stats)
+            stats.turns += 1
+        except httpx.HTTPError as e:
+            stats.error(type(e).__name__)
+        await asyncio.sleep(args.think_time)
+
+
+def _ws_events(message: str):
+    """(turn id, events as dicts) of an event batch, or (None, control message)."""
+    data = json.loads(message)
+    if isinstance(data, list):
+        turn_id, compact = data
+        events = []
+        for event in compact:
+            if event[0] == "t":
+                events.append({"type": "text", "text": event[1]})
+            elif event[0] == "c":
+                events.append({"type": "tool_confirmation", "confirmation_id": event[1], "name": event[2]})
+        return turn_id, events
+    if "events" in data:
+        return data["turn"], data["events"]
+    return None, data
+
+
+async def ws_turn(ws, turn_id: str, message: dict, stats: Stats):
+    """Sends one chat turn over the socket and reads it to its done/error message."""
+    started = time.perf_counter()
+    last = None
+    confirmation = None
+    await ws.send(json.dumps({"type": "chat", "turn": turn_id, **message}))
+    stats.streams += 1
+    while True:
+        event_turn, data = _ws_events(await ws.recv())
+        if event_turn is None:
+            if data.get("turn") != turn_id:
+                continue
+            if data.get("type") == "error":
+                stats.streams -= 1
+                stats.error(f"http_{data.get('status')}")
+            elif last is None and confirmation is None:
+                stats.error("no_text")
+            return confirmation
+        for event in data:
+            if event.get("type") == "text":
+                last = stats.text(event.get("text"), started, last)
+            elif event.get("type") == "tool_confirmation":
+                confirmation = event
+
+
+async def ws_browser(url: str, index: int, args, stats: Stats):
+    import websockets
+
+    session_id = f"load-{os.getpid()}-{index}"
+    subprotocol = "adk-chat.compact" if args.ws_framing == "compact" else "adk-chat.json"
+    try:
+        async with websockets.connect(url.replace("http", "ws", 1) + "/ws", subprotocols=[subprotocol],
+                                      max_size=None) as ws:
+            await ws.send(json.dumps({"type": "createSession", "sessionId": session_id}))
+            while True:
+                reply = json.loads(await ws.recv())
+                if reply.get("type") == "session":
+                    break
+            if reply.get("status") != "success":
+                stats.error("create_session")
+                return
+            for turn in range(args.turns):
+                confirmation = await ws_turn(ws, f"{turn}", {"text": prompt(index, turn)}, stats)
+                if confirmation is not None:
+                    stats.confirmations += 1
+                    await asyncio.sleep(args.think_time)
+                    reply = {"approvedValue": "yes", "confirmationId": confirmation.get("confirmation_id")}
+                    await ws_turn(ws, f"{turn}-reply", reply, stats)
+                stats.turns += 1
+                await asyncio.sleep(args.think_time)
+    except (OSError, websockets.WebSocketException) as e:
+        stats.error(type(e).__name__)
+
+
+async def wait_until_up(url: str, path: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url + path)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def start_backends(args):
+    cmd = [sys.executable, FAKE_SERVER, "--workers", str(args.backends), "--port", str(args.backend_port),
+           "--tokens-per-second", str(args.tokens_per_second), "--tool-delay", str(args.tool_delay),
+           "--first-byte-delay", str(args.first_byte_delay), "--reply-transcript", REPLY_TRANSCRIPT]
+    for path in TRANSCRIPTS:
+        if path != REPLY_TRANSCRIPT:
+            cmd += ["--transcript", path]
+    urls = [f"http://127.0.0.1:{args.backend_port + i}" for i in range(args.backends)]
+    # Own process group, so the worker processes go down with it.
+    return subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, start_new_session=True), urls
+
+
+def start_proxy(args, backend_urls):
+    env = dict(os.environ, ADK_BACKENDS=",".join(backend_urls), PYTHONUNBUFFERED="1")
+    env.setdefault("RESPONSE_CACHE_ENABLED", "false")
+    for item in args.proxy_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.proxy_port),
+           "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+async def run(args, transport: str):
+    backends, backend_urls = start_backends(args)
+    proxy = None
+    try:
+        for url in backend_urls:
+            await wait_until_up(url, "/list-apps")
+        proxy = start_proxy(args, backend_urls)
+        url = f"http://127.0.0.1:{args.proxy_port}"
+        await wait_until_up(url, "/metrics")
+
+        sampler = ProcessSampler(proxy.pid)
+        sampling = asyncio.create_task(sampler.run())
+        stats = Stats()
+        limits = httpx.Limits(max_connections=args.clients + 10, max_keepalive_connections=args.clients + 10)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits) as client:
+            cpu_before = sampler.cpu_seconds()
+            started = time.perf_counter()
+
+            async def ramped(i):
+                await asyncio.sleep(args.ramp * i / max(1, args.clients))
+                if transport == "ws":
+                    await ws_browser(url, i, args, stats)
+                else:
+                    await browser(client, url, i, args, stats)
+
+            await asyncio.gather(*(ramped(i) for i in range(args.clients)))
+            elapsed = time.perf_counter() - started
+            cpu = sampler.cpu_seconds() - cpu_before
+        sampling.cancel()
+        return summarize(args, stats, elapsed, cpu, sampler)
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+            proxy.wait(timeout=10)
+        os.killpg(backends.pid, signal.SIGTERM)
+        backends.wait(timeout=10)
+
+
+def summarize(args, stats: Stats, elapsed: float, cpu: float, sampler: ProcessSampler) -> dict:
+    return {
+        "turns": stats.turns,
+        "streams": stats.streams,
+        "confirmations": stats.confirmations,
+        "errors": stats.errors,
+        "elapsed_s": round(elapsed, 2),
+        "turns_per_s": round(stats.turns / elapsed, 2),
+        "tokens_per_s": round(stats.text_chars / CHARS_PER_TOKEN / elapsed, 1),
+        "ttft_ms_p50": round(1000 * percentile(stats.ttft, 0.5), 1),
+        "ttft_ms_p99": round(1000 * percentile(stats.ttft, 0.99), 1),
+        "itl_ms_p50": round(1000 * percentile(stats.gaps, 0.5), 1),
+        "itl_ms_p99": round(1000 * percentile(stats.gaps, 0.99), 1),
+        "proxy_cpu_ms_per_stream": round(1000 * cpu / max(1, stats.streams), 2),
+        "proxy_rss_mb_peak": round(sampler.peak_rss / 2 ** 20, 1),
+        "proxy_fds_peak": sampler.peak_fds,
+    }
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def previous_result(settings: dict):
+    if not os.path.exists(RESULTS):
+        return None
+    last = None
+    with open(RESULTS, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("settings") == settings:
+                last = entry
+    return last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent simulated browsers")
+    parser.add_argument("--turns", type=int, default=3, help="prompts per browser")
+    parser.add_argument("--think-time", type=float, default=0.2, help="seconds between a browser's requests")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which the browsers start")
+    parser.add_argument("--backends", type=int, default=2, help="fake ADK processes")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tool-delay", type=float, default=0.2)
+    parser.add_argument("--first-byte-delay", type=float, default=0.3)
+    parser.add_argument("--backend-port", type=int, default=8700)
+    parser.add_argument("--proxy-port", type=int, default=8690)
+    parser.add_argument("--transport", choices=("sse", "ws", "both"), default="sse",
+                        help="POST /chat streams, one /ws connection per browser, or both in turn")
+    parser.add_argument("--ws-framing", choices=("compact", "json"), default="compact")
+    parser.add_argument("--proxy-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the proxy (repeatable)")
+    parser.add_argument("--record", action="store_true", help="append the result to benchmarks/results/load_test.jsonl")
+    args = parser.parse_args()
+
+    transports = ("sse", "ws") if args.transport == "both" else (args.transport,)
+    results = {}
+    for transport in transports:
+        result = results[transport] = asyncio.run(run(args, transport))
+        print(f"\n[{transport}]")
+        for key, value in result.items():
+            print(f"{key:<26}{value}")
+
+        settings = {k: getattr(args, k) for k in ("clients", "turns", "think_time", "backends", "tokens_per_second",
+                                                  "tool_delay", "first_byte_delay", "proxy_env")}
+        settings["transport"] = transport
+        if transport == "ws":
+            settings["ws_framing"] = args.ws_framing
+        previous = previous_result(settings)
+        if previous is not None:
+            print(f"\nChange since {previous['commit']} ({previous['recorded_at']}):")
+            for key, value in result.items():
+                before = previous["result"].get(key)
+                if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                    print(f"{key:<26}{before} -> {value} ({100 * (value - before) / before:+.1f}%)")
+
+        if args.record:
+            os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+            with open(RESULTS, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "commit": git_commit(),
+                    "settings": settings,
+                    "result": result,
+                    "python": sys.version.split()[0],
+                    "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }) + "\n")
+            print(f"Recorded in {RESULTS}")
+
+    if len(results) == 2:
+        print(f"\n{'':<26}{'sse':>12}{'ws':>12}")
+        for key in ("turns_per_s", "ttft_ms_p50", "ttft_ms_p99", "itl_ms_p99", "proxy_cpu_ms_per_stream",
+                    "proxy_rss_mb_peak", "proxy_fds_peak"):
+            print(f"{key:<26}{results['sse'][key]:>12}{results['ws'][key]:>12}")
+
+
+if __name__ == "__main__":
+    main()
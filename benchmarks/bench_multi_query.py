@@ -0,0 +1,113 @@
+"""
+Benchmark: N sequential HybridRetriever.search() calls (what N
+chroma_db_retriever tool calls do) versus one search_many() call for the same
+N queries (multi_query_retriever).
+
+The labelled corpus (benchmarks/retrieval/corpus.jsonl) is padded with
+--rows synthetic filler chunks, indexed into a temporary BM25 index and a
+memory-mapped vector export (annIndex.build_index, IVF above
+RAG_ANN_MIN_IVF_ROWS) embedded with the local hashing embedder. Queries go
+through an EmbeddingService without a disk cache whose provider waits
+--embed-latency seconds per request, like a remote embedding API. Each
+group of N queries is taken from benchmarks/retrieval/queries.jsonl; the
+script also checks that both paths return the same chunks and reports how
+many of the returned chunks were hit by more than one query. Requires numpy.
+
+Usage:
+    python benchmarks/bench_multi_query.py [--n 2 4 8] [--rows 20000] [--embed-latency 0.03] [--k 5] [--repeat 10]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import metrics  # noqa: E402
+from annIndex import MMapVectorStore, build_index  # noqa: E402
+from bm25Index import BM25Index  # noqa: E402
+from embeddingService import EmbeddingService, LocalHashEmbedder  # noqa: E402
+from hybridRetriever import HybridRetriever, document_key  # noqa: E402
+
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build(tmp: str, corpus, rows: int, seed: int = 0) -> HybridRetriever:
+    rng = random.Random(seed)
+    vocabulary = sorted({w for c in corpus for w in c["text"].lower().split()}) + [f"term{i}" for i in range(2000)]
+    chunks = [(c["id"], c["text"], {"source": c["source"], "page": c["page"]}) for c in corpus]
+    chunks += [(f"filler-{i}", " ".join(rng.choices(vocabulary, k=40)), {"source": f"filler{i // 50}.pdf", "page": i % 50})
+               for i in range(rows)]
+    ids, texts, metadatas = zip(*chunks)
+
+    embedder = LocalHashEmbedder()
+    vectors = np.asarray([embedder.embed_one(text) for text in texts], dtype=np.float32)
+    build_index(tmp, ids, vectors, texts, metadatas, index_version="")
+    bm25 = BM25Index(tmp)
+    bm25.add(list(ids), list(texts), list(metadatas))
+    return bm25
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(HERE, "retrieval", "queries.jsonl"))
+    parser.add_argument("--corpus", default=os.path.join(HERE, "retrieval", "corpus.jsonl"))
+    parser.add_argument("--n", type=int, nargs="+", default=[2, 4, 8], help="queries per multi-query call")
+    parser.add_argument("--rows", type=int, default=20000, help="filler chunks added to the corpus")
+    parser.add_argument("--embed-latency", type=float, default=0.03, help="seconds per embedding request")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per group")
+    args = parser.parse_args()
+
+    queries = [item["query"] for item in load_jsonl(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        bm25 = build(tmp, load_jsonl(args.corpus), args.rows)
+        service = EmbeddingService(provider=LocalHashEmbedder(latency=args.embed_latency), cache_path="")
+        retriever = HybridRetriever(MMapVectorStore(tmp, embedding_function=service), bm25)
+        print(f"{len(bm25)} chunks indexed in {time.perf_counter() - started:.1f}s; "
+              f"{args.embed_latency * 1000:.0f} ms per embedding request, k={args.k}, {args.repeat} runs per group\n")
+
+        print(f"{'N':>3}{'sequential ms':>15}{'batched ms':>12}{'speedup':>9}{'embed req':>11}{'shared':>8}{'same':>6}")
+        for n in args.n:
+            groups = [[queries[(start + i) % len(queries)] for i in range(n)] for start in range(0, len(queries), n)]
+            sequential, batched, requests, shared, returned, same = [], [], [0, 0], 0, 0, True
+            for group in groups:
+                for _ in range(args.repeat):
+                    before = metrics.snapshot().get("embedding_requests_total", 0)
+                    started = time.perf_counter()
+                    one_by_one = [retriever.search(query, k=args.k) for query in group]
+                    sequential.append(time.perf_counter() - started)
+                    middle = metrics.snapshot()["embedding_requests_total"]
+                    started = time.perf_counter()
+                    together = retriever.search_many(group, k=args.k)
+                    batched.append(time.perf_counter() - started)
+                    requests[0] += middle - before
+                    requests[1] += metrics.snapshot()["embedding_requests_total"] - middle
+                keys = [[document_key(doc) for doc in docs] for docs in together]
+                same &= keys == [[document_key(doc) for doc in docs] for docs in one_by_one]
+                flat = [key for query_keys in keys for key in query_keys]
+                returned += len(flat)
+                shared += len(flat) - len(set(flat))
+            runs = len(groups) * args.repeat
+            seq_ms, batch_ms = 1000 * statistics.median(sequential), 1000 * statistics.median(batched)
+            print(f"{n:>3}{seq_ms:>15.1f}{batch_ms:>12.1f}{seq_ms / batch_ms:>8.1f}x"
+                  f"{f'{requests[0] / runs:.0f}->{requests[1] / runs:.0f}':>11}{shared / max(1, returned):>8.0%}"
+                  f"{'yes' if same else 'NO':>6}")
+        print("\nembed req: embedding requests per group, sequential->batched; "
+              "shared: returned chunks that another query in the group also returned")
+        bm25._conn.close()
+
+
+if __name__ == "__main__":
+    main()
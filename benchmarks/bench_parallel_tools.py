@@ -0,0 +1,109 @@
+"""
+End-to-end latency of multi-tool turns: sequential tools vs concurrent tools.
+
+Builds a root agent shaped like agents/agent.py (two sub-agents plus blocking
+function tools) on stub models, so no credentials are needed:
+  - the root model asks for every tool in a single turn, then answers;
+  - each sub-agent model waits --model-latency seconds and answers;
+  - each function tool blocks for --tool-latency seconds (like
+    generate_marketing_text's time.sleep).
+"sequential" wires the tools the way agent.py did before (plain functions and
+AgentTool); "concurrent" uses agents/concurrency.py. Requires google-adk.
+
+Usage:
+    python benchmarks/bench_parallel_tools.py [--tools 1 2 4] [--runs 5]
+                                              [--tool-latency 1.0] [--model-latency 0.5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import AsyncGenerator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.agents import LlmAgent  # noqa: E402
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.adk.tools.agent_tool import AgentTool  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from agents.concurrency import BoundedAgentTool, concurrent_tools  # noqa: E402
+
+APP = "bench_parallel_tools"
+
+
+class StubModel(BaseLlm):
+    """Root: asks for all `calls` at once, answers once their responses are in. Sub-agent: answers after `latency`."""
+
+    calls: list = []
+    latency: float = 0.0
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency)
+        last = llm_request.contents[-1] if llm_request.contents else None
+        answered = last is not None and any(part.function_response for part in last.parts or [])
+        if self.calls and not answered:
+            parts = [types.Part(function_call=types.FunctionCall(name=name, args=args)) for name, args in self.calls]
+        else:
+            parts = [types.Part(text="done")]
+        yield LlmResponse(content=types.Content(role="model", parts=parts))
+
+
+def make_tool(name: str, latency: float):
+    def tool(topic: str) -> str:
+        time.sleep(latency)
+        return f"{name} result for {topic}"
+
+    tool.__name__ = name
+    tool.__doc__ = f"Stub blocking tool {name}."
+    return tool
+
+
+def build_root(n_tools: int, concurrent: bool, tool_latency: float, model_latency: float) -> LlmAgent:
+    sub_agents = [
+        LlmAgent(name=name, model=StubModel(model="stub", latency=model_latency), instruction="stub")
+        for name in ("math_agent", "rag_knowledge_expert")
+    ]
+    functions = [make_tool(f"tool_{i}", tool_latency) for i in range(n_tools)]
+    if concurrent:
+        tools = [BoundedAgentTool(agent=a) for a in sub_agents] + concurrent_tools(functions)
+    else:
+        tools = [AgentTool(agent=a) for a in sub_agents] + functions
+    calls = [(a.name, {"request": "q"}) for a in sub_agents] + [(f.__name__, {"topic": "q"}) for f in functions]
+    return LlmAgent(name="root_agent", model=StubModel(model="stub", calls=calls), instruction="stub", tools=tools)
+
+
+async def run_turn(root: LlmAgent) -> float:
+    runner = InMemoryRunner(agent=root, app_name=APP)
+    session = await runner.session_service.create_session(app_name=APP, user_id="bench")
+    message = types.Content(role="user", parts=[types.Part(text="look up the policy, draft copy and compute the cost")])
+    started = time.perf_counter()
+    async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+        pass
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tools", type=int, nargs="+", default=[1, 2, 4], help="blocking function tools per turn")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tool-latency", type=float, default=1.0)
+    parser.add_argument("--model-latency", type=float, default=0.5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # stub models report no token usage
+
+    print(f"{'mode':<12}{'tools':>6}{'sub-agents':>12}{'p50 s':>8}{'max s':>8}")
+    for n_tools in args.tools:
+        for mode in ("sequential", "concurrent"):
+            root = build_root(n_tools, mode == "concurrent", args.tool_latency, args.model_latency)
+            times = [asyncio.run(run_turn(root)) for _ in range(args.runs)]
+            print(f"{mode:<12}{n_tools:>6}{2:>12}{statistics.median(times):>8.2f}{max(times):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Speculative RAG prefetch: hit rate and time to the first answer text.
+
+root_agent and rag_knowledge_expert (their real callbacks, tools and the
+chroma_db_retriever tool) run on stub models that wait --model-latency
+seconds per call and follow the usual plan: root calls rag_knowledge_expert,
+which calls chroma_db_retriever with its own rewording of the question, then
+both answer. The knowledge base is a stub search that takes
+--retrieval-latency seconds. Some rewordings share few words with the
+question (prefetch misses) and one question never reaches the RAG agent
+(wasted prefetch), so the hit rate is not 100% by construction. Requires
+google-adk.
+
+Usage:
+    python benchmarks/bench_rag_prefetch.py [--model-latency 0.7] [--retrieval-latency 0.4] [--runs 3]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import AsyncGenerator
+
+os.environ.setdefault("AGENTS_WARMUP", "false")
+os.environ.setdefault("RETRIEVAL_CACHE_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import metrics  # noqa: E402
+from agents import ragAgent as rag_module  # noqa: E402
+from agents.agent import root_agent  # noqa: E402
+from agents.concurrency import BoundedAgentTool  # noqa: E402
+from hybridRetriever import Document  # noqa: E402
+
+APP = "bench_rag_prefetch"
+
+# (user text, query the RAG agent sends to the retriever; None = root answers without RAG)
+QUESTIONS = [
+    ("What is the travel reimbursement policy for international trips?", "travel reimbursement policy international trips"),
+    ("How many days of paid leave do new employees get?", "paid leave days for new employees"),
+    ("Can I expense a hotel upgrade on a business trip?", "hotel upgrade expense business trip"),
+    ("Who approves overtime for contractors?", "overtime approval for contractors"),
+    ("What does the security policy say about USB drives?", "USB drives security policy"),
+    ("I'd like to know the rules for working from abroad", "remote work from another country"),
+    ("Write a tagline for our new coffee machine", None),
+]
+
+
+class StubRetriever:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query: str, k: int = 5):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [Document(page_content=f"Passage {i} about {query}", metadata={"source": "policy.pdf", "page": i})
+                for i in range(k)]
+
+
+class PlannedModel(BaseLlm):
+    """First call returns `call` (name, args) if set, later calls a final text answer."""
+
+    call: tuple = ()
+    latency: float = 0.0
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency)
+        answered = any(p.function_response for c in llm_request.contents for p in c.parts or [])
+        if self.call and not answered:
+            name, args = self.call
+            parts = [types.Part(function_call=types.FunctionCall(name=name, args=args))]
+        else:
+            parts = [types.Part(text="Here is the answer.")]
+        yield LlmResponse(content=types.Content(role="model", parts=parts))
+
+
+async def ask(question: str, rag_query, latency: float) -> float:
+    rag_model = PlannedModel(model="stub", latency=latency,
+                             call=("chroma_db_retriever", {"query": rag_query, "k": 5}) if rag_query else ())
+    rag = rag_module.ragAgent.model_copy(update={"model": rag_model})
+    root_model = PlannedModel(model="stub", latency=latency,
+                              call=("rag_knowledge_expert", {"request": question}) if rag_query else ())
+    root = root_agent.model_copy(update={"model": root_model, "tools": [BoundedAgentTool(agent=rag)]})
+    runner = InMemoryRunner(agent=root, app_name=APP)
+    session = await runner.session_service.create_session(app_name=APP, user_id="bench")
+    message = types.Content(role="user", parts=[types.Part(text=question)])
+    started = time.perf_counter()
+    first_text = None
+    async for event in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+        if first_text is None and event.author == "root_agent" and event.content and any(p.text for p in event.content.parts or []):
+            first_text = time.perf_counter() - started
+    return first_text
+
+
+async def run(enabled: bool, args):
+    rag_module.RAG_PREFETCH.enabled = enabled
+    timings = {}
+    for question, rag_query in QUESTIONS:
+        timings[question] = statistics.median([await ask(question, rag_query, args.model_latency) for _ in range(args.runs)])
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-latency", type=float, default=0.7, help="seconds per stub model call")
+    parser.add_argument("--retrieval-latency", type=float, default=0.4, help="seconds per knowledge base search")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # stub models report no token usage
+
+    retriever = StubRetriever(args.retrieval_latency)
+    rag_module._HYBRID_RETRIEVER = retriever
+
+    off = asyncio.run(run(False, args))
+    searches_off = retriever.calls
+    before = {name: metrics.snapshot().get(name, 0) for name in ("rag_prefetch_hits_total", "rag_prefetch_misses_total")}
+    on = asyncio.run(run(True, args))
+    searches_on = retriever.calls - searches_off
+    after = metrics.snapshot()
+    hits = after["rag_prefetch_hits_total"] - before["rag_prefetch_hits_total"]
+    misses = after["rag_prefetch_misses_total"] - before["rag_prefetch_misses_total"]
+
+    print(f"{'question':<58}{'off s':>8}{'on s':>8}")
+    for question, _ in QUESTIONS:
+        print(f"{question[:56]:<58}{off[question]:>8.2f}{on[question]:>8.2f}")
+    print(f"{'mean time to first answer text':<58}{statistics.mean(off.values()):>8.2f}{statistics.mean(on.values()):>8.2f}")
+    print(f"\nprefetch hit rate     {hits / max(1, hits + misses):.0%} ({hits:.0f} hits, {misses:.0f} misses)")
+    print(f"knowledge base searches  off {searches_off}, on {searches_on} (includes unused prefetches)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Offline recall@k / latency benchmark for the RAG retriever.
+
+Compares vector-only, lexical-only (BM25) and hybrid (RRF) retrieval over a
+labelled query set. Each line of the query file is
+    {"query": "...", "relevant": ["<file name>:<page>", ...]}
+and a hit counts when a returned chunk's source file name and page match.
+
+By default a small corpus (benchmarks/retrieval/corpus.jsonl) is indexed into a
+temporary BM25 index and an in-memory brute-force vector store built on the
+local hashing embedder, so the script runs without credentials or chromadb.
+Pass --db to measure an existing store built by RAG_creation.py instead.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--queries FILE] [--corpus FILE] [--k 1 3 5] [--repeat 20]
+    python benchmarks/bench_retrieval.py --db ./chroma_vector_db --queries my_queries.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from bm25Index import BM25Index  # noqa: E402
+from embeddingService import LocalHashEmbedder  # noqa: E402
+from hybridRetriever import Document, HybridRetriever, load_default_reranker  # noqa: E402
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+class BruteForceVectorStore:
+    """Exact cosine search over a handful of chunks; enough for a labelled benchmark corpus."""
+
+    def __init__(self, embedder: LocalHashEmbedder):
+        self.embedder = embedder
+        self._docs = []
+        self._vectors = []
+
+    def add(self, docs):
+        self._docs.extend(docs)
+        self._vectors.extend(self.embedder.embed_one(doc.page_content) for doc in docs)
+
+    def similarity_search(self, query: str, k: int = 5):
+        q = self.embedder.embed_one(query)
+        scored = sorted(
+            ((sum(a * b for a, b in zip(q, v)), i) for i, v in enumerate(self._vectors)), reverse=True
+        )
+        return [self._docs[i] for _, i in scored[:k]]
+
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_offline(corpus_path, tmp):
+    chunks = load_jsonl(corpus_path)
+    metadatas = [{"source": c["source"], "page": c["page"]} for c in chunks]
+    bm25 = BM25Index(tmp)
+    bm25.add([c["id"] for c in chunks], [c["text"] for c in chunks], metadatas)
+    store = BruteForceVectorStore(LocalHashEmbedder())
+    store.add([Document(page_content=c["text"], metadata=m, id=c["id"]) for c, m in zip(chunks, metadatas)])
+    return store, bm25, None
+
+
+def build_from_db(db_path):
+    from langchain_chroma import Chroma
+    from embeddingService import get_embedding_service
+
+    store = Chroma(embedding_function=get_embedding_service(), persist_directory=db_path)
+    return store, BM25Index(db_path), db_path
+
+
+def doc_label(doc) -> str:
+    metadata = doc.metadata or {}
+    return f"{os.path.basename(str(metadata.get('source', '')))}:{metadata.get('page')}"
+
+
+def evaluate(retriever, queries, mode, ks, repeat, rerank):
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    latencies = []
+    for item in queries:
+        relevant = set(item["relevant"])
+        for _ in range(repeat):
+            started = time.perf_counter()
+            docs = retriever.search(item["query"], k=max_k, mode=mode, rerank=rerank)
+            latencies.append(time.perf_counter() - started)
+        labels = [doc_label(doc) for doc in docs]
+        for k in ks:
+            if relevant & set(labels[:k]):
+                hits[k] += 1
+    latencies.sort()
+    return {
+        "recall": {k: hits[k] / len(queries) for k in ks},
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(HERE, "retrieval", "queries.jsonl"))
+    parser.add_argument("--corpus", default=os.path.join(HERE, "retrieval", "corpus.jsonl"))
+    parser.add_argument("--db", help="existing Chroma + BM25 directory built by RAG_creation.py")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--rerank", action="store_true", help="use the cross-encoder from RAG_RERANKER_MODEL")
+    args = parser.parse_args()
+
+    queries = load_jsonl(args.queries)
+    with tempfile.TemporaryDirectory() as tmp:
+        store, bm25, db_path = build_from_db(args.db) if args.db else build_offline(args.corpus, tmp)
+        reranker = load_default_reranker() if args.rerank else None
+        retriever = HybridRetriever(store, bm25, reranker=reranker, db_path=db_path)
+
+        header = f"{'mode':<9}" + "".join(f"{f'recall@{k}':>11}" for k in args.k) + f"{'p50 ms':>9}{'p99 ms':>9}"
+        print(f"{len(queries)} queries, {args.repeat} runs each")
+        print(header)
+        for mode in MODES:
+            r = evaluate(retriever, queries, mode, args.k, args.repeat, rerank=bool(reranker))
+            recalls = "".join(f"{r['recall'][k]:>11.2f}" for k in args.k)
+            print(f"{mode:<9}{recalls}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+        bm25._conn.close()
+
+
+if __name__ == "__main__":
+    main()
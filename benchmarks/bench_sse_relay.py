@@ -0,0 +1,115 @@
+"""
+Microbenchmark: replay recorded ADK run_sse transcripts through the proxy's
+relay stage and compare against the original per-line json.loads/json.dumps loop.
+
+Usage:
+    python benchmarks/bench_sse_relay.py [--repeat 200] [--chunk-size 512] [transcript.sse ...]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sseRelay import SSERelay  # noqa: E402
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+
+def legacy_relay(chunks):
+    """The event_stream loop from main.py before the relay stage existed."""
+    out = []
+    buffer = ""
+    for raw in chunks:
+        buffer += raw.decode("utf-8")
+        *lines, buffer = buffer.split("\n")
+        for chunk in lines:
+            if not chunk or not chunk.startswith("data:"):
+                continue
+            try:
+                payload = json.loads(chunk[len("data:"):].strip())
+                parts = payload.get("content", {}).get("parts", [])
+                for part in parts:
+                    if "text" in part:
+                        out.append(json.dumps({"type": "text", "text": part["text"]}) + "\n\n")
+                    elif "functionCall" in part:
+                        fc = part["functionCall"]
+                        if fc.get("name") == "adk_request_confirmation":
+                            original_call = fc.get("args", {}).get("originalFunctionCall", {})
+                            tool_confirmation = fc.get("args", {}).get("toolConfirmation", {})
+                            out.append(json.dumps({
+                                "type": "tool_confirmation",
+                                "confirmation_id": fc.get("id"),
+                                "name": original_call.get("name"),
+                                "hint": tool_confirmation.get("hint"),
+                            }) + "\n\n")
+                        else:
+                            out.append(json.dumps({"type": "function_call", "name": fc.get("name")}) + "\n\n")
+                    elif "functionResponse" in part:
+                        out.append(json.dumps({"type": "function_response", "name": part["functionResponse"].get("name")}) + "\n\n")
+            except Exception as e:
+                print("Error parsing chunk:", e)
+    return "".join(out).encode("utf-8")
+
+
+def relay_engine(chunks):
+    relay = SSERelay()
+    out = bytearray()
+    for raw in chunks:
+        out += relay.feed(raw)
+    out += relay.close()
+    return bytes(out)
+
+
+def split_chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def measure(fn, chunks, repeat, events):
+    fn(chunks)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(chunks)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "events_per_sec": events * repeat / elapsed,
+        "peak_bytes_per_event": peak / events,
+        "frames_out": out.count(b"\n\n"),
+        "bytes_out": len(out),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("transcripts", nargs="*")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=512, help="simulated upstream read size in bytes")
+    args = parser.parse_args()
+
+    paths = args.transcripts or sorted(glob.glob(os.path.join(TRANSCRIPT_DIR, "*.sse")))
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        events = data.count(b"\ndata:") + data.startswith(b"data:")
+        chunks = split_chunks(data, args.chunk_size)
+
+        print(f"\n{os.path.basename(path)}: {events} upstream events, {len(data)} bytes, {len(chunks)} reads")
+        print(f"{'impl':<10}{'events/s':>14}{'peak B/event':>16}{'frames':>10}{'bytes out':>12}")
+        for name, fn in (("legacy", legacy_relay), ("relay", relay_engine)):
+            r = measure(fn, chunks, args.repeat, events)
+            print(f"{name:<10}{r['events_per_sec']:>14,.0f}{r['peak_bytes_per_event']:>16,.1f}{r['frames_out']:>10}{r['bytes_out']:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Stand-in ADK backend for load tests of the proxy.
+
+Implements the slice of the ADK API server the proxy uses: /list-apps, session
+create/get and /run_sse. Sessions are kept in process memory, like a single ADK
+node, so a turn routed to the wrong backend fails with 404 exactly as it would
+against real ADK. /run_sse waits --first-byte-delay, then streams --events
+partial text events --event-delay apart and a final event.
+
+With --transcript, /run_sse instead replays recorded run_sse event sequences
+(text, functionCall, adk_request_confirmation and functionResponse parts) in
+turn. Text deltas are paced at --tokens-per-second (about 4 characters per
+token) and the other events --tool-delay apart. A message that answers a tool
+confirmation replays --reply-transcript.
+
+With --workers N, N independent processes listen on --port, --port+1, ... and
+the matching ADK_BACKENDS value for the proxy is printed.
+
+Usage:
+    python benchmarks/fake_adk_server.py [--workers 4] [--port 8000] [--events 20]
+                                         [--event-delay 0.02] [--first-byte-delay 0.3]
+                                         [--transcript benchmarks/transcripts/x.sse ...]
+                                         [--tokens-per-second 50] [--tool-delay 0.2]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import Body, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+CHARS_PER_TOKEN = 4
+
+ANSWER = ("Employees accrue 24 days of paid annual leave per calendar year, and up to 5 unused days "
+          "may be carried forward (Source: hr_policy.pdf, Page 1). ")
+
+
+class Transcript:
+    """A recorded run_sse stream as (frame bytes, delay before it) pairs."""
+
+    def __init__(self, path: str, tokens_per_second: float, tool_delay: float):
+        self.name = os.path.basename(path)
+        self.frames = []
+        self.invocation_id = None
+        with open(path, "rb") as f:
+            raw = f.read().replace(b"\r\n", b"\n")
+        for block in raw.split(b"\n\n"):
+            block = block.strip()
+            if not block.startswith(b"data:"):
+                continue
+            event = json.loads(block[len(b"data:"):])
+            self.invocation_id = self.invocation_id or event.get("invocationId")
+            self.frames.append((block + b"\n\n", self._delay(event, tokens_per_second, tool_delay)))
+
+    @staticmethod
+    def _delay(event, tokens_per_second: float, tool_delay: float) -> float:
+        parts = (event.get("content") or {}).get("parts") or []
+        if not event.get("partial"):
+            # Final aggregated text repeats the deltas and arrives with the last one.
+            return 0.0 if all("text" in p for p in parts) else tool_delay
+        chars = sum(len(p.get("text") or "") for p in parts)
+        return max(1.0, chars / CHARS_PER_TOKEN) / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    async def replay(self):
+        invocation_id = f"e-{uuid.uuid4()}".encode()
+        old = self.invocation_id.encode() if self.invocation_id else None
+        for frame, delay in self.frames:
+            if delay:
+                await asyncio.sleep(delay)
+            yield frame.replace(old, invocation_id) if old else frame
+
+
+def _is_confirmation_reply(body: dict) -> bool:
+    parts = ((body.get("new_message") or {}).get("parts")) or []
+    return any((p.get("function_response") or {}).get("name") == "adk_request_confirmation" for p in parts)
+
+
+def create_app(name: str, events: int, event_delay: float, first_byte_delay: float,
+               transcripts=(), reply_transcript=None) -> FastAPI:
+    app = FastAPI()
+    turns = itertools.cycle(transcripts) if transcripts else None
+    sessions = {}  # (app, user, session) -> created_at
+    stats = {"runs": 0, "active": 0}
+
+    @app.get("/list-apps")
+    async def list_apps():
+        return ["agents"]
+
+    @app.post("/apps/{app_name}/users/{user_id}/sessions/{session_id}")
+    async def create_session(app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        if key in sessions:
+            raise HTTPException(status_code=409, detail="Session already exists")
+        sessions[key] = time.time()
+        return {"id": session_id, "appName": app_name, "userId": user_id, "state": {}, "events": []}
+
+    @app.get("/apps/{app_name}/users/{user_id}/sessions/{session_id}")
+    async def get_session(app_name: str, user_id: str, session_id: str):
+        if (app_name, user_id, session_id) not in sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return {"id": session_id, "appName": app_name, "userId": user_id, "state": {}, "events": []}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"backend": name, "sessions": len(sessions), **stats}
+
+    @app.post("/run_sse")
+    async def run_sse(body: dict = Body(...)):
+        if (body.get("app_name"), body.get("user_id"), body.get("session_id")) not in sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        transcript = None
+        if turns is not None:
+            transcript = reply_transcript if reply_transcript and _is_confirmation_reply(body) else next(turns)
+
+        async def stream():
+            stats["runs"] += 1
+            stats["active"] += 1
+            invocation_id = f"e-{uuid.uuid4()}"
+            try:
+                await asyncio.sleep(first_byte_delay)
+                if transcript is not None:
+                    async for frame in transcript.replay():
+                        yield frame
+                    return
+                words = (ANSWER * (1 + events // 10)).split(" ")
+                step = max(1, len(words) // max(1, events))
+                for i in range(events):
+                    text = " ".join(words[i * step:(i + 1) * step]) + " "
+                    yield _event(invocation_id, text, partial=True)
+                    await asyncio.sleep(event_delay)
+                yield _event(invocation_id, ANSWER, partial=False)
+            finally:
+                stats["active"] -= 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def _event(invocation_id: str, text: str, partial: bool) -> bytes:
+    event = {
+        "content": {"parts": [{"text": text}], "role": "model"},
+        "invocationId": invocation_id,
+        "author": "root_agent",
+        "actions": {"stateDelta": {}, "artifactDelta": {}, "requestedAuthConfigs": {}, "requestedToolConfirmations": {}},
+        "id": uuid.uuid4().hex[:8],
+        "timestamp": time.time(),
+    }
+    if partial:
+        event["partial"] = True
+    return f"data: {json.dumps(event)}\n\n".encode("utf-8")
+
+
+def load_transcripts(args):
+    transcripts = [Transcript(p, args.tokens_per_second, args.tool_delay) for p in args.transcript]
+    reply = None
+    if transcripts and args.reply_transcript:
+        reply = Transcript(args.reply_transcript, args.tokens_per_second, args.tool_delay)
+    return transcripts, reply
+
+
+def serve(port: int, args):
+    transcripts, reply = load_transcripts(args)
+    app = create_app(f"fake-adk-{port}", args.events, args.event_delay, args.first_byte_delay, transcripts, reply)
+    uvicorn.run(app, host=args.host, port=port, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--event-delay", type=float, default=0.02)
+    parser.add_argument("--first-byte-delay", type=float, default=0.3)
+    parser.add_argument("--transcript", action="append", default=[], help="recorded run_sse stream to replay (repeatable)")
+    parser.add_argument("--reply-transcript", default=os.path.join(TRANSCRIPT_DIR, "confirmation_reply.sse"),
+                        help="stream replayed for confirmation replies when --transcript is given")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="pace of replayed text deltas")
+    parser.add_argument("--tool-delay", type=float, default=0.2, help="pause before replayed tool events")
+    args = parser.parse_args()
+
+    ports = [args.port + i for i in range(args.workers)]
+    print("ADK_BACKENDS=" + ",".join(f"http://{args.host}:{p}" for p in ports))
+    if len(ports) == 1:
+        serve(ports[0], args)
+        return
+    processes = [multiprocessing.Process(target=serve, args=(port, args), daemon=True) for port in ports]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("PYTHONUNBUFFERED", "1")
+    main()
@@ -0,0 +1,282 @@
+"""
+Content-addressed cache for images uploaded through POST /upload.
+
+- The request body is streamed to a temporary file while it is hashed
+  (sha256), so an upload is never held in memory as one string. The MIME type
+  is read from the magic bytes, not taken from the client.
+- Images larger than IMAGE_MAX_DIMENSION pixels on a side are downscaled and
+  re-encoded when Pillow is installed; without it they are forwarded as they are.
+- Each image is stored once, under the hash of the uploaded bytes: recently
+  used blobs in memory (BLOB_MEMORY_MAX_BYTES) and all of them on disk under
+  BLOB_CACHE_DIR (BLOB_DISK_MAX_BYTES, least recently used files go first).
+  Chat turns reference an image by that hash (imageHash) instead of resending it.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import re
+import threading
+import uuid
+from typing import AsyncIterator, Optional
+
+import metrics
+from ttlCache import TTLCache
+
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "./blob_cache")
+BLOB_MEMORY_MAX_BYTES = int(os.getenv("BLOB_MEMORY_MAX_BYTES", str(64 * 2 ** 20)))
+BLOB_DISK_MAX_BYTES = int(os.getenv("BLOB_DISK_MAX_BYTES", str(2 * 2 ** 30)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 2 ** 20)))
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))  # 0 forwards images unchanged
+IMAGE_REENCODE_MIN_BYTES = int(os.getenv("IMAGE_REENCODE_MIN_BYTES", str(2 ** 20)))  # smaller images are never touched
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+UPLOADS = metrics.counter("blob_uploads_total", "Images uploaded through /upload")
+UPLOADS_DEDUPLICATED = metrics.counter("blob_uploads_deduplicated_total", "Uploads of an image that was already stored")
+UPLOAD_BYTES_SAVED = metrics.counter("blob_reencode_bytes_saved_total", "Bytes removed by downscaling uploaded images")
+UPLOAD_SECONDS = metrics.histogram("blob_upload_seconds", "Time to receive, hash and store one upload")
+MEMORY_HITS = metrics.counter("blob_memory_hits_total", "Image lookups answered from memory")
+DISK_READS = metrics.counter("blob_disk_reads_total", "Image lookups read from disk")
+
+_HASH = re.compile(r"^[0-9a-f]{64}$")
+_CHUNK_BYTES = 1 << 16
+_FLUSH_BYTES = 1 << 20  # received bytes hashed and written to the temporary file per worker-thread call
+
+# Magic bytes of the image types Gemini accepts.
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+_HEIF_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"heif": "image/heif"}
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """Image MIME type from the first bytes of a file, or None if it is not a supported image."""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return _HEIF_BRANDS.get(head[8:12])
+    return None
+
+
+def sniff_base64_mime_type(data: str) -> Optional[str]:
+    """sniff_mime_type for a base64 string, decoding only its first bytes."""
+    try:
+        return sniff_mime_type(base64.b64decode(data[:24]))
+    except ValueError:
+        return None
+
+
+def _write_chunks(f, digest, chunks):
+    for chunk in chunks:
+        digest.update(chunk)
+        f.write(chunk)
+
+
+def _remove_if_exists(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobRejected(Exception):
+    def __init__(self, status_code: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class Blob:
+    __slots__ = ("hash", "mime_type", "data", "uploaded_size")
+
+    def __init__(self, blob_hash: str, mime_type: str, data: bytes, uploaded_size: Optional[int] = None):
+        self.hash = blob_hash
+        self.mime_type = mime_type
+        self.data = data  # what is forwarded to ADK (possibly downscaled)
+        self.uploaded_size = uploaded_size if uploaded_size is not None else len(data)
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
+
+    def to_dict(self) -> dict:
+        return {"imageHash": self.hash, "mimeType": self.mime_type, "size": len(self.data), "uploadedSize": self.uploaded_size}
+
+
+def downscale(data: bytes, mime_type: str, max_dimension: int = IMAGE_MAX_DIMENSION):
+    """
+    Returns (data, mime_type) of the image shrunk to fit max_dimension, or the
+    input unchanged if it already fits, cannot be decoded, or Pillow is missing.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, mime_type
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= max_dimension or getattr(image, "is_animated", False):
+                return data, mime_type
+            image.thumbnail((max_dimension, max_dimension))
+            out = io.BytesIO()
+            if image.mode in ("RGBA", "LA", "P"):
+                image.save(out, format="PNG", optimize=True)
+                resized = out.getvalue(), "image/png"
+            else:
+                image.convert("RGB").save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY)
+                resized = out.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"Could not downscale uploaded image: {e!r}")
+        return data, mime_type
+    return resized if len(resized[0]) < len(data) else (data, mime_type)
+
+
+class BlobCache:
+    def __init__(
+        self,
+        directory: str = BLOB_CACHE_DIR,
+        memory_max_bytes: int = BLOB_MEMORY_MAX_BYTES,
+        disk_max_bytes: int = BLOB_DISK_MAX_BYTES,
+        max_upload_bytes: int = UPLOAD_MAX_BYTES,
+        max_dimension: int = IMAGE_MAX_DIMENSION,
+    ):
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.max_dimension = max_dimension
+        self._memory = TTLCache(max_entries=100000, max_bytes=memory_max_bytes, sizeof=lambda blob: len(blob.data))
+        self._uploaded_sizes = TTLCache(max_entries=100000)
+        self._disk_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._files())
+
+    def _path(self, blob_hash: str) -> str:
+        return os.path.join(self.directory, blob_hash[:2], blob_hash)
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> Blob:
+        """Stores an upload read from `chunks`. Raises BlobRejected (413 too large, 415 not an image)."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        tmp_path = os.path.join(self.directory, f"upload-{uuid.uuid4().hex}.tmp")
+        try:
+            # File I/O and hashing run in a worker thread, a batch of chunks at a time, off the event loop.
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                pending, pending_bytes = [], 0
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise BlobRejected(413, f"Image larger than {self.max_upload_bytes} bytes")
+                    if len(head) < 16:
+                        head += chunk[:16]
+                        if len(head) >= 16 and sniff_mime_type(head) is None:
+                            raise BlobRejected(415, "Not a supported image (PNG, JPEG, GIF, WEBP or HEIC)")
+                    pending.append(chunk)
+                    pending_bytes += len(chunk)
+                    if pending_bytes >= _FLUSH_BYTES:
+                        await asyncio.to_thread(_write_chunks, f, digest, pending)
+                        pending, pending_bytes = [], 0
+                if pending:
+                    await asyncio.to_thread(_write_chunks, f, digest, pending)
+            finally:
+                await asyncio.to_thread(f.close)
+            mime_type = sniff_mime_type(head)
+            if mime_type is None:
+                raise BlobRejected(415, "Not a supported image (PNG, JPEG, GIF, WEBP or HEIC)")
+
+            blob_hash = digest.hexdigest()
+            blob = await self.get(blob_hash)
+            if blob is not None:
+                UPLOADS_DEDUPLICATED.inc()
+            else:
+                blob = await asyncio.to_thread(self._store, blob_hash, mime_type, tmp_path, size)
+            UPLOADS.inc()
+            UPLOAD_SECONDS.observe(loop.time() - started)
+            return blob
+        finally:
+            await asyncio.to_thread(_remove_if_exists, tmp_path)
+
+    def _store(self, blob_hash: str, mime_type: str, tmp_path: str, size: int) -> Blob:
+        path = self._path(blob_hash)
+        if os.path.exists(path):  # a concurrent upload of the same image got there first
+            return self._read(blob_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "rb") as f:
+            data = f.read()
+        if self.max_dimension > 0 and size >= IMAGE_REENCODE_MIN_BYTES:
+            data, mime_type = downscale(data, mime_type, self.max_dimension)
+        if len(data) < size:
+            UPLOAD_BYTES_SAVED.inc(size - len(data))
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+        blob = Blob(blob_hash, mime_type, data, size)
+        self._memory.set(blob_hash, blob)
+        self._uploaded_sizes.set(blob_hash, size)
+        with self._disk_lock:
+            self._disk_bytes += len(data)
+        self._prune()
+        return blob
+
+    async def get(self, blob_hash: str) -> Optional[Blob]:
+        """The stored image for `blob_hash`, or None if it was never uploaded (or has been evicted)."""
+        if not blob_hash or not _HASH.match(blob_hash):
+            return None
+        blob = self._memory.get(blob_hash)
+        if blob is not None:
+            MEMORY_HITS.inc()
+            return blob
+        return await asyncio.to_thread(self._read, blob_hash)
+
+    def _read(self, blob_hash: str) -> Optional[Blob]:
+        path = self._path(blob_hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # keeps the file at the recent end of the disk LRU
+        except FileNotFoundError:
+            return None
+        DISK_READS.inc()
+        blob = Blob(blob_hash, sniff_mime_type(data[:16]) or "application/octet-stream", data,
+                    self._uploaded_sizes.get(blob_hash))
+        self._memory.set(blob_hash, blob)
+        return blob
+
+    def _files(self):
+        """(path, size, mtime) of every stored blob."""
+        for sub in os.scandir(self.directory):
+            if sub.is_dir():
+                for entry in os.scandir(sub.path):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _prune(self):
+        with self._disk_lock:
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+            for path, size, _ in sorted(self._files(), key=lambda item: item[2]):
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._disk_bytes -= size
+                self._memory.pop(os.path.basename(path))
+
+    def stats(self) -> dict:
+        return {
+            "memory_blobs": len(self._memory),
+            "memory_bytes": self._memory.size_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
@@ -0,0 +1,180 @@
+"""
+Persistent BM25 inverted index over the RAG chunks.
+
+Kept next to the Chroma store and updated by RagVectorDB in the same pass
+that adds or deletes chunks, using the same chunk ids, so lexical and vector
+results can be fused. Tokens keep identifiers such as "HR-104" or "v2.3" whole
+(and also index their parts), which is what exact-term queries need.
+
+Queries skip stopwords and terms found in more than BM25_MAX_DF_RATIO of the
+chunks (their IDF is close to zero), and read at most BM25_MAX_POSTINGS
+postings per term, highest term frequency first, so common words never scan
+the whole index. Document frequencies are kept in their own table.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+BM25_FILE = "bm25.sqlite"
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))  # query terms in more chunks than this are skipped
+BM25_MAX_POSTINGS = int(os.getenv("BM25_MAX_POSTINGS", "5000"))  # postings read per query term
+
+BM25_STOPWORDS = frozenset(
+    "a about an and any are as at be been but by can could did do does for from had has have how i if in into "
+    "is it its me my no not of on or our please should so tell than that the their them then there these they "
+    "this those to us was we were what when where which who why will with would you your".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if _SPLIT.search(token):
+            tokens.extend(part for part in _SPLIT.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, db_path: str, k1: float = BM25_K1, b: float = BM25_B):
+        os.makedirs(db_path, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(db_path, BM25_FILE), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+        # Lets a query read a term's top BM25_MAX_POSTINGS postings without sorting all of them.
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_term_tf ON postings (term, tf DESC)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+        self._stats: Optional[Tuple[int, float]] = None
+        self._build_terms_if_missing()
+
+    def __len__(self) -> int:
+        return self._collection_stats()[0]
+
+    # --- writes ---
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict]):
+        docs, postings = [], []
+        for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+            counts = Counter(tokenize(text))
+            docs.append((chunk_id, sum(counts.values()), text, json.dumps(metadata or {})))
+            postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete_locked(chunk_ids)
+            self._conn.executemany("INSERT INTO docs (chunk_id, length, text, metadata) VALUES (?, ?, ?, ?)", docs)
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                [(term,) for term, _, _ in postings],
+            )
+            self._conn.execute("COMMIT")
+            self._stats = None
+
+    def delete(self, chunk_ids: Sequence[str]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete_locked(chunk_ids)
+            self._conn.execute("COMMIT")
+            self._stats = None
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._stats = None
+
+    def refresh(self):
+        """Forgets cached collection statistics (call after another process changed the index)."""
+        self._stats = None
+
+    def _delete_locked(self, chunk_ids: Sequence[str]):
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        for (chunk_id,) in rows:
+            self._conn.execute(
+                "UPDATE terms SET df = df - 1 WHERE term IN (SELECT term FROM postings WHERE chunk_id = ?)", (chunk_id,)
+            )
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+        self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", rows)
+
+    # --- reads ---
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, bm25 score), best first."""
+        tokens = set(tokenize(query))
+        terms = (tokens - BM25_STOPWORDS) or tokens  # a query made only of stopwords ("the who") keeps them
+        if not terms:
+            return []
+        n_docs, avg_len = self._collection_stats()
+        if not n_docs:
+            return []
+
+        scores: Dict[str, float] = {}
+        with self._lock:
+            df = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", list(terms)
+            ).fetchall())
+            selected = [term for term in df if df[term] <= BM25_MAX_DF_RATIO * n_docs]
+            if not selected and df:
+                selected = [min(df, key=df.get)]  # every term is common: score by the rarest one
+            for term in selected:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM "
+                    "(SELECT chunk_id, tf FROM postings WHERE term = ? ORDER BY tf DESC LIMIT ?) p "
+                    "JOIN docs d ON d.chunk_id = p.chunk_id",
+                    (term, BM25_MAX_POSTINGS),
+                ).fetchall()
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get(self, chunk_ids: Sequence[str]) -> Dict[str, Tuple[str, Dict]]:
+        """chunk_id -> (text, metadata) for the ids that exist."""
+        if not chunk_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, text, metadata FROM docs WHERE chunk_id IN ({','.join('?' * len(chunk_ids))})",
+                list(chunk_ids),
+            ).fetchall()
+        return {chunk_id: (text, json.loads(metadata)) for chunk_id, text, metadata in rows}
+
+    def _build_terms_if_missing(self):
+        """Indexes written before the terms table existed get their document frequencies once."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM terms LIMIT 1").fetchone() is not None:
+                return
+            if self._conn.execute("SELECT 1 FROM postings LIMIT 1").fetchone() is None:
+                return
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR REPLACE INTO terms (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+            self._conn.execute("COMMIT")
+
+    def _collection_stats(self) -> Tuple[int, float]:
+        if self._stats is None:
+            with self._lock:
+                count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            self._stats = (count, (total / count) if total else 1.0)
+        return self._stats
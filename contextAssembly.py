@@ -0,0 +1,226 @@
+"""
+Token-budgeted context assembly for ChatContextManager.
+
+Recent turns, retrieved memories and summaries are merged into one prompt
+section that fits a token budget:
+- Overlapping splits of one stored message (same message_id) are stitched
+  back into a single item, and memories already contained in a recent turn
+  or in another item are dropped.
+- Items are ranked by reciprocal rank fusion of their retrieval rank and
+  their recency rank (as in hybridRetriever). The newest CONTEXT_MIN_RECENT
+  turns are always packed first, and an item that does not fit is truncated
+  if enough of the budget is left.
+- Tokens are counted with tiktoken when it is installed (estimate_tokens).
+
+The result reports the tokens used and the tokens saved compared with
+sending every candidate unchanged.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metrics
+from embeddingService import estimate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MIN_RECENT = int(os.getenv("CONTEXT_MIN_RECENT", "2"))  # newest turns kept ahead of everything else
+CONTEXT_RELEVANCE_WEIGHT = float(os.getenv("CONTEXT_RELEVANCE_WEIGHT", "1.0"))
+CONTEXT_RECENCY_WEIGHT = float(os.getenv("CONTEXT_RECENCY_WEIGHT", "0.5"))
+CONTEXT_RRF_K = int(os.getenv("CONTEXT_RRF_K", "60"))
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "64"))  # smaller leftovers are not worth a cut item
+
+_TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+CONTEXT_TOKENS = metrics.histogram("context_prompt_tokens", "Tokens of assembled conversation context per turn", buckets=_TOKEN_BUCKETS)
+CONTEXT_TOKENS_SAVED = metrics.histogram("context_tokens_saved", "Tokens removed from one turn's context by dedup and budgeting", buckets=_TOKEN_BUCKETS)
+CONTEXT_TOKENS_SAVED_TOTAL = metrics.counter("context_tokens_saved_total", "Tokens removed from conversation context by dedup and budgeting")
+
+_WHITESPACE = re.compile(r"\s+")
+_ELLIPSIS = " …"
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+class ContextItem:
+    __slots__ = ("text", "role", "source", "created_at", "relevance_rank", "recency_rank", "tokens", "score")
+
+    def __init__(self, text: str, role: str, source: str, created_at: Optional[float] = None,
+                 relevance_rank: Optional[int] = None):
+        self.text = text
+        self.role = role
+        self.source = source  # "recent" | "memory" | "summary"
+        self.created_at = created_at
+        self.relevance_rank = relevance_rank  # 1-based position in the similarity search, None if not retrieved
+        self.recency_rank: Optional[int] = None
+        self.tokens = 0
+        self.score = 0.0
+
+
+class AssembledContext:
+    def __init__(self, text: str, tokens: int, candidate_tokens: int, items: List[ContextItem], deduplicated: int,
+                 truncated: int, dropped: int):
+        self.text = text
+        self.tokens = tokens
+        self.candidate_tokens = candidate_tokens  # what joining every recent turn and hit unchanged would cost
+        self.items = items
+        self.deduplicated = deduplicated
+        self.truncated = truncated
+        self.dropped = dropped
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.candidate_tokens - self.tokens)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def stats(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "candidate_tokens": self.candidate_tokens,
+            "tokens_saved": self.tokens_saved,
+            "items": len(self.items),
+            "deduplicated": self.deduplicated,
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+        }
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text (at a word boundary) to at most max_tokens tokens, marking the cut."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = text
+    while cut:
+        cut = cut[:max(0, int(len(cut) * max_tokens / max(tokens, 1) * 0.95))]
+        cut = cut.rsplit(" ", 1)[0] if " " in cut else cut
+        tokens = estimate_tokens(cut + _ELLIPSIS)
+        if tokens <= max_tokens:
+            return cut + _ELLIPSIS
+    return ""
+
+
+def _stitch(a: str, b: str, max_overlap: int) -> str:
+    """Joins two consecutive splits of one text, removing the overlap the splitter repeated."""
+    for size in range(min(len(a), len(b), max_overlap), 0, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+    return f"{a} {b}"
+
+
+def merge_chunks(docs: Sequence, max_overlap: int = 200) -> List[ContextItem]:
+    """
+    Turns similarity-search results (best first) into memory items: splits of
+    one message are stitched in chunk order and ranked by their best split.
+    Documents without a message_id (stored before it existed) stay separate.
+    """
+    groups: Dict[str, List] = {}
+    order: List[str] = []
+    for rank, doc in enumerate(docs, start=1):
+        metadata = doc.metadata or {}
+        key = metadata.get("message_id") or f"doc:{rank}"
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((metadata.get("chunk_index", 0), rank, doc))
+
+    items = []
+    for key in order:
+        chunks = sorted(groups[key], key=lambda c: c[0])
+        text = chunks[0][2].page_content
+        for (previous_index, _, _), (index, _, doc) in zip(chunks, chunks[1:]):
+            text = _stitch(text, doc.page_content, max_overlap) if index == previous_index + 1 else f"{text}{_ELLIPSIS} {doc.page_content}"
+        metadata = chunks[0][2].metadata or {}
+        role = metadata.get("role") or "memory"
+        items.append(ContextItem(
+            text, role, "summary" if role == "summary" else "memory",
+            created_at=metadata.get("created_at"), relevance_rank=min(rank for _, rank, _ in chunks),
+        ))
+    return items
+
+
+def _deduplicate(recent: List[ContextItem], memories: List[ContextItem]) -> Tuple[List[ContextItem], int]:
+    """Drops memories repeated by a recent turn or contained in a longer item; the keeper inherits the better rank."""
+    kept: List[ContextItem] = []
+    removed = 0
+    normalized = {id(item): _normalize(item.text) for item in recent + memories}
+    for memory in sorted(memories, key=lambda m: -len(normalized[id(m)])):
+        text = normalized[id(memory)]
+        holder = next((other for other in recent + kept if text in normalized[id(other)]), None)
+        if holder is None:
+            kept.append(memory)
+            continue
+        removed += 1
+        if memory.relevance_rank is not None and (holder.relevance_rank is None or memory.relevance_rank < holder.relevance_rank):
+            holder.relevance_rank = memory.relevance_rank
+    kept.sort(key=lambda m: m.relevance_rank or 0)
+    return kept, removed
+
+
+def _rank(recent: List[ContextItem], memories: List[ContextItem]):
+    """Scores items by reciprocal rank fusion of relevance and recency (recent turns are the newest)."""
+    newest_first = recent[::-1] + sorted(memories, key=lambda i: i.created_at or 0.0, reverse=True)
+    for rank, item in enumerate(newest_first, start=1):
+        item.recency_rank = rank
+        item.score = CONTEXT_RECENCY_WEIGHT / (CONTEXT_RRF_K + rank)
+        if item.relevance_rank is not None:
+            item.score += CONTEXT_RELEVANCE_WEIGHT / (CONTEXT_RRF_K + item.relevance_rank)
+
+
+def _render(item: ContextItem) -> str:
+    return f"{item.role}: {item.text}"
+
+
+def assemble_context(
+    recent_messages: Sequence[Dict[str, str]],
+    retrieved_docs: Sequence,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    min_recent: int = CONTEXT_MIN_RECENT,
+) -> AssembledContext:
+    """
+    recent_messages: history store messages ({"role", "message"}), oldest first
+    retrieved_docs:  similarity-search Documents (best first) with role,
+                     created_at and, for newer documents, message_id / chunk_index metadata
+    """
+    candidate_tokens = sum(estimate_tokens(f"{m['role']}: {m['message']}") for m in recent_messages)
+    candidate_tokens += sum(estimate_tokens(f"{(d.metadata or {}).get('role')}: {d.page_content}") for d in retrieved_docs)
+
+    recent = [ContextItem(m["message"], m["role"], "recent") for m in recent_messages]
+    memories, deduplicated = _deduplicate(recent, merge_chunks(retrieved_docs))
+    candidates = recent + memories
+    for item in candidates:
+        item.tokens = estimate_tokens(_render(item))
+    _rank(recent, memories)
+
+    forced = recent[-min_recent:] if min_recent > 0 else []
+    ordered = forced[::-1] + sorted((i for i in candidates if i not in forced), key=lambda i: i.score, reverse=True)
+    selected: List[ContextItem] = []
+    used = 0
+    truncated = 0
+    for item in ordered:
+        left = token_budget - used
+        if item.tokens <= left:
+            selected.append(item)
+            used += item.tokens
+        elif left >= CONTEXT_MIN_TRUNCATED_TOKENS:
+            prefix = f"{item.role}: "
+            text = truncate_to_tokens(item.text, left - estimate_tokens(prefix))
+            if text:
+                item.text = text
+                item.tokens = estimate_tokens(_render(item))
+                selected.append(item)
+                used += item.tokens
+                truncated += 1
+
+    # Summaries first, then memories oldest first, then the conversation in order.
+    section = {"summary": 0, "memory": 1, "recent": 2}
+    selected.sort(key=lambda i: (section[i.source], -i.recency_rank))
+    text = "\n".join(_render(item) for item in selected)
+    result = AssembledContext(text, used, candidate_tokens, selected, deduplicated, truncated,
+                              len(candidates) - len(selected))
+    CONTEXT_TOKENS.observe(result.tokens)
+    CONTEXT_TOKENS_SAVED.observe(result.tokens_saved)
+    CONTEXT_TOKENS_SAVED_TOTAL.inc(result.tokens_saved)
+    return result
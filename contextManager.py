@@ -2,35 +2,124 @@
 # pip install chromadb openai langchain
 
 from typing import List, Dict
-from langchain_openai import AzureOpenAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import contextvars
 from langchain_openai import AzureChatOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain.schema import HumanMessage, SystemMessage
 
-from collections import defaultdict, deque
+import sqlite3
+import threading
+import time
+import uuid
 
 from dotenv import load_dotenv
 load_dotenv()
 import os
 
+import tracing
+from contextAssembly import CONTEXT_TOKEN_BUDGET, AssembledContext, assemble_context
+from embeddingService import get_embedding_service
+from historyStore import create_history_store
+from summarizationWorker import SummarizationWorker
+
 MAX_DOCS_PER_USER = 20
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 MAX_RECENT_HISTORY=10
+MESSAGE_ROLES = ("user", "ai_response")
+CHROMA_THREADS = int(os.getenv("CONTEXT_CHROMA_THREADS", "8"))  # bounded pool for blocking Chroma/SQLite work in the async API
+DELETE_BATCH_SIZE = 5000
+BACKFILL_BATCH_SIZE = 5000  # documents read per page when the user index is first built
+
+
+async def _discard(task: asyncio.Future):
+    """Cancels a helper task whose result is no longer needed and collects its outcome."""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class UserDocIndex:
+    """
+    Sidecar index of user_id -> Chroma document ids, stored next to the vector DB.
+    Counting, listing and deleting a user's documents touch only that user's rows
+    instead of searching the shared collection. Documents written before the
+    index existed are added once by a backfill, recorded in the meta table.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_docs ("
+            "doc_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, role TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS user_docs_user ON user_docs (user_id, created_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def add(self, user_id: str, doc_ids: List[str], role: str, created_at: float):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO user_docs (doc_id, user_id, role, created_at) VALUES (?, ?, ?, ?)",
+                [(doc_id, user_id, role, created_at) for doc_id in doc_ids],
+            )
+
+    def add_existing(self, rows: List[tuple]):
+        """Records (doc_id, user_id, role, created_at) rows found by the backfill; indexed documents are kept as they are."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO user_docs (doc_id, user_id, role, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def backfilled(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone() is not None
+
+    def mark_backfilled(self):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+
+    def count(self, user_id: str, roles=None) -> int:
+        sql, params = self._where(user_id, roles)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM user_docs WHERE {sql}", params).fetchone()[0]
+
+    def ids(self, user_id: str, roles=None) -> List[str]:
+        """Document ids for the user, oldest first."""
+        sql, params = self._where(user_id, roles)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT doc_id FROM user_docs WHERE {sql} ORDER BY created_at", params)
+            return [row[0] for row in rows]
+
+    def remove(self, doc_ids: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM user_docs WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+
+    @staticmethod
+    def _where(user_id: str, roles):
+        if not roles:
+            return "user_id = ?", [user_id]
+        return f"user_id = ? AND role IN ({','.join('?' * len(roles))})", [user_id, *roles]
+
 
 class ChatContextManager:
-    def __init__(self, persist_directory: str = "./chroma_store"):
+    def __init__(self, persist_directory: str = "./chroma_store", background_summarization: bool = True, history_store=None):
         """
         api_key: OpenAI API key
         persist_directory: path to save/load vector DB locally
+        background_summarization: summarize on a worker thread instead of inside add_* calls
+        history_store: recent-message store (see historyStore.py); defaults to HISTORY_BACKEND
         """
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.deployment=os.getenv("AZURE_OPENAI_ENDPOINT")
         self.api_version=os.getenv("AZURE_OPENAI_API_VERSION")
         
-        # LangChain Embedding Model
-        self.embedding_model = AzureOpenAIEmbeddings(azure_deployment="text-embedding-ada-002")
+        # Shared embedding service (batched + cached, LangChain Embeddings compatible)
+        self.embedding_model = get_embedding_service()
         
         # LangChain LLM Model for summarization
         self.llm = AzureChatOpenAI(azure_deployment=self.deployment,api_version="2024-05-01-preview")
@@ -54,9 +143,44 @@ class ChatContextManager:
                 persist_directory=self.persist_directory
             )
 
+        os.makedirs(self.persist_directory, exist_ok=True)
+        self.user_index = UserDocIndex(os.path.join(self.persist_directory, "user_index.sqlite"))
+        self._backfill_user_index()
+
+        self.summarizer = SummarizationWorker(self._check_and_summarize) if background_summarization else None
+
+        # Blocking Chroma/SQLite calls made from the async API run here, never on the event loop.
+        self._executor = ThreadPoolExecutor(max_workers=CHROMA_THREADS, thread_name_prefix="context-chroma")
       
-        self.user_history = defaultdict(lambda: deque(maxlen=MAX_RECENT_HISTORY)) 
+        if history_store is None:
+            history_store = create_history_store(max_messages=MAX_RECENT_HISTORY)
+        self.user_history = history_store
     
+    def _backfill_user_index(self):
+        """
+        One-time migration: adds documents written before the user index existed
+        (they carry user_id metadata but no created_at) to it, so that later
+        deletes never have to filter the shared collection by metadata.
+        """
+        if self.user_index.backfilled():
+            return
+        found = 0
+        offset = 0
+        while True:
+            page = self.vector_db.get(include=["metadatas"], limit=BACKFILL_BATCH_SIZE, offset=offset)
+            rows = [
+                (doc_id, metadata["user_id"], metadata.get("role") or "", metadata.get("created_at") or 0.0)
+                for doc_id, metadata in zip(page["ids"], page["metadatas"])
+                if metadata and metadata.get("user_id")
+            ]
+            self.user_index.add_existing(rows)
+            found += len(rows)
+            if len(page["ids"]) < BACKFILL_BATCH_SIZE:
+                break
+            offset += BACKFILL_BATCH_SIZE
+        self.user_index.mark_backfilled()
+        print(f"User index backfilled from the vector DB ({found} documents).")
+
     def _llm_summarize(self, messages: List[str]) -> str:
         if not messages:
             return ""
@@ -66,57 +190,145 @@ class ChatContextManager:
         summary = self.llm([system_msg, human_msg]).content.strip()
         return summary
     
+    async def _allm_summarize(self, messages: List[str]) -> str:
+        if not messages:
+            return ""
+        combined_text = "\n".join(messages)
+        system_msg = SystemMessage(content="You are a helpful assistant that summarizes conversations concisely.")
+        human_msg = HumanMessage(content=f"Summarize the following conversation:\n{combined_text}")
+        summary = (await self.llm.ainvoke([system_msg, human_msg])).content.strip()
+        return summary
+
+    async def _run_blocking(self, fn, *args, **kwargs):
+        # The copied context keeps spans opened in the worker inside the caller's trace.
+        call = partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    @staticmethod
+    def _metadatas(user_id: str, texts: List[str], role: str, created_at: float) -> List[Dict]:
+        # The splits of one message share a message_id, so context assembly can stitch them back together.
+        message_id = uuid.uuid4().hex
+        return [
+            {"user_id": user_id, "role": role, "created_at": created_at, "message_id": message_id, "chunk_index": i}
+            for i in range(len(texts))
+        ]
+
+    def _add_texts(self, user_id: str, texts: List[str], role: str) -> List[str]:
+        """Adds the splits of one message for a user in one batched call and records their ids in the user index."""
+        if not texts:
+            return []
+        created_at = time.time()
+        ids = [uuid.uuid4().hex for _ in texts]
+        self.vector_db.add_texts(
+            texts=texts,
+            metadatas=self._metadatas(user_id, texts, role, created_at),
+            ids=ids
+        )
+        self.user_index.add(user_id, ids, role, created_at)
+        return ids
+
+    async def _aadd_texts(self, user_id: str, texts: List[str], role: str) -> List[str]:
+        """Async _add_texts: the vector store's public add_texts (embedding included) runs in the thread pool."""
+        if not texts:
+            return []
+        return await self._run_blocking(self._add_texts, user_id, texts, role)
+
+    def _delete_ids(self, ids: List[str]):
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.vector_db.delete(ids=ids[start:start + DELETE_BATCH_SIZE])
+        self.user_index.remove(ids)
+
+    def _needs_summary(self, user_id: str) -> bool:
+        return self.user_index.count(user_id, MESSAGE_ROLES) > MAX_DOCS_PER_USER
+
+    def _schedule_summary(self, user_id: str):
+        if not self._needs_summary(user_id):
+            return
+        if self.summarizer is not None:
+            self.summarizer.submit(user_id)
+        else:
+            self._check_and_summarize(user_id)
+
+    async def _aschedule_summary(self, user_id: str):
+        if not await self._run_blocking(self._needs_summary, user_id):
+            return
+        if self.summarizer is not None:
+            self.summarizer.submit(user_id)
+        else:
+            await self._acheck_and_summarize(user_id)
+
+    @tracing.traced("context.summarize")
+    async def _acheck_and_summarize(self, user_id: str):
+        ids = await self._run_blocking(self.user_index.ids, user_id, MESSAGE_ROLES)
+        if len(ids) <= MAX_DOCS_PER_USER:
+            return
+        fetched = await self._run_blocking(self.vector_db.get, ids=ids)
+        by_id = dict(zip(fetched["ids"], fetched["documents"]))
+        old_messages = [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+        summary_text = await self._allm_summarize(old_messages)
+        if not summary_text and old_messages:
+            print(f"Empty summary for user_id '{user_id}', keeping the original messages.")
+            return
+        await self._aadd_texts(user_id, self.text_splitter.split_text(summary_text), "summary")
+        await self._run_blocking(self._delete_ids, ids)
+
+    @tracing.traced("context.summarize")
     def _check_and_summarize(self, user_id: str):
         """Summarize old messages if docs exceed threshold."""
-        # Fetch all messages for the user
-        results = self.vector_db.similarity_search("", k=30, filter={"user_id": user_id})
-        
-        if len(results) > MAX_DOCS_PER_USER:
-            # Extract messages from Chroma Documents
-            old_messages = [doc.page_content for doc in results if doc.metadata.get("role") in ["user", "ai_response"]]
-            
-            # Summarize
-            summary_text = self._llm_summarize(old_messages)
-            
-            # Delete old messages
-            for doc in results:
-                if doc.metadata.get("role") in ["user", "ai_response"]:
-                    self.vector_db.delete(ids=[doc.metadata.get("id")])
-            
-            # Add summary
-            chunks = self.text_splitter.split_text(summary_text)
-            metadatas = [{"user_id": user_id, "role": "summary"} for _ in chunks]
-            self.vector_db.add_texts(texts=chunks, metadatas=metadatas)
-            # self.vector_db.persist()
-            
-       
+        if not self._needs_summary(user_id):
+            return
+
+        # Fetch exactly this user's messages, oldest first
+        ids = self.user_index.ids(user_id, MESSAGE_ROLES)
+        fetched = self.vector_db.get(ids=ids)
+        by_id = dict(zip(fetched["ids"], fetched["documents"]))
+        old_messages = [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+        # Summarize; an empty summary would lose the history, so the messages are kept
+        # (ids whose documents are already gone are still cleaned up)
+        summary_text = self._llm_summarize(old_messages)
+        if not summary_text and old_messages:
+            print(f"Empty summary for user_id '{user_id}', keeping the original messages.")
+            return
+
+        # Add summary, then delete the summarized messages in bulk. Messages added
+        # while the LLM was running are not in `ids` and are kept.
+        self._add_texts(user_id, self.text_splitter.split_text(summary_text), "summary")
+        self._delete_ids(ids)
     
+    @tracing.traced("context.add_user_message")
     def add_user_message(self, user_id: str, message: str):
         # Add user message
-        self.vector_db.add_texts(
-            texts=[message],
-            metadatas=[{"user_id": user_id, "role": "user"}]
-        )
+        self._add_texts(user_id, [message], "user")
 
-        self.user_history[user_id].append({"role": 'user', "message": message})
+        self.user_history.append(user_id, 'user', message)
 
         # self.vector_db.persist()
-        self._check_and_summarize(user_id)
+        self._schedule_summary(user_id)
     
+    @tracing.traced("context.add_ai_response")
     def add_ai_response(self, user_id: str, message: str):
-        # Chunk AI response
-        chunks = self.text_splitter.split_text(message)
-        for chunk in chunks:
-            self.vector_db.add_texts(
-                texts=[chunk],
-                metadatas=[{"user_id": user_id, "role": "ai_response"}]
-            )
+        # Chunk AI response and embed all chunks in one batched call
+        self._add_texts(user_id, self.text_splitter.split_text(message), "ai_response")
 
-        self.user_history[user_id].append({"role": 'ai', "message": message})
+        self.user_history.append(user_id, 'ai', message)
 
         # self.vector_db.persist()
-        self._check_and_summarize(user_id)
+        self._schedule_summary(user_id)
     
+    @tracing.traced("context.add_user_message")
+    async def aadd_user_message(self, user_id: str, message: str):
+        await self._aadd_texts(user_id, [message], "user")
+        await self._run_blocking(self.user_history.append, user_id, 'user', message)
+        await self._aschedule_summary(user_id)
+
+    @tracing.traced("context.add_ai_response")
+    async def aadd_ai_response(self, user_id: str, message: str):
+        await self._aadd_texts(user_id, self.text_splitter.split_text(message), "ai_response")
+        await self._run_blocking(self.user_history.append, user_id, 'ai', message)
+        await self._aschedule_summary(user_id)
+
+    @tracing.traced("context.get_context")
     def get_context(self, user_id: str, query: str, top_k: int = 5) -> str:
         results = self.vector_db.similarity_search(query, k=top_k, filter={"user_id": user_id})
         
@@ -124,42 +336,95 @@ class ChatContextManager:
         return context_text
 
     
+    @tracing.traced("context.get_context")
+    async def aget_context(self, user_id: str, query: str, top_k: int = 5, recent_n: int = 0) -> str:
+        """
+        Async get_context. The query is embedded while recent history (if
+        recent_n > 0) is fetched, and the two are returned together.
+        """
+        embed_task = asyncio.ensure_future(self.embedding_model.aembed_query(query))
+        try:
+            recent = await self.aget_recent_conversation(user_id, recent_n) if recent_n > 0 else None
+            embedding = await embed_task
+        except BaseException:
+            await _discard(embed_task)
+            raise
+
+        results = await self._run_blocking(
+            self.vector_db.similarity_search_by_vector, embedding, k=top_k, filter={"user_id": user_id}
+        )
+        context_text = "\n".join([f"{doc.metadata.get('role')}: {doc.page_content}" for doc in results])
+        if recent is None:
+            return context_text
+        return f"{recent}\n{context_text}" if context_text else recent
+
+    @tracing.traced("context.assemble")
+    def assemble_context(self, user_id: str, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                         top_k: int = 10, recent_n: int = MAX_RECENT_HISTORY) -> AssembledContext:
+        """
+        Recent turns, retrieved memories and summaries for `query`, deduplicated,
+        ranked and packed into `token_budget` tokens (see contextAssembly.py).
+        str(result) is the prompt text; result.stats() reports the tokens saved.
+        """
+        history = self.user_history.recent(user_id, recent_n)
+        results = self.vector_db.similarity_search(query, k=top_k, filter={"user_id": user_id})
+        assembled = assemble_context(history, results, token_budget)
+        tracing.annotate(**assembled.stats())
+        return assembled
+
+    @tracing.traced("context.assemble")
+    async def aassemble_context(self, user_id: str, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                                top_k: int = 10, recent_n: int = MAX_RECENT_HISTORY) -> AssembledContext:
+        """Async assemble_context; the query is embedded while recent history is fetched."""
+        embed_task = asyncio.ensure_future(self.embedding_model.aembed_query(query))
+        try:
+            history = await self._run_blocking(self.user_history.recent, user_id, recent_n)
+            embedding = await embed_task
+        except BaseException:
+            await _discard(embed_task)
+            raise
+        results = await self._run_blocking(
+            self.vector_db.similarity_search_by_vector, embedding, k=top_k, filter={"user_id": user_id}
+        )
+        assembled = assemble_context(history, results, token_budget)
+        tracing.annotate(**assembled.stats())
+        return assembled
+
+    @tracing.traced("context.get_recent_conversation")
     def get_recent_conversation(self, user_id: str, n: int = 5):
         """
         Returns the last n messages for the user in order.
         """
-        history = self.user_history.get(user_id, [])
+        history = self.user_history.recent(user_id, n)
         if not history:
             return "No history found"
-        return "\n".join([f"{msg['role']}: {msg['message']}" for msg in history[-n:]])
+        return "\n".join([f"{msg['role']}: {msg['message']}" for msg in history])
 
 
     
+    async def aget_recent_conversation(self, user_id: str, n: int = 5):
+        return await self._run_blocking(self.get_recent_conversation, user_id, n)
+
+    async def adelete_user_data(self, user_id: str):
+        await self._run_blocking(self.delete_user_data, user_id)
+
+    @tracing.traced("context.delete_user_data")
     def delete_user_data(self, user_id: str):
         """
         Delete all documents associated with a specific user_id from the vector DB.
         """
-        # Fetch all documents for the user
-        results = self.vector_db.similarity_search("", k=25)  # fetch all docs
-        ids_to_delete = []
-
-        for doc in results:
-            metadata = doc.metadata
-            if metadata.get("user_id") == user_id:
-                # Use Chroma's internal ID if available
-                if hasattr(doc, "id") and doc.id is not None:
-                    ids_to_delete.append(doc.id)
-                else:
-                    # Some Chroma versions store doc_id in metadata manually
-                    doc_id = metadata.get("doc_id") or metadata.get("id")
-                    if doc_id:
-                        ids_to_delete.append(doc_id)
+        self.user_history.delete(user_id)
+        # The user index covers older documents too (see _backfill_user_index).
+        ids_to_delete = self.user_index.ids(user_id)
 
         if ids_to_delete:
-            self.vector_db.delete(ids=ids_to_delete)
+            self._delete_ids(ids_to_delete)
             print(f"Deleted {len(ids_to_delete)} documents for user_id '{user_id}'.")
         else:
             print(f"No documents found for user_id '{user_id}'.")
 
-
-
+    def close(self):
+        """Stops the background summarization worker."""
+        if self.summarizer is not None:
+            self.summarizer.stop()
+        self._executor.shutdown(wait=False)
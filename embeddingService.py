@@ -0,0 +1,292 @@
+"""
+Shared embedding service used by RAG ingestion, the RAG retriever and ChatContextManager.
+
+- Texts are de-duplicated and looked up in an on-disk cache keyed by a hash
+  of (model, text), so a chunk or message is never embedded twice.
+- Cache misses are packed into batches bounded by item count and estimated
+  tokens, and the batches run concurrently under a requests/tokens-per-minute budget.
+- EMBEDDING_BACKEND=local swaps Azure for a deterministic hashing embedder,
+  so tests and benchmarks run offline.
+
+The service is a drop-in LangChain `Embeddings` (embed_documents / embed_query
+and their async variants) and can be passed to Chroma directly.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+import metrics
+import tracing
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:  # offline benchmarks do not need LangChain
+    Embeddings = object
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure")  # azure | local
+EMBEDDING_DEPLOYMENT = os.getenv("EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+EMBEDDING_API_VERSION = os.getenv("EMBEDDING_API_VERSION", "2024-05-01-preview")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite")  # "" disables the disk cache
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "0"))  # 0 = unlimited
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "0"))  # 0 = unlimited
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "256"))
+
+EMBED_CACHE_HITS = metrics.counter("embedding_cache_hits_total", "Texts served from the embedding cache")
+EMBED_CACHE_MISSES = metrics.counter("embedding_cache_misses_total", "Texts sent to the embedding provider")
+EMBED_REQUESTS = metrics.counter("embedding_requests_total", "Batched requests sent to the embedding provider")
+EMBED_REQUEST_SECONDS = metrics.histogram("embedding_request_seconds", "Latency of one batched embedding request")
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+
+    def estimate_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+except Exception:  # tiktoken is optional; ~4 characters per token is close enough for budgeting
+    def estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+
+# --- Providers ---
+class AzureEmbedder:
+    def __init__(self, deployment: str = EMBEDDING_DEPLOYMENT, api_version: str = EMBEDDING_API_VERSION):
+        from dotenv import load_dotenv
+        from langchain_openai import AzureOpenAIEmbeddings
+
+        load_dotenv()
+        self.name = f"azure:{deployment}"
+        self._model = AzureOpenAIEmbeddings(azure_deployment=deployment, openai_api_version=api_version)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        # Batches are already sized by the service; stop LangChain from re-splitting them.
+        return await self._model.aembed_documents(texts, chunk_size=len(texts))
+
+
+class LocalHashEmbedder:
+    """Deterministic offline stand-in: signed feature hashing of words and word bigrams, L2-normalized."""
+
+    _TOKEN = re.compile(r"\w+")
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, latency: float = 0.0):
+        self.name = f"local:hash-{dim}"
+        self.dim = dim
+        self.latency = latency  # simulated per-request latency for benchmarks
+
+    def embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        words = self._TOKEN.findall(text.lower())
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.embed_one(t) for t in texts]
+
+
+# --- Cache and rate limiting ---
+class EmbeddingCache:
+    """SQLite table of float32 vectors keyed by sha256(model, text). WAL mode, safe to share between processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """Token buckets for requests/minute and tokens/minute. A limit of 0 means unlimited."""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int):
+        if not self.rpm and not self.tpm:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+                if wait <= 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+
+# --- Service ---
+class EmbeddingService(Embeddings):
+    def __init__(
+        self,
+        provider=None,
+        cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+        batch_max_items: int = EMBEDDING_BATCH_MAX_ITEMS,
+        batch_max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        requests_per_minute: int = EMBEDDING_RPM,
+        tokens_per_minute: int = EMBEDDING_TPM,
+    ):
+        if provider is None:
+            provider = LocalHashEmbedder() if EMBEDDING_BACKEND == "local" else AzureEmbedder()
+        self.provider = provider
+        self.model_name = provider.name
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.batch_max_items = batch_max_items
+        self.batch_max_tokens = batch_max_tokens
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+        # All provider calls run on one private event loop, so the service can be
+        # used from sync code, from threads and from any other event loop.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    # --- LangChain Embeddings interface ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return asyncio.run_coroutine_threadsafe(self._embed(list(texts)), self._ensure_loop()).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        future = asyncio.run_coroutine_threadsafe(self._embed(list(texts)), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    # --- internals ---
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="embedding-service", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    @tracing.traced("embedding.embed")
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys = [self.cache_key(t) for t in texts]
+        unique: Dict[str, str] = dict(zip(keys, texts))
+
+        vectors: Dict[str, List[float]] = self.cache.get_many(list(unique)) if self.cache else {}
+        missing = [(key, text) for key, text in unique.items() if key not in vectors]
+        EMBED_CACHE_HITS.inc(len(texts) - len(missing))
+        EMBED_CACHE_MISSES.inc(len(missing))
+        tracing.annotate(texts=len(texts), cache_misses=len(missing))
+
+        if missing:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(self._embed_batch(batch) for batch in self._batches(missing)))
+            fresh = {key: vector for batch in results for key, vector in batch.items()}
+            if self.cache:
+                self.cache.put_many(fresh)
+            vectors.update(fresh)
+
+        return [vectors[key] for key in keys]
+
+    def _batches(self, items):
+        batch, batch_tokens = [], 0
+        for key, text in items:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_max_items or batch_tokens + tokens > self.batch_max_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append((key, text))
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
+
+    async def _embed_batch(self, batch_and_tokens) -> Dict[str, List[float]]:
+        batch, tokens = batch_and_tokens
+        async with self._semaphore:
+            await self.rate_limiter.acquire(tokens)
+            started = time.perf_counter()
+            vectors = await self.provider.embed([text for _, text in batch])
+            EMBED_REQUEST_SECONDS.observe(time.perf_counter() - started)
+            EMBED_REQUESTS.inc()
+        return {key: vector for (key, _), vector in zip(batch, vectors)}
+
+
+_SERVICE: Optional[EmbeddingService] = None
+_SERVICE_LOCK = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Process-wide EmbeddingService built from the EMBEDDING_* environment variables."""
+    global _SERVICE
+    if _SERVICE is None:
+        with _SERVICE_LOCK:
+            if _SERVICE is None:
+                _SERVICE = EmbeddingService()
+    return _SERVICE
@@ -0,0 +1,181 @@
+"""
+Recent-conversation stores for ChatContextManager.
+
+- InMemoryHistoryStore: per-process, keeps the last N messages per user and
+  evicts whole users by LRU, idle TTL and a global memory cap.
+- SQLiteHistoryStore: a file in WAL mode that several uvicorn workers (or
+  processes on one host) can share, and that survives restarts.
+
+Both return the last n messages without copying a user's whole history.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "memory")  # memory | sqlite
+HISTORY_SQLITE_PATH = os.getenv("HISTORY_SQLITE_PATH", "./chat_history.sqlite")
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "10"))  # per user
+HISTORY_MAX_USERS = int(os.getenv("HISTORY_MAX_USERS", "10000"))
+HISTORY_IDLE_TTL = float(os.getenv("HISTORY_IDLE_TTL", str(24 * 3600)))  # seconds without activity before a user is dropped
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_ENTRY_OVERHEAD = 120  # rough per-message bookkeeping cost in bytes
+
+
+def _message_size(message: str) -> int:
+    return len(message) + _ENTRY_OVERHEAD
+
+
+class InMemoryHistoryStore:
+    def __init__(
+        self,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+        max_users: int = HISTORY_MAX_USERS,
+        idle_ttl: float = HISTORY_IDLE_TTL,
+        max_bytes: int = HISTORY_MAX_BYTES,
+        clock=time.monotonic,
+    ):
+        self.max_messages = max_messages
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        # user_id -> (messages, last activity); ordered least recently active first
+        self._users: "OrderedDict[str, List]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def append(self, user_id: str, role: str, message: str):
+        now = self._clock()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = [deque(maxlen=self.max_messages), now]
+                self._users[user_id] = entry
+            else:
+                self._users.move_to_end(user_id)
+            messages = entry[0]
+            if len(messages) == messages.maxlen:
+                self._bytes -= _message_size(messages[0]["message"])
+            messages.append({"role": role, "message": message})
+            self._bytes += _message_size(message)
+            entry[1] = now
+            self._evict(now, keep=user_id)
+
+    def recent(self, user_id: str, n: int) -> List[Dict[str, str]]:
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            entry = self._users.get(user_id)
+            if entry is None or n <= 0:
+                return []
+            entry[1] = now
+            self._users.move_to_end(user_id)
+            return list(itertools.islice(reversed(entry[0]), n))[::-1]
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._drop(user_id)
+
+    def _drop(self, user_id: str):
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= sum(_message_size(m["message"]) for m in entry[0])
+
+    def _evict(self, now: float, keep: Optional[str] = None):
+        while self._users:
+            user_id, (_, last_seen) = next(iter(self._users.items()))
+            over_limit = len(self._users) > self.max_users or self._bytes > self.max_bytes
+            idle = self.idle_ttl and now - last_seen > self.idle_ttl
+            if user_id == keep or not (over_limit or idle):
+                return
+            self._drop(user_id)
+
+
+class SQLiteHistoryStore:
+    def __init__(
+        self,
+        path: str = HISTORY_SQLITE_PATH,
+        max_messages: int = HISTORY_MAX_MESSAGES,
+        idle_ttl: float = HISTORY_IDLE_TTL,
+        purge_interval: float = 300.0,
+    ):
+        self.path = path
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, role TEXT NOT NULL, "
+            "message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS history_user ON history (user_id, id)")
+
+    def append(self, user_id: str, role: str, message: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO history (user_id, role, message, created_at) VALUES (?, ?, ?, ?)",
+                    (user_id, role, message, now),
+                )
+                # Keep only the newest max_messages rows for this user.
+                self._conn.execute(
+                    "DELETE FROM history WHERE user_id = ? AND id <= "
+                    "(SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, self.max_messages),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if self.idle_ttl and now - self._purged_at > self.purge_interval:
+                self._purged_at = now
+                self._conn.execute(
+                    "DELETE FROM history WHERE user_id IN "
+                    "(SELECT user_id FROM history GROUP BY user_id HAVING MAX(created_at) < ?)",
+                    (now - self.idle_ttl,),
+                )
+
+    def recent(self, user_id: str, n: int) -> List[Dict[str, str]]:
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, message FROM history WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, n)
+            ).fetchall()
+        return [{"role": role, "message": message} for role, message in reversed(rows)]
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_history_store(max_messages: int = HISTORY_MAX_MESSAGES):
+    """Builds the store selected by HISTORY_BACKEND."""
+    if HISTORY_BACKEND == "sqlite":
+        return SQLiteHistoryStore(max_messages=max_messages)
+    if HISTORY_BACKEND != "memory":
+        print(f"Unknown HISTORY_BACKEND '{HISTORY_BACKEND}', using in-memory history.")
+    return InMemoryHistoryStore(max_messages=max_messages)
@@ -0,0 +1,223 @@
+"""
+Hybrid lexical + vector retrieval for the RAG tool.
+
+BM25 (bm25Index.py) and the vector store are queried in parallel and their
+rankings are merged with reciprocal rank fusion. An optional local
+cross-encoder can re-rank the fused candidates.
+
+search_many() answers several queries with one embedding request and one
+vectorized top-k over the query matrix (MMapVectorStore, or Chroma's batched
+collection query); stores without either fall back to a search per query.
+"""
+import contextvars
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import tracing
+from bm25Index import BM25Index
+from indexVersion import IndexVersionWatcher
+
+try:
+    from langchain_core.documents import Document
+except ImportError:  # offline benchmarks
+    class Document:
+        def __init__(self, page_content: str, metadata: Optional[Dict] = None, id: Optional[str] = None):
+            self.page_content = page_content
+            self.metadata = metadata or {}
+            self.id = id
+
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")  # hybrid | vector | lexical
+RETRIEVAL_FETCH_K = int(os.getenv("RAG_RETRIEVAL_FETCH_K", "20"))  # candidates taken from each retriever
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RERANKER_MODEL = os.getenv("RAG_RERANKER_MODEL", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty disables
+
+_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("RAG_RETRIEVAL_THREADS", "8")), thread_name_prefix="retrieval")
+
+
+def document_key(doc) -> str:
+    """Identity used to merge hits of the two retrievers (ids are not always returned by vector stores)."""
+    metadata = doc.metadata or {}
+    raw = f"{metadata.get('source')}\0{metadata.get('page')}\0{doc.page_content}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: List[List], weights: List[float], rrf_k: int = RRF_K) -> List:
+    """Merges ranked document lists; a document's score is sum(weight / (rrf_k + rank))."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, object] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not weight:
+            continue
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def search_by_vectors(vector_store, embeddings: List[List[float]], k: int) -> List[List]:
+    """One top-k Document list per embedding, in a single call where the store supports it."""
+    if hasattr(vector_store, "similarity_search_by_vectors"):
+        return vector_store.similarity_search_by_vectors(embeddings, k=k)
+    collection = getattr(vector_store, "_collection", None)  # LangChain Chroma
+    if collection is not None:
+        found = collection.query(query_embeddings=embeddings, n_results=k, include=["documents", "metadatas"])
+        return [
+            [Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+             for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+            for ids, texts, metadatas in zip(found["ids"], found["documents"], found["metadatas"])
+        ]
+    return [vector_store.similarity_search_by_vector(embedding, k=k) for embedding in embeddings]
+
+
+class CrossEncoderReranker:
+    """Local re-ranker; needs `sentence-transformers` and downloads the model on first use."""
+
+    def __init__(self, model_name: str = RERANKER_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+
+    @tracing.traced("retriever.rerank")
+    def rerank(self, query: str, docs: List, top_n: int) -> List:
+        if not docs:
+            return docs
+        scores = self.model.predict([(query, doc.page_content) for doc in docs])
+        ranked = sorted(zip(scores, range(len(docs))), reverse=True)
+        return [docs[i] for _, i in ranked[:top_n]]
+
+
+def load_default_reranker():
+    if not RERANKER_MODEL:
+        return None
+    try:
+        return CrossEncoderReranker(RERANKER_MODEL)
+    except Exception as e:
+        print(f"Re-ranker '{RERANKER_MODEL}' unavailable (is sentence-transformers installed?): {e}")
+        return None
+
+
+class HybridRetriever:
+    def __init__(self, vector_store, bm25_index: BM25Index, reranker=None, db_path: Optional[str] = None):
+        self.vector_store = vector_store
+        self.bm25_index = bm25_index
+        self.reranker = reranker
+        self._index_version = IndexVersionWatcher(db_path) if db_path else None
+        self._version = self._index_version.current() if self._index_version else ""
+
+    @tracing.traced("retriever.search")
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        mode: str = RETRIEVAL_MODE,
+        fetch_k: int = RETRIEVAL_FETCH_K,
+        lexical_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        rerank: Optional[bool] = None,
+    ) -> List:
+        """
+        mode: "hybrid" fuses both retrievers, "vector" / "lexical" use one.
+        lexical_weight / vector_weight: per-query RRF weights (e.g. favour lexical for IDs and acronyms).
+        rerank: force the re-ranker on/off; default is on when one is configured.
+        """
+        self._refresh_if_reindexed()
+        fetch_k = max(fetch_k, k)
+        use_vector = mode in ("hybrid", "vector") and vector_weight > 0
+        use_lexical = mode in ("hybrid", "lexical") and lexical_weight > 0
+
+        tracing.annotate(mode=mode, k=k)
+        vector_future = None
+        if use_vector:
+            # The copied context keeps the vector span inside this trace.
+            vector_future = _POOL.submit(contextvars.copy_context().run, self._vector_search, query, fetch_k)
+        lexical_docs = self._lexical_search(query, fetch_k) if use_lexical else []
+        vector_docs = vector_future.result() if vector_future else []
+        weights = (lexical_weight if use_lexical else 0.0, vector_weight if use_vector else 0.0)
+        return self._fuse(query, k, lexical_docs, vector_docs, weights, rerank)
+
+    @tracing.traced("retriever.search_many")
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        mode: str = RETRIEVAL_MODE,
+        fetch_k: int = RETRIEVAL_FETCH_K,
+        lexical_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        rerank: Optional[bool] = None,
+    ) -> List[List]:
+        """
+        search() for several queries at once: one result list per query, in
+        order, each fused and re-ranked exactly as search() would. Repeated
+        queries are searched once.
+        """
+        self._refresh_if_reindexed()
+        fetch_k = max(fetch_k, k)
+        use_vector = mode in ("hybrid", "vector") and vector_weight > 0
+        use_lexical = mode in ("hybrid", "lexical") and lexical_weight > 0
+        unique = list(dict.fromkeys(queries))
+
+        tracing.annotate(mode=mode, k=k, queries=len(queries), unique_queries=len(unique))
+        vector_future = None
+        if use_vector:
+            vector_future = _POOL.submit(contextvars.copy_context().run, self._vector_search_many, unique, fetch_k)
+        lexical = self._lexical_search_many(unique, fetch_k) if use_lexical else [[] for _ in unique]
+        vector = vector_future.result() if vector_future else [[] for _ in unique]
+
+        weights = (lexical_weight if use_lexical else 0.0, vector_weight if use_vector else 0.0)
+        results = {
+            query: self._fuse(query, k, lexical_docs, vector_docs, weights, rerank)
+            for query, lexical_docs, vector_docs in zip(unique, lexical, vector)
+        }
+        return [results[query] for query in queries]
+
+    def _fuse(self, query: str, k: int, lexical_docs: List, vector_docs: List, weights: Tuple[float, float],
+              rerank: Optional[bool]) -> List:
+        """weights: (lexical, vector) RRF weights, 0 for a retriever that did not run."""
+        if all(weights):
+            candidates = reciprocal_rank_fusion([lexical_docs, vector_docs], list(weights))
+        else:
+            candidates = vector_docs or lexical_docs
+
+        if rerank is None:
+            rerank = self.reranker is not None
+        if rerank and self.reranker is not None:
+            return self.reranker.rerank(query, candidates, k)
+        return candidates[:k]
+
+    @tracing.traced("retriever.vector")
+    def _vector_search(self, query: str, k: int) -> List:
+        return self.vector_store.similarity_search(query, k=k)
+
+    @tracing.traced("retriever.vector")
+    def _vector_search_many(self, queries: List[str], k: int) -> List[List]:
+        embeddings = getattr(self.vector_store, "embeddings", None) or getattr(self.vector_store, "embedding_function", None)
+        if embeddings is None:
+            return [self.vector_store.similarity_search(query, k=k) for query in queries]
+        embed = getattr(embeddings, "embed_queries", None) or embeddings.embed_documents
+        return search_by_vectors(self.vector_store, embed(queries), k)
+
+    def _lexical_search(self, query: str, k: int) -> List:
+        return self._lexical_search_many([query], k)[0]
+
+    @tracing.traced("retriever.lexical")
+    def _lexical_search_many(self, queries: List[str], k: int) -> List[List]:
+        """BM25 per query; the texts of every chunk hit are loaded in one lookup."""
+        hits = [self.bm25_index.search(query, k) for query in queries]
+        found = self.bm25_index.get(list(dict.fromkeys(chunk_id for query_hits in hits for chunk_id, _ in query_hits)))
+        return [
+            [Document(page_content=found[chunk_id][0], metadata=found[chunk_id][1], id=chunk_id)
+             for chunk_id, _ in query_hits if chunk_id in found]
+            for query_hits in hits
+        ]
+
+    def _refresh_if_reindexed(self):
+        if self._index_version is None:
+            return
+        version = self._index_version.current()
+        if version != self._version:
+            self._version = version
+            self.bm25_index.refresh()
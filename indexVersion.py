@@ -0,0 +1,52 @@
+"""
+Version stamp for the persisted RAG index.
+
+RagVectorDB writes a new stamp every time it changes the index; caches that
+depend on retrieval results compare stamps to know when to drop their entries.
+"""
+import os
+import time
+import uuid
+
+INDEX_VERSION_FILE = "index_version"
+
+
+def _version_path(db_path: str) -> str:
+    return os.path.join(db_path, INDEX_VERSION_FILE)
+
+
+def read_index_version(db_path: str) -> str:
+    """Returns the current stamp, or "" if the index has never been stamped."""
+    try:
+        with open(_version_path(db_path), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def bump_index_version(db_path: str) -> str:
+    """Writes (atomically) and returns a new stamp for the index at db_path."""
+    os.makedirs(db_path, exist_ok=True)
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp_path = _version_path(db_path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, _version_path(db_path))
+    return version
+
+
+class IndexVersionWatcher:
+    """Cheap polling of the stamp file; re-reads it at most every `interval` seconds."""
+
+    def __init__(self, db_path: str, interval: float = 1.0):
+        self.db_path = db_path
+        self.interval = interval
+        self._version = read_index_version(db_path)
+        self._checked_at = time.monotonic()
+
+    def current(self) -> str:
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval:
+            self._checked_at = now
+            self._version = read_index_version(self.db_path)
+        return self._version
@@ -1,12 +1,113 @@
-from fastapi import FastAPI,Body
+from fastapi import FastAPI,Body,Request,WebSocket,WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Any, Dict,List,Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
+from typing import Any, Awaitable, Callable, Dict, Optional
+from contextlib import aclosing, asynccontextmanager
+import anyio
+import asyncio
 import httpx
 import json
+import os
+import secrets
+import time
 
-app = FastAPI()
+import metrics
+import tracing
+from admissionControl import PRIORITY_CONFIRMATION, PRIORITY_PROMPT, AdmissionController, AdmissionRejected
+from backendPool import ADK_APP_NAME, BackendPool, NoBackendAvailable
+from blobCache import BlobCache, BlobRejected, sniff_base64_mime_type
+from responseCache import TurnRecorder, create_response_cache
+from sseRelay import SSERelay, TurnEncoder, decode_frames, encode_frames
+
+# --- Upstream (ADK) client settings ---
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+# Per-phase timeouts (seconds)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+UPSTREAM_FIRST_BYTE_TIMEOUT = float(os.getenv("UPSTREAM_FIRST_BYTE_TIMEOUT", "60"))
+UPSTREAM_IDLE_TIMEOUT = float(os.getenv("UPSTREAM_IDLE_TIMEOUT", "120"))
+UPSTREAM_ERROR_MAX_BYTES = 4096  # of an upstream error body relayed to the client
+
+# --- Relay between upstream reader and downstream writer ---
+RELAY_QUEUE_SIZE = int(os.getenv("RELAY_QUEUE_SIZE", "64"))  # frames buffered per stream before upstream reads pause
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# Bearer token for the admin endpoints (/admission, /backends, /backends/drain); unset disables them.
+PROXY_ADMIN_TOKEN = os.getenv("PROXY_ADMIN_TOKEN", "")
+
+# Used when a client does not send its own userId (older frontends).
+DEFAULT_USER_ID = os.getenv("ADK_DEFAULT_USER_ID", "samp123")
+# Author of the answers the proxy writes into ADK sessions on a response cache hit.
+ADK_ROOT_AGENT = os.getenv("ADK_ROOT_AGENT", "root_agent")
+
+# --- WebSocket transport (/ws) ---
+WS_SUBPROTOCOL_JSON = "adk-chat.json"
+WS_SUBPROTOCOL_COMPACT = "adk-chat.compact"
+WS_MAX_TURNS = int(os.getenv("WS_MAX_TURNS", "4"))  # turns streaming at once on one connection
+
+STREAMS_ACTIVE = metrics.gauge("proxy_streams_active", "Chat streams currently open")
+STREAMS_CANCELLED = metrics.counter("proxy_streams_cancelled_total", "Upstream runs cancelled because the client went away")
+RELAY_QUEUE_HIGH_WATER = metrics.gauge("proxy_relay_queue_high_water", "Largest number of frames waiting for a slow client")
+CANCEL_SECONDS = metrics.histogram("proxy_cancel_seconds", "Time from client disconnect to upstream stream closed")
+WS_CONNECTIONS = metrics.gauge("proxy_ws_connections_active", "WebSocket connections currently open")
+WS_TURNS = metrics.counter("proxy_ws_turns_total", "Chat turns received over WebSocket connections")
+
+_EOF = object()  # the upstream stream closed cleanly
+_FAILED = object()  # the upstream stream ended early (error, timeout); the answer is incomplete
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    """
+    Builds the application-wide client used for every call to the ADK backend.
+    The read timeout is the idle limit between two upstream events; the
+    first-byte limit is enforced separately by the stream reader.
+    """
+    http2 = UPSTREAM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("HTTP/2 requested but 'h2' is not installed (pip install httpx[http2]). Using HTTP/1.1.")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            read=UPSTREAM_IDLE_TIMEOUT,
+            write=UPSTREAM_CONNECT_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT,
+        ),
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http_client = create_upstream_client()
+    app.state.response_cache = create_response_cache()
+    app.state.backend_pool = BackendPool(client=app.state.http_client)
+    app.state.backend_pool.start()
+    app.state.admission = AdmissionController()
+    app.state.blob_cache = BlobCache()
+    try:
+        yield
+    finally:
+        await app.state.backend_pool.close()
+        await app.state.http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS setup
 app.add_middleware(
@@ -17,42 +118,193 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ADK_URL = "http://localhost:8000/run_sse"
-
 class ChatBody(BaseModel): 
     sessionId :str
+    userId: Optional[str] = None
     text: Optional[str] = None
-    imgData: Optional[str] = None
+    imgData: Optional[str] = None  # base64 image inline (older frontends); prefer imageHash
+    imgMimeType: Optional[str] = None
+    imageHash: Optional[str] = None  # an image stored with POST /upload
     confirmationId: Optional[str] = None
     approvedValue: Optional[str] = None
 
 
-ADK_URL_RUN = "http://localhost:8000/run_sse" # Replace with your actual ADK service URL
 
+class UpstreamTimeout(Exception):
+    """The ADK stream sent no first byte, or went idle, for longer than its phase timeout."""
+
+
+async def _iter_upstream_bytes(resp: httpx.Response):
+    """
+    Yields raw upstream chunks. Raises UpstreamTimeout if the first chunk does
+    not arrive within UPSTREAM_FIRST_BYTE_TIMEOUT, or if a later gap exceeds
+    the client's read timeout (UPSTREAM_IDLE_TIMEOUT).
+    """
+    chunks = resp.aiter_bytes()
+    try:
+        async with asyncio.timeout(UPSTREAM_FIRST_BYTE_TIMEOUT):
+            first = await anext(chunks)
+    except StopAsyncIteration:
+        return
+    except TimeoutError:
+        await chunks.aclose()
+        raise UpstreamTimeout(f"Upstream sent no data within {UPSTREAM_FIRST_BYTE_TIMEOUT}s") from None
+
+    yield first
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except httpx.ReadTimeout:
+        raise UpstreamTimeout(f"Upstream idle for more than {UPSTREAM_IDLE_TIMEOUT}s") from None
+
+
+async def _read_error_body(resp: httpx.Response) -> str:
+    body = bytearray()
+    async for chunk in resp.aiter_bytes():
+        body += chunk
+        if len(body) >= UPSTREAM_ERROR_MAX_BYTES:
+            break
+    return body[:UPSTREAM_ERROR_MAX_BYTES].decode("utf-8", errors="replace")
+
+
+async def _pump_upstream(backend, payload: Dict[str, Any], relay: SSERelay, queue: asyncio.Queue, turn: tracing.Span):
+    """
+    Reads the ADK stream into the bounded queue. When the queue is full the
+    reader stops pulling from upstream, so a slow client slows the upstream
+    read instead of growing memory.
+    """
+    client: httpx.AsyncClient = app.state.http_client
+    pool: BackendPool = app.state.backend_pool
+    upstream = tracing.start_span("proxy.upstream", parent=turn, backend=backend.url)
+    connect = tracing.start_span("proxy.upstream_connect", parent=upstream)
+    ended = _FAILED
+    try:
+        with pool.stream(backend):
+            async with client.stream("POST", pool.run_url(backend), json=payload) as resp:
+                connect.end()
+                upstream.set(status_code=resp.status_code)
+                if resp.status_code >= 400:
+                    # An error body is not an SSE stream; the client gets one error frame instead.
+                    raise httpx.HTTPStatusError(await _read_error_body(resp), request=resp.request, response=resp)
+                first = True
+                async for chunk in _iter_upstream_bytes(resp):
+                    if first:
+                        first = False
+                        turn.event("first_upstream_byte")
+                    frames = relay.feed(chunk)
+                    if frames:
+                        await queue.put(frames)
+                        RELAY_QUEUE_HIGH_WATER.observe_max(queue.qsize())
+        frames = relay.close()
+        if frames:
+            await queue.put(frames)
+        ended = _EOF
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        pool.report_failure(backend)
+        connect.end(error=e)
+        upstream.end(error=e)
+        print(f"Upstream {backend.url} unreachable: {e!r}")
+        await queue.put(relay.error("ADK backend unreachable", 502))
+    except httpx.HTTPStatusError as e:
+        upstream.end(error=e)
+        print(f"HTTP error occurred: {e.response.status_code}")
+        await queue.put(relay.error(str(e), e.response.status_code))
+    except (UpstreamTimeout, httpx.TimeoutException) as e:
+        upstream.end(error=e)
+        print(f"Upstream {backend.url} timed out: {e}")
+        await queue.put(relay.error("ADK backend timed out", 504))
+    except Exception as e:
+        # A cut-off answer must not look complete to the client.
+        upstream.end(error=e)
+        print(f"Upstream stream failed: {e!r}")
+        await queue.put(relay.error("ADK stream failed", 502))
+    finally:
+        connect.end()
+        upstream.end()
+    await queue.put(ended)
+
+
+async def _relay_upstream(
+    is_disconnected: Callable[[], Awaitable[bool]],
+    backend,
+    payload: Dict[str, Any],
+    turn: tracing.Span,
+    recorder: Optional[TurnRecorder] = None,
+    encoder=encode_frames,
+):
+    """
+    Streams relay frames to the client. If the client disconnects (detected
+    by polling or by the caller cancelling this generator) the upstream request
+    is closed at once, which also ends the ADK run.
+    """
+    relay = SSERelay(observer=recorder.observe if recorder is not None else None, encoder=encoder)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=RELAY_QUEUE_SIZE)
+    reader = asyncio.create_task(_pump_upstream(backend, payload, relay, queue, turn))
+    finished = False
+    first = True
+    STREAMS_ACTIVE.inc()
+    try:
+        while True:
+            timeout = DISCONNECT_POLL_INTERVAL
+            pending = relay.flush_timeout()
+            if pending is not None:
+                timeout = min(timeout, pending)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except TimeoutError:
+                frames = relay.flush_due()
+                if frames:
+                    if first:
+                        first = False
+                        turn.event("first_downstream_byte")
+                    yield frames
+                elif await is_disconnected():
+                    break
+                continue
+
+            if item is _EOF or item is _FAILED:
+                finished = True
+                if recorder is not None:
+                    recorder.completed = item is _EOF
+                break
+            if first:
+                first = False
+                turn.event("first_downstream_byte")
+            yield item
+    finally:
+        STREAMS_ACTIVE.dec()
+        if not finished and not reader.done():
+            turn.set(cancelled=True)
+            started = time.monotonic()
+            reader.cancel()
+            # Starlette cancels this generator through anyio, which re-raises on every await.
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(reader, return_exceptions=True)
+            STREAMS_CANCELLED.inc()
+            CANCEL_SECONDS.observe(time.monotonic() - started)
+            print("Client disconnected, upstream run cancelled.")
 
 
 @app.post("/createSession")
-async def create_session(sessionId: str = Body(..., embed=True)):
+async def create_session(sessionId: str = Body(..., embed=True), userId: Optional[str] = Body(None, embed=True)):
     """
-    Creates a new session by forwarding the request to the ADK.
+    Creates a new session on the least busy of its ADK backends.
     """
-    APP_NAME = "agents"
-    USER_ID = "samp123"
-    ADK_URL = f"http://localhost:8000/apps/{APP_NAME}/users/{USER_ID}/sessions/{sessionId}"
-    
-    payload = {
-        "app_name": APP_NAME,
-        "user_id": USER_ID,
-        "session_id": sessionId
-    }
+    return await _create_session(sessionId, userId)
+
+
+async def _create_session(sessionId: str, userId: Optional[str]) -> Dict[str, Any]:
+    pool: BackendPool = app.state.backend_pool
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(ADK_URL, json=payload)
-            resp.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+        backend = pool.place(sessionId)
+        await pool.create_session(backend, sessionId, userId or DEFAULT_USER_ID)  # Raises for 4xx or 5xx
 
         return {"status": "success"}
 
+    except NoBackendAvailable as e:
+        return {"status": "fail", "details": str(e)}
+
     except httpx.HTTPStatusError as e:
         print(f"HTTP error occurred: {e.response.status_code}")
         return {"status": "fail", "details": e.response.text}
@@ -61,22 +313,152 @@ async def create_session(sessionId: str = Body(..., embed=True)):
         return {"status": "fail", "details": str(e)}
 
 
-@app.post("/chat")
-async def chat_proxy(body: ChatBody):
+async def _replay(frames: bytes):
+    yield frames
+
+
+async def _finish_after(stream, turn: "ChatTurn"):
+    """Relays a stream, then gives back its admission slot and ends its trace however the stream ends."""
+    try:
+        async with aclosing(stream):
+            async for frames in stream:
+                yield frames
+    finally:
+        turn.finish()
+
+
+def _is_cacheable_prompt(body: ChatBody) -> bool:
+    """Only plain text questions are answered from the response cache (and only on a session's first turn)."""
+    return (
+        body.text not in (None, "")
+        and body.imgData in (None, "")
+        and body.imageHash in (None, "")
+        and body.confirmationId in (None, "")
+    )
+
+
+class TurnRefused(Exception):
+    """A turn answered with an error status instead of a stream."""
+
+    def __init__(self, status_code: int, details: str, retry_after: Optional[int] = None):
+        super().__init__(details)
+        self.status_code = status_code
+        self.details = details
+        self.retry_after = retry_after
+
+
+class ChatTurn:
     """
-    Receives full ADK request from frontend,
-    forwards it to /run_sse, and streams back only text and tool confirmation IDs.
-    
+    One chat turn, whatever the transport (/chat or /ws): start() answers from
+    the response cache or takes an admission slot and an ADK backend, stream()
+    relays the ADK run, and finish() gives back the slot and ends the turn's
+    trace (it is idempotent).
     """
-    async def event_stream():
 
+    def __init__(self, body: ChatBody, parent: Optional[tracing.SpanContext] = None):
+        self.body = body
+        self.user_id = body.userId or DEFAULT_USER_ID
+        # One trace per turn; a caller's W3C traceparent is continued.
+        self.span = tracing.start_span("proxy.chat", parent=parent, session_id=body.sessionId)
+        self.cached: Optional[bytes] = None  # the whole answer (/chat frames) on a cache hit
+        self.ticket = None
+        self.backend = None
+        self.image = None  # the uploaded image referenced by imageHash
+        self._cache_lookup = None
+
+    async def start(self):
+        """Raises TurnRefused. On return either `cached` is set or the turn holds a slot and a backend."""
+        try:
+            await self._start()
+        except TurnRefused:
+            self.finish()
+            raise
+        except BaseException as e:
+            self.span.end(error=e)
+            self.finish()
+            raise
+
+    async def _start(self):
+        body = self.body
+        if body.imageHash not in (None, ""):
+            self.image = await app.state.blob_cache.get(body.imageHash)
+            if self.image is None:
+                raise TurnRefused(404, "Unknown imageHash, upload the image again")
+
+        cache = app.state.response_cache
+        if cache is not None and _is_cacheable_prompt(body) and cache.first_turn(body.sessionId):
+            # Answers are shared only between turns of the same user (clients without a userId: same session).
+            with tracing.span("proxy.cache_lookup", parent=self.span):
+                self._cache_lookup = await cache.lookup(body.text, scope=body.userId or f"session:{body.sessionId}")
+            if self._cache_lookup.frames is not None:
+                if await self._record_cached_answer(self._cache_lookup.frames):
+                    self.span.set(cache_hit=True)
+                    self.cached = self._cache_lookup.frames
+                    cache.record_turn(body.sessionId)
+                    self.finish()
+                    return
+                # The session already has a history this proxy did not see: not a first turn after all.
+                self._cache_lookup = None
+
+        # Replies to a tool confirmation unblock a waiting agent, so they go ahead of new prompts.
+        is_confirmation = body.confirmationId not in (None, "") and body.approvedValue not in (None, "")
+        admission: AdmissionController = app.state.admission
+        try:
+            with tracing.span("proxy.admission", parent=self.span, confirmation=is_confirmation):
+                self.ticket = await admission.acquire(
+                    body.userId or f"session:{body.sessionId}",
+                    PRIORITY_CONFIRMATION if is_confirmation else PRIORITY_PROMPT,
+                )
+        except AdmissionRejected as e:
+            self.span.set(rejected=e.status_code)
+            raise TurnRefused(e.status_code, e.reason, e.retry_after) from None
+
+        # The session lives on one ADK backend; find it (or re-create it after a failover).
+        try:
+            with tracing.span("proxy.route", parent=self.span):
+                self.backend, created = await app.state.backend_pool.route(body.sessionId, self.user_id)
+            self.span.set(backend=self.backend.url, session_created=created)
+        except (NoBackendAvailable, httpx.HTTPError) as e:
+            self.span.end(error=e)
+            print(f"No ADK backend for session '{body.sessionId}': {e!r}")
+            raise TurnRefused(503, "No ADK backend available") from None
+        if cache is not None:
+            cache.record_turn(body.sessionId)
+
+    async def _record_cached_answer(self, frames: bytes) -> bool:
+        """
+        Writes the question and the cached answer into the (empty) ADK session,
+        since ADK never ran this turn, so the agent sees them on the next one.
+        False if that is not possible; the turn then goes to ADK as usual.
+        """
+        pool: BackendPool = app.state.backend_pool
+        answer = "".join(event["text"] for event in decode_frames(frames) if event.get("type") == "text")
+        events = [
+            {"author": "user", "content": {"role": "user", "parts": [{"text": self.body.text}]}},
+            {"author": ADK_ROOT_AGENT, "content": {"role": "model", "parts": [{"text": answer}]}},
+        ]
+        try:
+            with tracing.span("proxy.cache_record", parent=self.span):
+                backend, _ = await pool.route(self.body.sessionId, self.user_id)
+                return await pool.restore_session(backend, self.body.sessionId, self.user_id, events)
+        except (NoBackendAvailable, httpx.HTTPError) as e:
+            print(f"Could not record the cached answer in session '{self.body.sessionId}': {e!r}")
+            return False
+
+    def payload(self) -> Dict[str, Any]:
+        body = self.body
         part_item: Dict[str, Any] = {}
         if body.text not in (None, ""):
             part_item["text"] =body.text
 
-        if body.imgData not in (None, ""):
+        if self.image is not None:
+            part_item["inline_data"] = {
+                "mime_type": self.image.mime_type,
+                "data": self.image.base64()
+            }
+        elif body.imgData not in (None, ""):
             part_item["inline_data"] = {
-                "mime_type": "image/",
+                "mime_type": body.imgMimeType or sniff_base64_mime_type(body.imgData) or "image/jpeg",
                 "data": body.imgData
             }
 
@@ -92,90 +474,325 @@ async def chat_proxy(body: ChatBody):
                 }
             }
 
-     
-
         # Final payload with static fields and parts as a list
-        payload = {
-            "app_name": "agents",
-            "user_id": "samp123",
+        return {
+            "app_name": ADK_APP_NAME,
+            "user_id": self.user_id,
             "session_id": body.sessionId,
             "new_message": {
                 "role": "user",
                 "parts": [part_item]  #  list of dicts
-            }
+            },
+            # Agent and tool spans join this turn's trace (temp: state lasts one run).
+            "state_delta": {tracing.TRACE_STATE_KEY: tracing.traceparent(self.span)},
         }
 
+    async def stream(self, is_disconnected: Callable[[], Awaitable[bool]], encoder=encode_frames):
+        """Relays the ADK run as `encoder` output; a complete, cacheable answer is stored in the response cache."""
+        recorder = TurnRecorder() if self._cache_lookup is not None else None
+        relay = _relay_upstream(is_disconnected, self.backend, self.payload(), self.span, recorder, encoder)
+        async with aclosing(relay) as stream:
+            async for frames in stream:
+                yield frames
+
+        if recorder is not None and recorder.cacheable():
+            app.state.response_cache.store(self._cache_lookup, b"".join(recorder.frames))
+
+    def finish(self):
+        if self.ticket is not None:
+            self.ticket.release()
+        self.span.end()
+
+
+@app.post("/chat")
+async def chat_proxy(body: ChatBody, request: Request):
+    """
+    Receives full ADK request from frontend,
+    forwards it to /run_sse, and streams back only text and tool confirmation IDs.
+    
+    """
+    turn = ChatTurn(body, parent=tracing.parse_traceparent(request.headers.get("traceparent")))
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Trace-Id": turn.span.trace_id,
+    }
+    try:
+        await turn.start()
+    except TurnRefused as e:
+        error_headers = {"X-Trace-Id": turn.span.trace_id}
+        if e.retry_after is not None:
+            error_headers["Retry-After"] = str(e.retry_after)
+        return JSONResponse({"status": "fail", "details": e.details}, status_code=e.status_code, headers=error_headers)
+
+    if turn.cached is not None:
+        return StreamingResponse(_replay(turn.cached), media_type="text/event-stream", headers=headers)
+
+    # The slot is released and the trace ended when the stream ends; the background
+    # task covers a response that never started streaming (both are idempotent).
+    return StreamingResponse(
+        _finish_after(turn.stream(request.is_disconnected), turn),
+        media_type="text/event-stream",
+        headers=headers,
+        background=BackgroundTask(turn.finish),
+    )
+
+
+@app.post("/upload")
+async def upload_image(request: Request):
+    """
+    Stores the image sent as the raw request body (e.g. fetch(url, {method:
+    "POST", body: file})) and returns its imageHash, which chat turns send
+    instead of imgData. Uploading an image that is already stored costs no
+    extra space; GET /upload/{imageHash} tells whether it still is.
+    """
+    length = request.headers.get("content-length")
+    blob_cache: BlobCache = app.state.blob_cache
+    if length is not None and length.isdigit() and int(length) > blob_cache.max_upload_bytes:
+        return JSONResponse({"status": "fail", "details": f"Image larger than {blob_cache.max_upload_bytes} bytes"}, status_code=413)
+    try:
+        blob = await blob_cache.put_stream(request.stream())
+    except BlobRejected as e:
+        return JSONResponse({"status": "fail", "details": e.reason}, status_code=e.status_code)
+    return {"status": "success", **blob.to_dict()}
+
+
+@app.get("/upload/{image_hash}")
+async def get_upload(image_hash: str):
+    blob = await app.state.blob_cache.get(image_hash)
+    if blob is None:
+        return JSONResponse({"status": "fail", "details": "Unknown imageHash"}, status_code=404)
+    return {"status": "success", **blob.to_dict()}
+
+
+def _is_turn_id(turn_id) -> bool:
+    """Turn ids are client-chosen strings or integers (bool is rejected although it is an int)."""
+    return isinstance(turn_id, (str, int)) and not isinstance(turn_id, bool)
+
+
+class ChatSocket:
+    """
+    One /ws connection: a browser session's whole conversation over a single
+    socket instead of a /createSession POST plus one /chat stream per turn.
+
+    Client messages (JSON objects):
+      {"type": "createSession", "sessionId": ..., "userId": ...}
+      {"type": "chat", "turn": <id>, "text" / "imageHash" / "confirmationId" + "approvedValue",
+       optional "sessionId", "userId" and "traceparent"}
+      {"type": "cancel", "turn": <id>}
+      {"type": "ping"}
+    Server messages:
+      event batches of a turn, framed per the negotiated subprotocol
+        adk-chat.json (default)  {"turn": <id>, "events": [{"type": "text", "text": ...}, ...]}
+        adk-chat.compact         [<id>, [["t", text], ["c", confirmation_id, name, hint], ...]]
+      control messages, always JSON objects:
+        {"type": "session", "sessionId": ..., "status": "success" | "fail", "details"?: ...}
+        {"type": "done", "turn": <id>, "traceId": ..., "cancelled"?: true}
+        {"type": "error", "turn": <id>, "status": 429 | 503 | ..., "details": ..., "retryAfter"?: seconds}
+        {"type": "pong"}
+
+    Turns run as separate tasks (at most WS_MAX_TURNS at once), so a tool
+    confirmation reply or a new prompt can be sent while another turn streams.
+    Closing the socket cancels every running turn and its ADK run.
+    """
+
+    def __init__(self, websocket: WebSocket, compact: bool):
+        self.websocket = websocket
+        self.compact = compact
+        self.session_id: Optional[str] = None
+        self.user_id: Optional[str] = None
+        self.closed = False
+        self._turns: Dict[Any, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def is_closed(self) -> bool:
+        return self.closed
+
+    async def send(self, data: bytes):
+        """Sends one message; a failed send marks the connection closed and raises WebSocketDisconnect."""
+        if self.closed:
+            raise WebSocketDisconnect()
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(data.decode("utf-8"))
+            except Exception as e:
+                self.closed = True
+                raise WebSocketDisconnect() from e
+
+    async def send_control(self, message: Dict[str, Any]):
+        await self.send(json.dumps(message).encode("utf-8"))
+
+    async def serve(self):
+        WS_CONNECTIONS.inc()
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                except (ValueError, KeyError):
+                    await self.send_control({"type": "error", "status": 400, "details": "Expected a JSON object"})
+                    continue
+                await self.dispatch(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            WS_CONNECTIONS.dec()
+            tasks = list(self._turns.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def dispatch(self, message):
+        kind = message.get("type") if isinstance(message, dict) else None
+        if kind == "chat":
+            await self.start_turn(message)
+        elif kind == "cancel":
+            turn_id = message.get("turn")
+            task = self._turns.get(turn_id) if _is_turn_id(turn_id) else None
+            if task is not None:
+                task.cancel()
+        elif kind == "createSession":
+            self.session_id = message.get("sessionId") or self.session_id
+            self.user_id = message.get("userId") or self.user_id
+            if not self.session_id:
+                await self.send_control({"type": "session", "status": "fail", "details": "sessionId is required"})
+                return
+            result = await _create_session(self.session_id, self.user_id)
+            await self.send_control({"type": "session", "sessionId": self.session_id, **result})
+        elif kind == "ping":
+            await self.send_control({"type": "pong"})
+        else:
+            await self.send_control({"type": "error", "status": 400, "details": f"Unknown message type {kind!r}"})
+
+    async def start_turn(self, message: Dict[str, Any]):
+        turn_id = message.get("turn")
+        if turn_id is None or not _is_turn_id(turn_id) or turn_id in self._turns:
+            if turn_id is None:
+                details = "Missing turn id"
+            elif not _is_turn_id(turn_id):
+                details = "Turn id must be a string or an integer"
+            else:
+                details = "Turn id already in use"
+            await self.send_control({"type": "error", "turn": turn_id, "status": 400, "details": details})
+            return
+        if len(self._turns) >= WS_MAX_TURNS:
+            await self.send_control({"type": "error", "turn": turn_id, "status": 429, "details": "Too many turns on this connection"})
+            return
+        fields = {k: v for k, v in message.items() if k in ChatBody.model_fields}
+        fields.setdefault("sessionId", self.session_id)
+        fields.setdefault("userId", self.user_id)
+        try:
+            body = ChatBody(**fields)
+        except ValidationError as e:
+            await self.send_control({"type": "error", "turn": turn_id, "status": 422, "details": str(e)})
+            return
+        WS_TURNS.inc()
+        parent = tracing.parse_traceparent(message.get("traceparent"))
+        self._turns[turn_id] = asyncio.create_task(self.run_turn(turn_id, body, parent))
+
+    async def run_turn(self, turn_id, body: ChatBody, parent: Optional[tracing.SpanContext]):
+        turn = ChatTurn(body, parent=parent)
+        encoder = TurnEncoder(turn_id, compact=self.compact)
+        try:
+            await turn.start()
+            if turn.cached is not None:
+                await self.send(encoder(decode_frames(turn.cached)))
+            else:
+                async with aclosing(turn.stream(self.is_closed, encoder)) as stream:
+                    async for frames in stream:
+                        await self.send(frames)
+            await self.send_control({"type": "done", "turn": turn_id, "traceId": turn.span.trace_id})
+        except TurnRefused as e:
+            error = {"type": "error", "turn": turn_id, "status": e.status_code, "details": e.details}
+            if e.retry_after is not None:
+                error["retryAfter"] = e.retry_after
+            await self.send_control(error)
+        except asyncio.CancelledError:
+            turn.span.set(cancelled=True)
+            if not self.closed:
+                try:
+                    await self.send_control({"type": "done", "turn": turn_id, "traceId": turn.span.trace_id, "cancelled": True})
+                except WebSocketDisconnect:
+                    pass
+            raise
+        except WebSocketDisconnect:
+            pass
+        finally:
+            turn.finish()
+            self._turns.pop(turn_id, None)
+
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Chat over one persistent WebSocket per browser session (see ChatSocket).
+    The compact event framing is used when the client offers the
+    "adk-chat.compact" subprotocol, JSON objects otherwise.
+    """
+    offered = websocket.scope.get("subprotocols") or []
+    subprotocol = next((p for p in (WS_SUBPROTOCOL_COMPACT, WS_SUBPROTOCOL_JSON) if p in offered), None)
+    await websocket.accept(subprotocol=subprotocol)
+    await ChatSocket(websocket, compact=subprotocol == WS_SUBPROTOCOL_COMPACT).serve()
 
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", ADK_URL_RUN, json=payload) as resp:
-                async for chunk in resp.aiter_lines():
-                    if not chunk or not chunk.startswith("data:"):
-                        continue
-                    try:
-                        payload = json.loads(chunk[len("data:"):].strip())
-                        content = payload.get("content", {})
-                        parts = content.get("parts", [])
-                        for part in parts:
-                            if "text" in part:
-                                yield json.dumps({
-                                                    "type": "text",
-                                                    "text": part["text"]
-                                                }) + "\n\n"
-
-                            # Function call
-                            elif "functionCall" in part:
-                                fc = part["functionCall"]
-
-                                # If it's a confirmation request
-                                if fc.get("name") == "adk_request_confirmation":
-                                    original_call = fc.get("args", {}).get("originalFunctionCall", {})
-                                    tool_confirmation = fc.get("args", {}).get("toolConfirmation", {})
-
-                                    # Send both the confirmation ID and original tool info
-                                    tool_confirmation_info = {
-                                        "confirmation_id": fc.get("id"),  # THIS is the ID to use when sending approval
-                                        # "original_tool_id": original_call.get("id"),
-                                        "name": original_call.get("name"),
-                                        # "args": original_call.get("args", {}),
-                                        "hint": tool_confirmation.get("hint"),
-                                    }  
-                                    payload = {
-                                            "type": "tool_confirmation",
-                                            **tool_confirmation_info
-                                        }
-
-                                    yield json.dumps(payload) + "\n\n"
-
-                                else:
-                                    # Regular function call
-                                    func_call_info = {
-                                        # "id": fc.get("id"),
-                                        "name": fc.get("name"),
-                                        # "args": fc.get("args", {})
-                                    }
-                                    payload = {
-                                            "type": "function_call",
-                                            **func_call_info
-                                        }
-                                    yield json.dumps(payload) + "\n\n"
-
-                            # Function response
-                            elif "functionResponse" in part:
-                                fr = part["functionResponse"]
-
-                                payload = {
-                                    "type": "function_response",
-                                    # "response": {
-                                        "name": fr.get("name")
-                                    # }
-                                }
-                                yield json.dumps(payload) + "\n\n"
-                                
-                    except Exception as e:
-                        print("Error parsing chunk:", e)
-                        continue
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream",headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive"
-                })
\ No newline at end of file
+
+@app.get("/metrics")
+async def get_metrics(request: Request, format: Optional[str] = None):
+    """
+    Current proxy counters, gauges and histograms (including span_*_seconds
+    latencies) as JSON, or in the Prometheus text format with ?format=prometheus
+    or when the scraper asks for text/plain / OpenMetrics.
+    """
+    accept = request.headers.get("accept", "")
+    if format == "prometheus" or (format is None and ("text/plain" in accept or "openmetrics" in accept)):
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+    return metrics.snapshot()
+
+
+def _admin_refusal(request: Request) -> Optional[JSONResponse]:
+    """
+    None if the request carries "Authorization: Bearer <PROXY_ADMIN_TOKEN>",
+    otherwise the error response to send. Without a configured token the
+    admin endpoints are disabled.
+    """
+    if not PROXY_ADMIN_TOKEN:
+        return JSONResponse({"status": "fail", "details": "Admin endpoints are disabled (set PROXY_ADMIN_TOKEN)"}, status_code=403)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip().encode(), PROXY_ADMIN_TOKEN.encode()):
+        return JSONResponse({"status": "fail", "details": "Admin token required"}, status_code=401,
+                            headers={"WWW-Authenticate": "Bearer"})
+    return None
+
+
+@app.get("/admission")
+async def get_admission(request: Request):
+    """Admitted and waiting chat turns (admin token required)."""
+    refusal = _admin_refusal(request)
+    if refusal is not None:
+        return refusal
+    return app.state.admission.stats()
+
+
+@app.get("/backends")
+async def get_backends(request: Request):
+    """Health, drain state and open streams of every ADK backend (admin token required)."""
+    refusal = _admin_refusal(request)
+    if refusal is not None:
+        return refusal
+    return app.state.backend_pool.status()
+
+
+@app.post("/backends/drain")
+async def drain_backend(request: Request, url: str = Body(..., embed=True), draining: bool = Body(True, embed=True)):
+    """
+    Stops placing new sessions on a backend (draining=false resumes). Its
+    existing sessions keep running there; once `outstanding` reaches 0 it can
+    be stopped, and any later turns of its sessions fail over. Requires the
+    admin token.
+    """
+    refusal = _admin_refusal(request)
+    if refusal is not None:
+        return refusal
+    try:
+        return app.state.backend_pool.drain(url, draining).to_dict()
+    except KeyError:
+        return JSONResponse({"status": "fail", "details": f"Unknown backend {url}"}, status_code=404)
@@ -0,0 +1,175 @@
+"""
+Minimal in-process metrics registry shared by the proxy and the context/RAG helpers.
+"""
+import threading
+from typing import Dict, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge:
+    """A value that goes up and down; also remembers its high-water mark."""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+            if value > self._max:
+                self._max = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+            if self._value > self._max:
+                self._max = self._value
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def observe_max(self, value: float):
+        """Raises the high-water mark without changing the current value."""
+        with self._lock:
+            if value > self._max:
+                self._max = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    @property
+    def max(self) -> float:
+        return self._max
+
+    def snapshot(self):
+        return {"value": self._value, "max": self._max}
+
+
+class Histogram:
+    def __init__(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self._counts)),
+            }
+
+
+_REGISTRY: Dict[str, object] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str, **kwargs):
+    with _REGISTRY_LOCK:
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            metric = cls(name, description, **kwargs)
+            _REGISTRY[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' is already registered as {type(metric).__name__}")
+        return metric
+
+
+def counter(name: str, description: str = "") -> Counter:
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name: str, description: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, buckets=buckets)
+
+
+def snapshot(prefix: Optional[str] = None) -> Dict[str, object]:
+    """Returns the current value of every registered metric (optionally filtered by name prefix)."""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    return {m.name: m.snapshot() for m in metrics if prefix is None or m.name.startswith(prefix)}
+
+
+def _prometheus_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def render_prometheus(prefix: Optional[str] = None) -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    with _REGISTRY_LOCK:
+        registered = sorted(_REGISTRY.values(), key=lambda m: m.name)
+    lines = []
+    for m in registered:
+        if prefix is not None and not m.name.startswith(prefix):
+            continue
+        help_text = m.description.replace("\\", "\\\\").replace("\n", "\\n")
+        if isinstance(m, Histogram):
+            snap = m.snapshot()
+            lines += [f"# HELP {m.name} {help_text}", f"# TYPE {m.name} histogram"]
+            cumulative = 0
+            for bound, count in snap["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == "+Inf" else _prometheus_value(float(bound))
+                lines.append(f'{m.name}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f"{m.name}_sum {_prometheus_value(snap['sum'])}", f"{m.name}_count {snap['count']}"]
+        elif isinstance(m, Gauge):
+            lines += [f"# HELP {m.name} {help_text}", f"# TYPE {m.name} gauge", f"{m.name} {_prometheus_value(m.value)}"]
+            lines += [f"# HELP {m.name}_max High-water mark of {m.name}", f"# TYPE {m.name}_max gauge",
+                      f"{m.name}_max {_prometheus_value(m.max)}"]
+        else:
+            lines += [f"# HELP {m.name} {help_text}", f"# TYPE {m.name} counter", f"{m.name} {_prometheus_value(m.value)}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,239 @@
+"""
+Semantic response cache for /chat.
+
+Answers to repeated knowledge questions are replayed from memory in the same
+frame format chat_proxy streams, instead of running root_agent -> rag_agent ->
+Gemini again. Entries are keyed on the normalized question, matched either
+exactly or by embedding similarity, and dropped whenever the RAG index stamp
+(see indexVersion.py) changes.
+
+Answers can draw on a user's own conversation history and documents, so every
+entry belongs to one scope (the user) and is only matched within it. Only the
+first turn of a session is looked up or stored: later turns depend on the
+conversation so far ("tell me more about that"). A replayed answer is written
+into the ADK session by the proxy, so the agent knows about it on the next turn.
+"""
+import asyncio
+import os
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+from indexVersion import IndexVersionWatcher
+from sseRelay import encode_frame
+from ttlCache import TTLCache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(256 * 1024)))
+RESPONSE_CACHE_MAX_SESSIONS = int(os.getenv("RESPONSE_CACHE_MAX_SESSIONS", "100000"))  # sessions remembered as past their first turn
+RESPONSE_CACHE_SESSION_TTL = float(os.getenv("RESPONSE_CACHE_SESSION_TTL", str(24 * 3600)))
+
+# A turn is only cached if every tool it called is in this set and at least one
+# of them was called. Tools with side effects (send_email) must never be listed.
+CACHEABLE_TOOLS = frozenset(
+    t.strip() for t in os.getenv("RESPONSE_CACHE_TOOLS", "rag_knowledge_expert").split(",") if t.strip()
+)
+
+RAG_DB_PATH = os.getenv("RAG_DB_PATH", "./chroma_vector_db")
+
+CACHE_HITS = metrics.counter("response_cache_hits_total", "Chat turns answered from the response cache")
+CACHE_SEMANTIC_HITS = metrics.counter("response_cache_semantic_hits_total", "Hits matched by embedding similarity")
+CACHE_MISSES = metrics.counter("response_cache_misses_total", "Cacheable chat turns that went to the agents")
+CACHE_STORES = metrics.counter("response_cache_stores_total", "Answers added to the response cache")
+CACHE_INVALIDATIONS = metrics.counter("response_cache_invalidations_total", "Cache flushes caused by a RAG index rebuild")
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(text: str) -> str:
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", text.strip().lower()))
+
+
+class CachedResponse:
+    __slots__ = ("scope", "query", "frames", "embedding", "size")
+
+    def __init__(self, scope: str, query: str, frames: bytes, embedding):
+        self.scope = scope
+        self.query = query
+        self.frames = frames
+        self.embedding = embedding
+        self.size = len(frames) + len(query) + (embedding.nbytes if embedding is not None else 0)
+
+
+class CacheLookup:
+    """Result of SemanticResponseCache.lookup; pass it back to store() on a miss."""
+
+    __slots__ = ("key", "frames", "embedding", "version")
+
+    def __init__(self, key: Tuple[str, str], frames: Optional[bytes], embedding, version: str):
+        self.key = key  # (scope, normalized query)
+        self.frames = frames
+        self.embedding = embedding
+        self.version = version
+
+
+class TurnRecorder:
+    """Collects the frames of one chat turn and decides whether the answer may be cached."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.frames: List[bytes] = []
+        self.size = 0
+        self.tools = set()
+        self.blocked = False
+        self.completed = False
+
+    def observe(self, event: dict):
+        """Sees every downstream event; frames are kept in /chat framing whatever the transport."""
+        kind = event.get("type")
+        if kind in ("tool_confirmation", "error"):
+            self.blocked = True
+        elif kind == "function_call":
+            self.tools.add(event.get("name"))
+        self.add_frames(encode_frame(event))
+
+    def add_frames(self, frames: bytes):
+        if self.blocked:
+            return
+        self.size += len(frames)
+        if self.size > self.max_bytes:
+            self.blocked = True
+            self.frames = []
+            return
+        self.frames.append(frames)
+
+    def cacheable(self, allowed_tools: Sequence[str] = CACHEABLE_TOOLS) -> bool:
+        return self.completed and not self.blocked and bool(self.tools) and self.tools <= set(allowed_tools)
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        db_path: str = RAG_DB_PATH,
+    ):
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._entries = TTLCache(
+            max_entries=max_entries,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: entry.size,
+            on_evict=self._on_evict,
+        )
+        self._index_version = IndexVersionWatcher(db_path)
+        self._version = self._index_version.current()
+        self._sessions = TTLCache(max_entries=RESPONSE_CACHE_MAX_SESSIONS, ttl=RESPONSE_CACHE_SESSION_TTL)
+        self._matrices: Dict[str, Tuple[List[Tuple[str, str]], object]] = {}  # scope -> (keys, embedding matrix)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def first_turn(self, session_id: str) -> bool:
+        """True until record_turn() has been called for the session."""
+        return self._sessions.get(session_id) is None
+
+    def record_turn(self, session_id: str):
+        """Marks the session as past its first turn; call it once a turn has actually started."""
+        self._sessions.set(session_id, True)
+
+    async def lookup(self, text: str, scope: str) -> CacheLookup:
+        """scope: whose answers may be replayed (the user); entries of other scopes never match."""
+        self._check_index_version()
+        query = normalize_query(text)
+        key = (scope, query)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            CACHE_HITS.inc()
+            return CacheLookup(key, entry.frames, entry.embedding, self._version)
+
+        embedding = None
+        if self.embed_fn is not None:
+            try:
+                embedding = _unit_vector(await asyncio.to_thread(self.embed_fn, query))
+            except Exception as e:
+                print(f"Response cache embedding failed, exact matching only: {e!r}")
+            if embedding is not None:
+                match = self._nearest(embedding, scope)
+                if match is not None:
+                    CACHE_HITS.inc()
+                    CACHE_SEMANTIC_HITS.inc()
+                    return CacheLookup(key, match.frames, embedding, self._version)
+
+        CACHE_MISSES.inc()
+        return CacheLookup(key, None, embedding, self._version)
+
+    def store(self, lookup: CacheLookup, frames: bytes):
+        # The index may have been rebuilt while the answer was streaming.
+        self._check_index_version()
+        if lookup.version != self._version or not frames:
+            return
+        scope, query = lookup.key
+        self._entries.set(lookup.key, CachedResponse(scope, query, frames, lookup.embedding))
+        self._matrices.pop(scope, None)
+        CACHE_STORES.inc()
+
+    def clear(self):
+        self._entries.clear()
+        self._matrices = {}
+
+    # --- internals ---
+    def _check_index_version(self):
+        version = self._index_version.current()
+        if version != self._version:
+            self._version = version
+            self.clear()
+            CACHE_INVALIDATIONS.inc()
+
+    def _on_evict(self, key, entry):
+        self._matrices.pop(entry.scope, None)
+
+    def _nearest(self, embedding, scope: str) -> Optional[CachedResponse]:
+        import numpy as np
+
+        if scope not in self._matrices:
+            live = [(k, e) for k, e in self._entries.items() if e.scope == scope and e.embedding is not None]
+            self._matrices[scope] = ([k for k, _ in live], np.stack([e.embedding for _, e in live]) if live else None)
+        keys, matrix = self._matrices[scope]
+        if matrix is None:
+            return None
+
+        scores = matrix @ embedding
+        best = int(scores.argmax())
+        if scores[best] < self.similarity_threshold:
+            return None
+        # get() refreshes LRU order and skips entries that expired since the matrix was built.
+        return self._entries.get(keys[best])
+
+
+def _unit_vector(values):
+    import numpy as np
+
+    vector = np.asarray(values, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else None
+
+
+def default_embed_fn() -> Callable[[str], List[float]]:
+    """Query embedder for semantic matching; imported lazily so the proxy starts without Azure credentials."""
+    from embeddingService import get_embedding_service
+
+    return get_embedding_service().embed_query
+
+
+def create_response_cache() -> Optional[SemanticResponseCache]:
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    embed_fn = default_embed_fn() if RESPONSE_CACHE_SEMANTIC else None
+    return SemanticResponseCache(embed_fn=embed_fn)
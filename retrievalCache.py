@@ -0,0 +1,167 @@
+"""
+Two-level cache for the RAG retriever tool.
+
+- query text -> query embedding, in front of the embedding service, so the
+  vector store does not re-embed a question it has seen recently.
+- (query, k, filters, index version) -> formatted tool results, so a question
+  repeated within one agent run or by another user skips the search entirely.
+
+Both levels are bounded LRU caches with a TTL. Result entries are dropped when
+the RAG index stamp changes (see indexVersion.py); query embeddings only depend
+on the embedding model and are kept.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+import metrics
+from indexVersion import IndexVersionWatcher
+from responseCache import normalize_query
+from ttlCache import TTLCache
+
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+RETRIEVAL_CACHE_MAX_BYTES = int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+QUERY_EMBEDDING_CACHE_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_ENTRIES", "5000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+RESULT_HITS = metrics.counter("retrieval_cache_hits_total", "Retriever calls answered from the result cache")
+RESULT_MISSES = metrics.counter("retrieval_cache_misses_total", "Retriever calls that ran a search")
+RESULT_INVALIDATIONS = metrics.counter("retrieval_cache_invalidations_total", "Result cache flushes caused by a RAG index rebuild")
+EMBEDDING_HITS = metrics.counter("query_embedding_cache_hits_total", "Query embeddings served from memory")
+EMBEDDING_MISSES = metrics.counter("query_embedding_cache_misses_total", "Query embeddings computed by the embedding service")
+
+_ENTRY_OVERHEAD = 200  # rough per-entry bookkeeping cost in bytes
+
+
+def _results_size(results: List[str]) -> int:
+    return sum(len(r) for r in results) + _ENTRY_OVERHEAD
+
+
+class CachedQueryEmbeddings:
+    """Embeddings wrapper: embed_query goes through the cache, everything else is passed through."""
+
+    def __init__(self, embeddings, cache: TTLCache):
+        self.embeddings = embeddings
+        self._cache = cache
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cache.get(text)
+        if vector is not None:
+            EMBEDDING_HITS.inc()
+            return vector
+        EMBEDDING_MISSES.inc()
+        vector = self.embeddings.embed_query(text)
+        self._cache.set(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._cache.get(text)
+        if vector is not None:
+            EMBEDDING_HITS.inc()
+            return vector
+        EMBEDDING_MISSES.inc()
+        vector = await self.embeddings.aembed_query(text)
+        self._cache.set(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_query for several texts: cached ones are served from memory, the rest go out in one request."""
+        vectors = [self._cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        EMBEDDING_HITS.inc(len(texts) - sum(vector is None for vector in vectors))
+        if not missing:
+            return vectors
+        EMBEDDING_MISSES.inc(len(missing))
+        fresh = dict(zip(missing, self.embeddings.embed_documents(missing)))
+        for text, vector in fresh.items():
+            self._cache.set(text, vector)
+        return [fresh[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+
+class RetrievalCache:
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl: float = RETRIEVAL_CACHE_TTL,
+        max_bytes: int = RETRIEVAL_CACHE_MAX_BYTES,
+        embedding_entries: int = QUERY_EMBEDDING_CACHE_ENTRIES,
+        embedding_ttl: float = QUERY_EMBEDDING_CACHE_TTL,
+        enabled: bool = RETRIEVAL_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self._results = TTLCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes, sizeof=_results_size)
+        self._embeddings = TTLCache(max_entries=embedding_entries, ttl=embedding_ttl)
+        self._index_version = IndexVersionWatcher(db_path)
+        self._version = self._index_version.current()
+
+    def wrap_embeddings(self, embeddings):
+        """Returns the embedding function to hand to the vector store."""
+        if not self.enabled:
+            return embeddings
+        return CachedQueryEmbeddings(embeddings, self._embeddings)
+
+    def get(self, query: str, k: int, filters: Optional[Dict] = None) -> Optional[List[str]]:
+        if not self.enabled:
+            return None
+        results = self._results.get(self._key(query, k, filters))
+        if results is None:
+            RESULT_MISSES.inc()
+            return None
+        RESULT_HITS.inc()
+        return list(results)
+
+    def put(self, query: str, k: int, results: List[str], filters: Optional[Dict] = None, version: Optional[str] = None):
+        """
+        version: index stamp read before the search started; results computed
+                 against an index that has since been replaced are not stored.
+        """
+        if not self.enabled:
+            return
+        key = self._key(query, k, filters)
+        if version is not None and version != key[-1]:
+            return
+        self._results.set(key, list(results))
+
+    @property
+    def version(self) -> str:
+        self._check_index_version()
+        return self._version
+
+    def stats(self) -> Dict[str, float]:
+        def rate(cache: TTLCache) -> float:
+            total = cache.hits + cache.misses
+            return cache.hits / total if total else 0.0
+
+        return {
+            "result_entries": len(self._results),
+            "result_hit_rate": rate(self._results),
+            "embedding_entries": len(self._embeddings),
+            "embedding_hit_rate": rate(self._embeddings),
+        }
+
+    def clear(self):
+        self._results.clear()
+        self._embeddings.clear()
+
+    def _key(self, query: str, k: int, filters: Optional[Dict]):
+        self._check_index_version()
+        return (normalize_query(query), k, json.dumps(filters, sort_keys=True) if filters else "", self._version)
+
+    def _check_index_version(self):
+        version = self._index_version.current()
+        if version != self._version:
+            self._version = version
+            self._results.clear()
+            RESULT_INVALIDATIONS.inc()
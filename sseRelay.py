@@ -0,0 +1,254 @@
+"""
+Incremental relay from the ADK `run_sse` byte stream to downstream events.
+
+The relay turns upstream bytes into events ({"type": "text" | "function_call" |
+"function_response" | "tool_confirmation" | "error", ...}) and hands each batch
+to an encoder:
+- encode_frames (default): what home.html reads over /chat, one JSON object
+  per frame, frames separated by a blank line;
+- TurnEncoder: one WebSocket message per batch, tagged with the turn id, with
+  the events either as JSON objects or in the compact array form.
+"""
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+    def _loads(data):
+        return json.loads(bytes(data))
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+FRAME_SEPARATOR = b"\n\n"
+
+# Adjacent text deltas are merged into one frame until it reaches this size...
+FRAME_MAX_BYTES = int(os.getenv("RELAY_FRAME_MAX_BYTES", "1024"))
+# ...or until the oldest pending delta is this old (seconds). 0 = flush after every upstream read.
+FRAME_MAX_DELAY = float(os.getenv("RELAY_FRAME_MAX_DELAY", "0"))
+
+RELAY_MALFORMED_EVENTS = metrics.counter("proxy_relay_malformed_events_total", "Upstream SSE events skipped because they could not be parsed")
+
+_DATA_PREFIX = b"data:"
+_PARTS_MARKER = b'"parts"'
+
+
+def encode_frame(event: Dict[str, Any]) -> bytes:
+    return _dumps(event) + FRAME_SEPARATOR
+
+
+def encode_frames(events: List[Dict[str, Any]]) -> bytes:
+    return b"".join([_dumps(event) + FRAME_SEPARATOR for event in events])
+
+
+def decode_frames(frames: bytes) -> List[Dict[str, Any]]:
+    """Inverse of encode_frames (e.g. to re-encode a cached answer for another transport)."""
+    return [_loads(frame) for frame in frames.split(FRAME_SEPARATOR) if frame.strip()]
+
+
+# Compact event form: [code, ...fields]; roughly halves the bytes of short text deltas.
+COMPACT_TEXT = "t"
+COMPACT_FUNCTION_CALL = "f"
+COMPACT_FUNCTION_RESPONSE = "r"
+COMPACT_TOOL_CONFIRMATION = "c"
+
+
+def compact_event(event: Dict[str, Any]) -> list:
+    kind = event.get("type")
+    if kind == "text":
+        return [COMPACT_TEXT, event["text"]]
+    if kind == "tool_confirmation":
+        return [COMPACT_TOOL_CONFIRMATION, event.get("confirmation_id"), event.get("name"), event.get("hint")]
+    if kind == "function_call":
+        return [COMPACT_FUNCTION_CALL, event.get("name")]
+    if kind == "function_response":
+        return [COMPACT_FUNCTION_RESPONSE, event.get("name")]
+    return [kind, event]
+
+
+def _as_dict(value) -> Dict[str, Any]:
+    return value if isinstance(value, dict) else {}
+
+
+class TurnEncoder:
+    """
+    Encodes a batch of events as one multiplexed message:
+      {"turn": id, "events": [{...}, ...]}   (JSON framing)
+      [id, [[code, ...], ...]]               (compact framing)
+    """
+
+    def __init__(self, turn_id: str, compact: bool = False):
+        self.turn_id = turn_id
+        self.compact = compact
+
+    def __call__(self, events: List[Dict[str, Any]]) -> bytes:
+        if self.compact:
+            return _dumps([self.turn_id, [compact_event(e) for e in events]])
+        return _dumps({"turn": self.turn_id, "events": events})
+
+
+class SSERelay:
+    """
+    Feed raw upstream bytes in, get encoded downstream frames out.
+
+    Lines are split without decoding the whole stream, events without any
+    `parts` are skipped before JSON parsing, and consecutive text parts are
+    coalesced into a single frame bounded by FRAME_MAX_BYTES / FRAME_MAX_DELAY.
+    """
+
+    def __init__(
+        self,
+        max_frame_bytes: int = FRAME_MAX_BYTES,
+        max_delay: float = FRAME_MAX_DELAY,
+        observer: Optional[Callable[[Dict[str, Any]], None]] = None,
+        clock=time.monotonic,
+        encoder: Callable[[List[Dict[str, Any]]], bytes] = encode_frames,
+    ):
+        self.max_frame_bytes = max_frame_bytes
+        self.max_delay = max_delay
+        self.observer = observer  # called with every downstream event before it is encoded
+        self.encoder = encoder  # events of one feed/flush -> bytes sent downstream
+        self._clock = clock
+        self._buffer = bytearray()
+        self._text: List[str] = []
+        self._text_size = 0
+        self._text_since = 0.0
+
+    # --- public API ---
+    def feed(self, chunk: bytes) -> bytes:
+        """Consumes one upstream read and returns the frames that are ready (possibly b"")."""
+        out: List[Dict[str, Any]] = []
+        buf = self._buffer
+        buf += chunk
+
+        start = 0
+        view = memoryview(buf)
+        try:
+            while True:
+                end = buf.find(b"\n", start)
+                if end < 0:
+                    break
+                self._handle_line(buf, view, start, end, out)
+                start = end + 1
+        finally:
+            view.release()
+        if start:
+            del buf[:start]
+
+        if self._text and (self.max_delay <= 0 or self._clock() - self._text_since >= self.max_delay):
+            self._flush_text(out)
+        return self.encoder(out) if out else b""
+
+    def flush(self) -> bytes:
+        """Returns any pending coalesced text as a frame."""
+        out: List[Dict[str, Any]] = []
+        self._flush_text(out)
+        return self.encoder(out) if out else b""
+
+    def flush_timeout(self) -> Optional[float]:
+        """Seconds until pending text is due for flushing, or None if nothing is pending."""
+        if not self._text:
+            return None
+        return max(0.0, self.max_delay - (self._clock() - self._text_since))
+
+    def flush_due(self) -> bytes:
+        """Flushes pending text only if it has waited at least max_delay."""
+        if self._text and self._clock() - self._text_since >= self.max_delay:
+            return self.flush()
+        return b""
+
+    def error(self, details: str, status_code: int) -> bytes:
+        """Flushes pending text, then a {"type": "error", "status": "fail"} event for a failed upstream request."""
+        out: List[Dict[str, Any]] = []
+        self._flush_text(out)
+        self._emit({"type": "error", "status": "fail", "code": status_code, "details": details}, out)
+        return self.encoder(out)
+
+    def close(self) -> bytes:
+        """Handles a trailing line without a newline and flushes pending text."""
+        out: List[Dict[str, Any]] = []
+        if self._buffer:
+            buf = bytes(self._buffer)
+            self._handle_line(buf, memoryview(buf), 0, len(buf), out)
+            self._buffer.clear()
+        self._flush_text(out)
+        return self.encoder(out) if out else b""
+
+    # --- internals ---
+    def _handle_line(self, buf, view: memoryview, start: int, end: int, out: List[Dict[str, Any]]):
+        if not buf.startswith(_DATA_PREFIX, start, end):
+            return
+        # Fast path: state/usage-only events carry no parts and never reach the client.
+        if buf.find(_PARTS_MARKER, start, end) < 0:
+            return
+        try:
+            event = _loads(view[start + len(_DATA_PREFIX):end])
+            content = event.get("content") or {}
+            for part in content.get("parts") or ():
+                self._handle_part(part, out)
+        except Exception:
+            # Invalid JSON or an unexpected shape (e.g. a list where an object belongs): the event
+            # is skipped, as the baseline proxy did, and the rest of the stream is still relayed.
+            RELAY_MALFORMED_EVENTS.inc()
+
+    def _handle_part(self, part, out: List[Dict[str, Any]]):
+        if not isinstance(part, dict):
+            RELAY_MALFORMED_EVENTS.inc()
+            return
+        if "text" in part:
+            if isinstance(part["text"], str):
+                self._add_text(part["text"], out)
+        elif isinstance(part.get("functionCall"), dict):
+            self._flush_text(out)
+            self._emit(self._function_call_event(part["functionCall"]), out)
+        elif isinstance(part.get("functionResponse"), dict):
+            self._flush_text(out)
+            self._emit({"type": "function_response", "name": part["functionResponse"].get("name")}, out)
+
+    def _add_text(self, text: str, out: List[Dict[str, Any]]):
+        if not text:
+            return
+        if not self._text:
+            self._text_since = self._clock()
+        self._text.append(text)
+        self._text_size += len(text)
+        if self._text_size >= self.max_frame_bytes:
+            self._flush_text(out)
+
+    def _flush_text(self, out: List[Dict[str, Any]]):
+        if not self._text:
+            return
+        text = self._text[0] if len(self._text) == 1 else "".join(self._text)
+        self._emit({"type": "text", "text": text}, out)
+        self._text = []
+        self._text_size = 0
+
+    def _emit(self, event: Dict[str, Any], out: List[Dict[str, Any]]):
+        if self.observer is not None:
+            self.observer(event)
+        out.append(event)
+
+    @staticmethod
+    def _function_call_event(fc: Dict[str, Any]) -> Dict[str, Any]:
+        if fc.get("name") == "adk_request_confirmation":
+            args = _as_dict(fc.get("args"))
+            original_call = _as_dict(args.get("originalFunctionCall"))
+            tool_confirmation = _as_dict(args.get("toolConfirmation"))
+            return {
+                "type": "tool_confirmation",
+                "confirmation_id": fc.get("id"),  # THIS is the ID to use when sending approval
+                "name": original_call.get("name"),
+                "hint": tool_confirmation.get("hint"),
+            }
+        return {"type": "function_call", "name": fc.get("name")}
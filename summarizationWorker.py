@@ -0,0 +1,128 @@
+"""
+Background worker that runs conversation summarization off the request path.
+
+Requests for the same user are debounced (one queued job per user at a time),
+a fixed number of worker threads bounds concurrent LLM calls, and when the
+queue is full new requests are skipped: the user's next message asks again.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import metrics
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", "1000"))
+SUMMARY_DEBOUNCE_SECONDS = float(os.getenv("SUMMARY_DEBOUNCE_SECONDS", "5"))
+
+SUMMARY_QUEUE_DEPTH = metrics.gauge("summary_queue_depth", "Users waiting for background summarization")
+SUMMARY_SECONDS = metrics.histogram("summary_seconds", "Latency of one background summarization")
+SUMMARY_COALESCED = metrics.counter("summary_coalesced_total", "Requests merged into an already queued job")
+SUMMARY_SKIPPED = metrics.counter("summary_skipped_total", "Requests dropped because the queue was full")
+SUMMARY_FAILED = metrics.counter("summary_failed_total", "Summarizations that raised")
+
+_STOP = object()
+
+
+class SummarizationWorker:
+    def __init__(
+        self,
+        summarize_fn: Callable[[str], None],
+        concurrency: int = SUMMARY_CONCURRENCY,
+        queue_size: int = SUMMARY_QUEUE_SIZE,
+        debounce: float = SUMMARY_DEBOUNCE_SECONDS,
+    ):
+        """
+        summarize_fn: called with a user_id on a worker thread; must be safe to
+                      call when there turns out to be nothing to summarize.
+        """
+        self.summarize_fn = summarize_fn
+        self.concurrency = concurrency
+        self.debounce = debounce
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._pending: Dict[str, float] = {}  # user_id -> earliest start time
+        self._lock = threading.Lock()
+        self._user_locks: Dict[str, List] = {}  # user_id -> [lock, holders]; removed when no job holds it
+        self._threads = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, user_id: str) -> bool:
+        """Schedules summarization for the user. Returns False if the request was dropped."""
+        with self._lock:
+            if not self._threads:
+                self._start()
+            if user_id in self._pending:
+                SUMMARY_COALESCED.inc()
+                return True
+            try:
+                self._queue.put_nowait(user_id)
+            except queue.Full:
+                SUMMARY_SKIPPED.inc()
+                return False
+            self._pending[user_id] = time.monotonic() + self.debounce
+            SUMMARY_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def join(self):
+        """Blocks until every queued job has finished (useful for scripts and benchmarks)."""
+        self._queue.join()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"summarizer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @contextmanager
+    def _user_lock(self, user_id: str):
+        """Serializes jobs of one user; the lock only exists while a job holds or waits for it."""
+        with self._lock:
+            entry = self._user_locks.setdefault(user_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._user_locks[user_id]
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            if user_id is _STOP:
+                self._queue.task_done()
+                return
+            try:
+                # FIFO with a fixed debounce, so the head of the queue is always due first.
+                delay = self._pending.get(user_id, 0.0) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._lock:
+                    self._pending.pop(user_id, None)
+                    SUMMARY_QUEUE_DEPTH.set(self._queue.qsize())
+
+                with self._user_lock(user_id):
+                    started = time.perf_counter()
+                    self.summarize_fn(user_id)
+                    SUMMARY_SECONDS.observe(time.perf_counter() - started)
+            except Exception as e:
+                SUMMARY_FAILED.inc()
+                print(f"Background summarization failed for user_id '{user_id}': {e!r}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from admissionControl import PRIORITY_CONFIRMATION, PRIORITY_PROMPT, AdmissionController, AdmissionRejected
+
+
+def controller(**kwargs) -> AdmissionController:
+    kwargs.setdefault("max_streams", 1)
+    kwargs.setdefault("rate_per_minute", 0)
+    return AdmissionController(**kwargs)
+
+
+def test_released_slot_goes_to_a_confirmation_before_earlier_prompts():
+    async def run():
+        admission = controller()
+        first = await admission.acquire("u1")
+        prompt = asyncio.create_task(admission.acquire("u2", PRIORITY_PROMPT))
+        await asyncio.sleep(0)
+        confirmation = asyncio.create_task(admission.acquire("u3", PRIORITY_CONFIRMATION))
+        await asyncio.sleep(0)
+        assert admission.stats()["waiting_confirmations"] == admission.stats()["waiting_prompts"] == 1
+
+        first.release()
+        first.release()  # idempotent: must not free a second slot
+        ticket = await confirmation
+        assert not prompt.done() and admission.active == 1
+        ticket.release()
+        (await prompt).release()
+        return admission
+
+    assert asyncio.run(run()).active == 0
+
+
+def test_turn_cancelled_as_the_slot_is_handed_over_passes_it_on():
+    async def run():
+        admission = controller()
+        first = await admission.acquire("u1")
+        unlucky = asyncio.create_task(admission.acquire("u2"))
+        next_in_line = asyncio.create_task(admission.acquire("u3"))
+        await asyncio.sleep(0)
+
+        first.release()  # hands the slot to `unlucky`...
+        unlucky.cancel()  # ...which is cancelled before it could take it
+        with pytest.raises(asyncio.CancelledError):
+            await unlucky
+        ticket = await asyncio.wait_for(next_in_line, timeout=1)
+        assert admission.active == 1
+        ticket.release()
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.active == 0 and admission.waiting == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        admission = controller()
+        first = await admission.acquire("u1")
+        waiter = asyncio.create_task(admission.acquire("u2"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert admission.waiting == 0
+        first.release()
+        return admission
+
+    assert asyncio.run(run()).active == 0
+
+
+def test_full_queue_and_long_wait_are_503():
+    async def run():
+        admission = controller(queue_size=1, queue_timeout=0.05)
+        await admission.acquire("u1")
+        waiter = asyncio.create_task(admission.acquire("u2"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await admission.acquire("u3")
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await waiter
+        return full.value, timed_out.value, admission
+
+    full, timed_out, admission = asyncio.run(run())
+    assert (full.status_code, timed_out.status_code) == (503, 503)
+    assert full.retry_after >= 1
+    assert admission.active == 1 and admission.waiting == 0
+
+
+def test_prompts_are_rate_limited_per_user_but_confirmations_are_not():
+    async def run():
+        admission = controller(max_streams=0, rate_per_minute=60, burst=2)
+        await admission.acquire("u1")
+        await admission.acquire("u1")
+        with pytest.raises(AdmissionRejected) as limited:
+            await admission.acquire("u1")
+        await admission.acquire("u1", PRIORITY_CONFIRMATION)
+        await admission.acquire("u2")
+        return limited.value
+
+    limited = asyncio.run(run())
+    assert limited.status_code == 429 and limited.retry_after == 1
+
+
+def test_admission_stats_endpoint_requires_the_admin_token(monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main.app.state, "admission", controller(), raising=False)
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "PROXY_ADMIN_TOKEN", "")
+    assert client.get("/admission", headers={"Authorization": "Bearer anything"}).status_code == 403
+
+    monkeypatch.setattr(main, "PROXY_ADMIN_TOKEN", "s3cret")
+    assert client.get("/admission").status_code == 401
+    assert client.get("/admission", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    allowed = client.get("/admission", headers={"Authorization": "Bearer s3cret"})
+    assert allowed.status_code == 200 and allowed.json()["max_streams"] == 1
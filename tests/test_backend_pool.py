@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("httpx")
+
+from backendPool import BackendPool, NoBackendAvailable  # noqa: E402
+
+URLS = [f"http://adk-{i}:8000" for i in range(4)]
+
+
+def test_placement_is_stable_and_spread_over_backends():
+    pool = BackendPool(URLS, choices=1)
+    placed = {f"session-{i}": pool.place(f"session-{i}").url for i in range(400)}
+
+    assert placed == {sid: BackendPool(URLS, choices=1).place(sid).url for sid in placed}
+    counts = [list(placed.values()).count(url) for url in URLS]
+    assert min(counts) > 400 / len(URLS) / 2
+
+
+def test_removing_a_backend_only_moves_its_own_sessions():
+    before = BackendPool(URLS, choices=1)
+    after = BackendPool(URLS[:-1], choices=1)
+    for i in range(400):
+        old = before.place(f"session-{i}").url
+        if old != URLS[-1]:
+            assert after.place(f"session-{i}").url == old
+
+
+def test_least_busy_of_the_candidates_gets_a_new_session():
+    pool = BackendPool(URLS, choices=2)
+    first, second = list(pool._candidates("session-x"))[:2]
+    with pool.stream(first):
+        assert pool.place("session-x") is second
+    assert pool.place("session-x") is first
+
+
+def test_draining_and_unhealthy_backends_get_no_new_sessions():
+    pool = BackendPool(URLS, choices=1)
+    home = pool.place("session-y")
+    pool.drain(home.url + "/")
+    assert pool.place("session-y") is not home
+
+    for backend in pool.backends.values():
+        backend.draining = True
+    assert pool.place("session-y").healthy  # all draining: still placed
+
+    for backend in pool.backends.values():
+        for _ in range(3):
+            pool.report_failure(backend)
+    with pytest.raises(NoBackendAvailable):
+        pool.place("session-y")
+    with pytest.raises(KeyError):
+        pool.drain("http://unknown:8000")
@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from blobCache import BlobCache, BlobRejected
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8192  # 2 MiB, several flushes of received chunks
+
+
+async def chunked(data: bytes, size: int = 1 << 16):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def put(cache: BlobCache, data: bytes):
+    return asyncio.run(cache.put_stream(chunked(data)))
+
+
+def leftover_uploads(cache: BlobCache):
+    return [name for name in os.listdir(cache.directory) if name.endswith(".tmp")]
+
+
+def test_upload_is_stored_under_its_sha256(tmp_path):
+    cache = BlobCache(directory=str(tmp_path), max_dimension=0)
+    blob = put(cache, PNG)
+
+    assert blob.hash == hashlib.sha256(PNG).hexdigest()
+    assert blob.mime_type == "image/png"
+    with open(os.path.join(str(tmp_path), blob.hash[:2], blob.hash), "rb") as f:
+        assert f.read() == PNG
+    assert leftover_uploads(cache) == []
+
+
+def test_second_upload_of_the_same_image_is_deduplicated(tmp_path):
+    cache = BlobCache(directory=str(tmp_path), max_dimension=0)
+    first = put(cache, PNG)
+    second = put(cache, PNG)
+
+    assert second.hash == first.hash
+    assert cache.stats()["disk_bytes"] == len(PNG)
+
+
+def test_stored_image_is_read_back_from_disk(tmp_path):
+    blob = put(BlobCache(directory=str(tmp_path), max_dimension=0), PNG)
+    reopened = BlobCache(directory=str(tmp_path))
+
+    assert asyncio.run(reopened.get(blob.hash)).data == PNG
+    assert asyncio.run(reopened.get("not-a-hash")) is None
+
+
+@pytest.mark.parametrize("data, status", [(b"plain text, not an image at all", 415), (PNG + b"\0", 413)])
+def test_rejected_upload_leaves_no_temporary_file(tmp_path, data, status):
+    cache = BlobCache(directory=str(tmp_path), max_upload_bytes=len(PNG))
+    with pytest.raises(BlobRejected) as rejected:
+        put(cache, data)
+
+    assert rejected.value.status_code == status
+    assert leftover_uploads(cache) == []
+    assert cache.stats()["disk_bytes"] == 0
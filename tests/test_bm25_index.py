@@ -0,0 +1,74 @@
+import pytest
+
+import bm25Index
+from bm25Index import BM25Index, tokenize
+
+CHUNKS = {
+    "hr-1": "The vacation policy grants 25 days of paid leave per year.",
+    "hr-2": "HR-104 covers the sick leave policy and the doctor's note.",
+    "it-1": "The laptop refresh cycle is three years for every employee.",
+    "it-2": "The docking station LT-4471-B is the standard for the office.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(list(CHUNKS), list(CHUNKS.values()), [{"source": chunk_id} for chunk_id in CHUNKS])
+    yield index
+    index._conn.close()
+
+
+def df(index, term):
+    row = index._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+    return row[0] if row else 0
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("See LT-4471-B.") == ["see", "lt-4471-b", "lt", "4471", "b"]
+
+
+def test_exact_identifier_ranks_first(index):
+    assert index.search("What does HR-104 say?", k=2)[0][0] == "hr-2"
+    assert index.search("LT-4471-B", k=1)[0][0] == "it-2"
+
+
+def test_stopwords_do_not_score(index):
+    # "the" is in every chunk; only "laptop" should decide the ranking
+    assert [chunk_id for chunk_id, _ in index.search("the laptop", k=4)] == ["it-1"]
+
+
+def test_stopword_only_query_still_searches(index):
+    assert index.search("the", k=4)
+
+
+def test_document_frequencies_follow_adds_and_deletes(index):
+    assert df(index, "policy") == 2
+    index.delete(["hr-1"])
+    assert df(index, "policy") == 1
+    assert df(index, "vacation") == 0
+    index.add(["hr-1"], [CHUNKS["hr-1"]], [{}])
+    index.add(["hr-1"], [CHUNKS["hr-1"]], [{}])  # re-adding a chunk replaces it
+    assert df(index, "policy") == 2
+
+
+def test_terms_are_rebuilt_for_an_older_index(tmp_path, index):
+    index._conn.execute("DELETE FROM terms")
+    reopened = BM25Index(str(tmp_path))
+    assert df(reopened, "leave") == 2
+    assert reopened.search("vacation", k=1)[0][0] == "hr-1"
+    reopened._conn.close()
+
+
+def test_postings_per_term_are_capped(index, monkeypatch):
+    monkeypatch.setattr(bm25Index, "BM25_MAX_POSTINGS", 1)
+    monkeypatch.setattr(bm25Index, "BM25_MAX_DF_RATIO", 1.0)
+    assert len(index.search("leave", k=4)) == 1
+
+
+def test_top_postings_of_a_term_are_read_from_an_index(index):
+    plan = index._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT chunk_id, tf FROM postings WHERE term = ? ORDER BY tf DESC LIMIT ?", ("leave", 10)
+    ).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "postings_term_tf" in details and "TEMP B-TREE" not in details
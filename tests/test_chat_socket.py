@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import main  # noqa: E402
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+class BlockingTurn:
+    """Stands in for ChatTurn: start() waits until the turn is cancelled."""
+
+    def __init__(self, body, parent=None):
+        self.span = main.tracing.start_span("test.turn")
+
+    async def start(self):
+        await asyncio.Event().wait()
+
+    def finish(self):
+        self.span.end()
+
+
+@pytest.mark.parametrize("turn_id", [["a"], {"id": 1}, True, 1.5])
+def test_unusable_turn_id_is_rejected_without_closing_the_socket(turn_id):
+    socket = main.ChatSocket(FakeWebSocket(), compact=False)
+
+    async def run():
+        await socket.dispatch({"type": "chat", "turn": turn_id, "text": "hi", "sessionId": "s1"})
+        await socket.dispatch({"type": "cancel", "turn": turn_id})
+
+    asyncio.run(run())
+    assert socket.websocket.sent == [
+        {"type": "error", "turn": turn_id, "status": 400, "details": "Turn id must be a string or an integer"}]
+    assert not socket.closed
+
+
+def test_cancelled_turn_reports_done_and_stays_cancelled(monkeypatch):
+    monkeypatch.setattr(main, "ChatTurn", BlockingTurn)
+    socket = main.ChatSocket(FakeWebSocket(), compact=False)
+
+    async def run():
+        await socket.dispatch({"type": "chat", "turn": 7, "text": "hi", "sessionId": "s1"})
+        task = socket._turns[7]
+        await asyncio.sleep(0)
+        await socket.dispatch({"type": "cancel", "turn": 7})
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert socket.websocket.sent[-1]["cancelled"] is True
+    assert socket._turns == {}
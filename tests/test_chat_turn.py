@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import main  # noqa: E402
+from admissionControl import AdmissionController  # noqa: E402
+from backendPool import BackendPool  # noqa: E402
+from responseCache import SemanticResponseCache  # noqa: E402
+from sseRelay import encode_frames  # noqa: E402
+
+BACKEND = "http://adk:8000"
+QUESTION = "How many vacation days do I get?"
+ANSWER = encode_frames([{"type": "text", "text": "25 days."}])
+
+
+class FakeADK:
+    """Session endpoints of an ADK api_server, with sessions kept as lists of events."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.runs = 0
+
+    def __call__(self, request):
+        parts = request.url.path.strip("/").split("/")  # apps/<app>/users/<user>/sessions[/<id>]
+        if parts == ["run_sse"]:
+            self.runs += 1
+            return main.httpx.Response(200, content=b"")
+        session_id = parts[5] if len(parts) > 5 else json.loads(request.content)["session_id"]
+        if request.method == "GET":
+            if session_id not in self.sessions:
+                return main.httpx.Response(404)
+            return main.httpx.Response(200, json={"id": session_id, "events": self.sessions[session_id]})
+        if request.method == "DELETE":
+            self.sessions.pop(session_id, None)
+            return main.httpx.Response(200)
+        events = json.loads(request.content).get("events") or []
+        self.sessions[session_id] = events
+        return main.httpx.Response(200, json={"id": session_id, "events": events})
+
+
+def start_turn(monkeypatch, tmp_path, sessions, admission=None):
+    adk = FakeADK(sessions)
+    client = main.httpx.AsyncClient(transport=main.httpx.MockTransport(adk))
+    cache = SemanticResponseCache(db_path=str(tmp_path))
+    for name, value in (("http_client", client), ("backend_pool", BackendPool([BACKEND], client=client)),
+                        ("response_cache", cache), ("admission", admission or AdmissionController())):
+        monkeypatch.setattr(main.app.state, name, value, raising=False)
+
+    async def run():
+        cache.store(await cache.lookup(QUESTION, scope="alice"), ANSWER)
+        turn = main.ChatTurn(main.ChatBody(sessionId="s1", userId="alice", text=QUESTION))
+        try:
+            await turn.start()
+            return turn, None
+        except main.TurnRefused as e:
+            return turn, e
+        finally:
+            turn.finish()
+            await client.aclose()
+
+    turn, refused = asyncio.run(run())
+    return turn, refused, cache, adk
+
+
+def test_cache_hit_is_written_into_the_adk_session(monkeypatch, tmp_path):
+    turn, refused, cache, adk = start_turn(monkeypatch, tmp_path, {"s1": []})
+
+    assert refused is None and turn.cached == ANSWER
+    assert [(e["author"], e["content"]["parts"][0]["text"]) for e in adk.sessions["s1"]] == [
+        ("user", QUESTION), (main.ADK_ROOT_AGENT, "25 days.")]
+    assert not cache.first_turn("s1")
+
+
+def test_session_with_history_is_not_answered_from_the_cache(monkeypatch, tmp_path):
+    earlier = [{"author": "user", "content": {"role": "user", "parts": [{"text": "hi"}]}}]
+    turn, refused, cache, adk = start_turn(monkeypatch, tmp_path, {"s1": earlier})
+
+    assert refused is None and turn.cached is None
+    assert turn._cache_lookup is None  # its answer will not be cached either
+    assert adk.sessions["s1"] == earlier
+    assert not cache.first_turn("s1")
+
+
+def test_refused_first_turn_keeps_the_session_on_its_first_turn(monkeypatch, tmp_path):
+    admission = AdmissionController(rate_per_minute=60, burst=1)
+    asyncio.run(admission.acquire("alice"))  # spends alice's only token
+    earlier = [{"author": "user", "content": {"role": "user", "parts": [{"text": "hi"}]}}]
+    turn, refused, cache, _ = start_turn(monkeypatch, tmp_path, {"s1": earlier}, admission)
+
+    assert refused is not None and refused.status_code == 429
+    assert cache.first_turn("s1")
@@ -0,0 +1,51 @@
+from contextAssembly import assemble_context, merge_chunks, truncate_to_tokens
+from embeddingService import estimate_tokens
+from hybridRetriever import Document
+
+
+def memory(text, **metadata):
+    metadata.setdefault("role", "user")
+    return Document(page_content=text, metadata=metadata)
+
+
+def message(role, text):
+    return {"role": role, "message": text}
+
+
+def test_overlapping_splits_of_one_message_are_stitched():
+    docs = [
+        memory("the quick brown fox jumps", message_id="m1", chunk_index=1),
+        memory("jumps over the lazy dog", message_id="m1", chunk_index=2),
+        memory("an unrelated note"),
+        memory("the quick brown fox", message_id="m1", chunk_index=0),
+    ]
+    items = merge_chunks(docs, max_overlap=20)
+    assert [item.text for item in items] == ["the quick brown fox jumps over the lazy dog", "an unrelated note"]
+    assert [item.relevance_rank for item in items] == [1, 3]
+
+
+def test_memories_repeated_in_recent_turns_are_dropped():
+    recent = [message("user", "My order number is 4411."), message("assistant", "Thanks, I found order 4411.")]
+    docs = [memory("my order number is 4411."), memory("I prefer email over phone calls.")]
+    result = assemble_context(recent, docs, token_budget=1000)
+
+    assert result.deduplicated == 1
+    assert result.text == "user: I prefer email over phone calls.\nuser: My order number is 4411.\nassistant: Thanks, I found order 4411."
+
+
+def test_budget_keeps_the_newest_turns_and_reports_savings():
+    recent = [message("user", f"question {i} " + "word " * 40) for i in range(6)]
+    budget = 3 * estimate_tokens(f"user: {recent[0]['message']}")
+    result = assemble_context(recent, [], token_budget=budget, min_recent=2)
+
+    assert result.tokens <= budget
+    assert "question 5" in result.text and "question 4" in result.text
+    assert "question 0" not in result.text
+    assert result.dropped >= 3 and result.tokens_saved == result.candidate_tokens - result.tokens
+
+
+def test_truncation_respects_the_token_limit():
+    text = "lorem ipsum " * 200
+    cut = truncate_to_tokens(text, 50)
+    assert cut.endswith("…") and estimate_tokens(cut) <= 50
+    assert truncate_to_tokens("short", 50) == "short"
@@ -0,0 +1,54 @@
+import pytest
+
+from historyStore import InMemoryHistoryStore, SQLiteHistoryStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryHistoryStore(max_messages=3)
+    else:
+        store = SQLiteHistoryStore(path=str(tmp_path / "history.sqlite"), max_messages=3)
+        yield store
+        store.close()
+
+
+def test_keeps_the_last_messages_per_user_in_order(store):
+    for i in range(5):
+        store.append("alice", "user", f"a{i}")
+    store.append("bob", "user", "b0")
+
+    assert [m["message"] for m in store.recent("alice", 10)] == ["a2", "a3", "a4"]
+    assert store.recent("alice", 2) == [{"role": "user", "message": "a3"}, {"role": "user", "message": "a4"}]
+    assert store.recent("alice", 0) == [] and store.recent("nobody", 5) == []
+    store.delete("alice")
+    assert store.recent("alice", 5) == [] and len(store.recent("bob", 5)) == 1
+
+
+def test_in_memory_store_evicts_idle_and_least_recent_users():
+    clock = FakeClock()
+    store = InMemoryHistoryStore(max_users=2, idle_ttl=60, clock=clock)
+    store.append("alice", "user", "hi")
+    store.append("bob", "user", "hi")
+    store.recent("alice", 1)
+    store.append("carol", "user", "hi")  # over max_users: bob was least recently active
+    assert store.recent("bob", 1) == [] and len(store) == 2
+
+    clock.now += 61
+    assert store.recent("alice", 1) == [] and len(store) == 0
+    assert store.size_bytes == 0
+
+
+def test_in_memory_store_honours_the_byte_cap():
+    store = InMemoryHistoryStore(max_bytes=1000)
+    store.append("alice", "user", "x" * 500)
+    store.append("bob", "user", "y" * 500)
+    assert store.recent("alice", 1) == [] and store.size_bytes <= 1000
@@ -0,0 +1,30 @@
+from hybridRetriever import Document, document_key, reciprocal_rank_fusion
+
+
+def doc(name: str) -> Document:
+    return Document(page_content=f"text of {name}", metadata={"source": f"{name}.pdf", "page": 1})
+
+
+def names(docs):
+    return [d.metadata["source"][:-4] for d in docs]
+
+
+def test_documents_found_by_both_retrievers_rank_first():
+    lexical = [doc("a"), doc("b"), doc("c")]
+    vector = [doc("d"), doc("c"), doc("e")]
+    assert names(reciprocal_rank_fusion([lexical, vector], [1.0, 1.0], rrf_k=60)) == ["c", "a", "d", "b", "e"]
+
+
+def test_weights_shift_the_ranking_and_zero_drops_a_retriever():
+    lexical = [doc("a"), doc("b")]
+    vector = [doc("b"), doc("a")]
+    assert names(reciprocal_rank_fusion([lexical, vector], [2.0, 1.0]))[0] == "a"
+    assert names(reciprocal_rank_fusion([lexical, vector], [1.0, 2.0]))[0] == "b"
+    assert names(reciprocal_rank_fusion([lexical, [doc("z")]], [1.0, 0.0])) == ["a", "b"]
+
+
+def test_hits_are_merged_by_content_not_object_identity():
+    copy = Document(page_content="text of a", metadata={"source": "a.pdf", "page": 1}, id="other-id")
+    assert document_key(copy) == document_key(doc("a"))
+    assert len(reciprocal_rank_fusion([[doc("a")], [copy]], [1.0, 1.0])) == 1
+    assert document_key(Document("text of a", {"source": "a.pdf", "page": 2})) != document_key(doc("a"))
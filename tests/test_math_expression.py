@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("google.adk")
+
+from agents.mathAgent import MAX_EXPRESSION_LENGTH, evaluate_expression  # noqa: E402
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("3.5 * 12 + 2^10", 1066.0),
+    ("2^3^2", 512.0),  # ^ is a power, right-associative like **
+    ("(1 + 2) × 3 ÷ 4", 2.25),
+    ("-(-3) + 7 // 2 + 7 % 4", 9.0),
+    ("sqrt(16) + max(1, 2, 3) + round(2.567, 2)", 9.57),
+    ("floor(pi) + ceil(e)", 6.0),
+])
+def test_arithmetic(expression, expected):
+    assert evaluate_expression(expression) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("expression", [
+    '__import__("os").system("true")',
+    "().__class__.__bases__",
+    "open('/etc/passwd')",
+    "(lambda: 1)()",
+    "[x for x in (1, 2)]",
+    "'a' * 3",
+    "abs(x=1)",
+    "pi.real",
+    "True + 1",
+])
+def test_anything_but_arithmetic_is_refused(expression):
+    result = evaluate_expression(expression)
+    assert isinstance(result, dict) and "error" in result
+
+
+@pytest.mark.parametrize("expression", ["10 ** 10000", "9 ** 9 ** 9", "1e308 * 10", "999.0 ** 999", "1 / 0", "sqrt(-1)"])
+def test_huge_or_undefined_results_are_errors(expression):
+    assert "error" in evaluate_expression(expression)
+
+
+def test_size_limits():
+    assert "error" in evaluate_expression("1" + "+1" * MAX_EXPRESSION_LENGTH)
+    assert "error" in evaluate_expression("+".join(["1"] * 150))  # short enough, but too many nodes
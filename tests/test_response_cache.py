@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from responseCache import SemanticResponseCache, TurnRecorder
+
+ANSWER = b'{"type":"text","text":"Employees get 25 days."}\n\n'
+
+
+def make_cache(tmp_path, **kwargs) -> SemanticResponseCache:
+    return SemanticResponseCache(db_path=str(tmp_path), **kwargs)
+
+
+def lookup(cache, text, scope):
+    return asyncio.run(cache.lookup(text, scope=scope))
+
+
+def test_same_prompt_from_two_users_does_not_share_an_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    miss = lookup(cache, "How many vacation days do I get?", "alice")
+    assert miss.frames is None
+    cache.store(miss, ANSWER)
+
+    assert lookup(cache, "how many vacation days do I get", "alice").frames == ANSWER
+    assert lookup(cache, "How many vacation days do I get?", "bob").frames is None
+    assert len(cache) == 1
+
+
+def test_semantic_match_stays_within_scope(tmp_path):
+    pytest.importorskip("numpy")
+    vectors = {"vacation days": [1.0, 0.0], "holiday days": [0.99, 0.14]}
+    cache = make_cache(tmp_path, embed_fn=lambda text: vectors[text], similarity_threshold=0.9)
+    cache.store(lookup(cache, "vacation days", "alice"), ANSWER)
+
+    assert lookup(cache, "holiday days", "bob").frames is None
+    assert lookup(cache, "holiday days", "alice").frames == ANSWER
+
+
+def test_session_stays_on_its_first_turn_until_a_turn_is_recorded(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.first_turn("session-1")
+    assert cache.first_turn("session-1")  # e.g. the first attempt was refused
+    cache.record_turn("session-1")
+    assert not cache.first_turn("session-1")
+    assert cache.first_turn("session-2")
+
+
+def test_recorder_refuses_turns_with_confirmations_or_errors():
+    for blocking in ({"type": "tool_confirmation", "confirmation_id": "c1"}, {"type": "error", "status": "fail"}):
+        recorder = TurnRecorder()
+        recorder.observe({"type": "function_call", "name": "rag_knowledge_expert"})
+        recorder.observe(blocking)
+        recorder.completed = True
+        assert not recorder.cacheable(["rag_knowledge_expert"])
+
+
+def test_recorder_accepts_a_completed_rag_answer():
+    recorder = TurnRecorder()
+    recorder.observe({"type": "function_call", "name": "rag_knowledge_expert"})
+    recorder.observe({"type": "text", "text": "25 days."})
+    recorder.completed = True
+    assert recorder.cacheable(["rag_knowledge_expert"])
+    assert not TurnRecorder().cacheable(["rag_knowledge_expert"])
@@ -0,0 +1,61 @@
+import json
+
+from sseRelay import SSERelay, decode_frames
+
+
+def event(*parts) -> bytes:
+    return b"data: " + json.dumps({"content": {"parts": list(parts)}}).encode() + b"\n\n"
+
+
+def relay_all(chunks, **kwargs):
+    relay = SSERelay(**kwargs)
+    out = b"".join(relay.feed(chunk) for chunk in chunks) + relay.close()
+    return decode_frames(out)
+
+
+def test_text_parts_are_coalesced_up_to_the_frame_size():
+    stream = b"".join(event({"text": word}) for word in ["Hello", ", ", "world"])
+    assert relay_all([stream], max_frame_bytes=1024) == [{"type": "text", "text": "Hello, world"}]
+    assert relay_all([stream], max_frame_bytes=5)[0] == {"type": "text", "text": "Hello"}
+
+
+def test_events_split_across_reads_are_reassembled():
+    stream = event({"text": "split"}) + event({"functionCall": {"name": "send_email"}})
+    chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+    assert relay_all(chunks) == [{"type": "text", "text": "split"}, {"type": "function_call", "name": "send_email"}]
+
+
+def test_malformed_events_are_skipped_and_the_stream_goes_on():
+    stream = b"".join([
+        event({"text": "before "}),
+        b'data: {"content": {"parts": [ not json\n\n',
+        b'data: {"content": {"parts": 5}}\n\n',
+        b'data: {"content": "parts"}\n\n',
+        b'data: ["parts"]\n\n',
+        event("a string part", {"text": None}, {"functionCall": "not an object"}),
+        event({"functionCall": {"name": "adk_request_confirmation", "id": "c1", "args": ["unexpected"]}}),
+        event({"text": "after"}),
+    ])
+    assert relay_all([stream]) == [
+        {"type": "text", "text": "before "},
+        {"type": "tool_confirmation", "confirmation_id": "c1", "name": None, "hint": None},
+        {"type": "text", "text": "after"},
+    ]
+
+
+def test_events_without_parts_are_not_relayed():
+    stream = b'data: {"actions": {"stateDelta": {}}}\n\n: keep-alive\n\n' + event({"text": "x"})
+    assert relay_all([stream]) == [{"type": "text", "text": "x"}]
+
+
+def test_trailing_event_without_newline_is_handled_on_close():
+    assert relay_all([event({"text": "last"}).rstrip(b"\n")]) == [{"type": "text", "text": "last"}]
+
+
+def test_error_flushes_pending_text_first():
+    relay = SSERelay(max_delay=60)
+    assert relay.feed(event({"text": "partial"})) == b""
+    assert decode_frames(relay.error("Upstream returned 500", 500)) == [
+        {"type": "text", "text": "partial"},
+        {"type": "error", "status": "fail", "code": 500, "details": "Upstream returned 500"},
+    ]
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from summarizationWorker import SummarizationWorker
+
+
+def test_every_user_is_summarized_and_no_lock_is_kept():
+    done = []
+    worker = SummarizationWorker(done.append, concurrency=3, debounce=0)
+    for i in range(50):
+        assert worker.submit(f"user-{i}")
+    worker.join()
+    worker.stop()
+    assert sorted(done) == sorted(f"user-{i}" for i in range(50))
+    assert worker._user_locks == {}
+
+
+def test_requests_for_a_queued_user_are_coalesced():
+    done = []
+    worker = SummarizationWorker(done.append, concurrency=1, debounce=0.05)
+    for _ in range(5):
+        worker.submit("alice")
+    worker.join()
+    worker.stop()
+    assert done == ["alice"]
+
+
+def test_jobs_of_one_user_never_overlap():
+    running, overlaps = set(), []
+    release = threading.Event()
+
+    def summarize(user_id):
+        if user_id in running:
+            overlaps.append(user_id)
+        running.add(user_id)
+        release.wait(1)
+        time.sleep(0.01)
+        running.discard(user_id)
+
+    worker = SummarizationWorker(summarize, concurrency=2, debounce=0)
+    worker.submit("alice")
+    time.sleep(0.05)  # the first job is running and no longer pending
+    worker.submit("alice")
+    release.set()
+    worker.join()
+    worker.stop()
+    assert overlaps == []
+    assert worker._user_locks == {}
+
+
+def test_a_failing_job_does_not_stop_the_worker():
+    done = []
+
+    def summarize(user_id):
+        if user_id == "broken":
+            raise RuntimeError("LLM unavailable")
+        done.append(user_id)
+
+    worker = SummarizationWorker(summarize, concurrency=1, debounce=0)
+    worker.submit("broken")
+    worker.submit("alice")
+    worker.join()
+    worker.stop()
+    assert done == ["alice"]
+    assert worker._user_locks == {}
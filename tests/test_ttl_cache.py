@@ -0,0 +1,53 @@
+from ttlCache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    evicted = []
+    cache = TTLCache(max_entries=2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert evicted == ["b"]
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_entries_expire_after_their_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("default", 1)
+    cache.set("longer", 2, ttl=60)
+    clock.now += 10
+
+    assert cache.get("default", "gone") == "gone"
+    assert cache.get("longer") == 2
+    assert [key for key, _ in cache.items()] == ["longer"]
+
+
+def test_memory_cap_evicts_and_skips_oversized_values():
+    cache = TTLCache(max_bytes=10, sizeof=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.set("c", b"123")
+    assert cache.get("a") is None and cache.size_bytes == 8
+
+    cache.set("huge", b"x" * 11)
+    assert cache.get("huge") is None and len(cache) == 2
+
+
+def test_replacing_and_popping_keep_the_byte_count():
+    cache = TTLCache(sizeof=len)
+    cache.set("a", b"1234")
+    cache.set("a", b"12")
+    assert cache.size_bytes == 2
+    assert cache.pop("a") == b"12" and cache.pop("a", "missing") == "missing"
+    assert cache.size_bytes == 0
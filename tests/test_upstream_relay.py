@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import main  # noqa: E402
+from backendPool import BackendPool  # noqa: E402
+from responseCache import SemanticResponseCache, TurnRecorder  # noqa: E402
+from sseRelay import decode_frames  # noqa: E402
+
+BACKEND = "http://adk:8000"
+
+
+def sse(text: str) -> bytes:
+    return b"data: " + json.dumps({"content": {"parts": [{"text": text}]}}).encode() + b"\n\n"
+
+
+RAG_CALL = b"data: " + json.dumps({"content": {"parts": [{"functionCall": {"name": "rag_knowledge_expert"}}]}}).encode() + b"\n\n"
+
+
+async def not_disconnected() -> bool:
+    return False
+
+
+def mock_backend(monkeypatch, body) -> BackendPool:
+    """Points the proxy at a mock ADK backend whose /run_sse streams `body()` (an async iterator)."""
+    client = main.httpx.AsyncClient(transport=main.httpx.MockTransport(lambda request: main.httpx.Response(200, content=body())))
+    pool = BackendPool([BACKEND], client=client)
+    monkeypatch.setattr(main.app.state, "http_client", client, raising=False)
+    monkeypatch.setattr(main.app.state, "backend_pool", pool, raising=False)
+    return pool
+
+
+def relay(monkeypatch, body, **kwargs):
+    pool = mock_backend(monkeypatch, body)
+
+    async def run():
+        span = main.tracing.start_span("test.turn")
+        frames = [f async for f in main._relay_upstream(not_disconnected, pool.backends[BACKEND], {}, span, **kwargs)]
+        await pool.client.aclose()
+        return decode_frames(b"".join(frames))
+
+    return asyncio.run(run())
+
+
+def test_no_first_byte_in_time_is_a_504_frame(monkeypatch):
+    monkeypatch.setattr(main, "UPSTREAM_FIRST_BYTE_TIMEOUT", 0.05)
+
+    async def body():
+        await asyncio.sleep(1)
+        yield sse("too late")
+
+    assert relay(monkeypatch, body) == [{"type": "error", "status": "fail", "code": 504, "details": "ADK backend timed out"}]
+
+
+def test_idle_upstream_ends_with_a_504_frame_after_the_partial_answer(monkeypatch):
+    async def body():
+        yield sse("partial")
+        raise main.httpx.ReadTimeout("idle")
+
+    assert relay(monkeypatch, body) == [
+        {"type": "text", "text": "partial"},
+        {"type": "error", "status": "fail", "code": 504, "details": "ADK backend timed out"},
+    ]
+
+
+def test_broken_upstream_stream_is_a_502_frame(monkeypatch):
+    async def body():
+        yield sse("partial")
+        raise main.httpx.RemoteProtocolError("peer closed connection")
+
+    assert relay(monkeypatch, body)[-1] == {"type": "error", "status": "fail", "code": 502, "details": "ADK stream failed"}
+
+
+def answer_first_turn(monkeypatch, tmp_path, body) -> SemanticResponseCache:
+    """Streams a cacheable first turn through ChatTurn.stream; returns the response cache afterwards."""
+    pool = mock_backend(monkeypatch, body)
+    cache = SemanticResponseCache(db_path=str(tmp_path))
+    monkeypatch.setattr(main.app.state, "response_cache", cache, raising=False)
+
+    async def run():
+        turn = main.ChatTurn(main.ChatBody(sessionId="s1", userId="alice", text="How many vacation days?"))
+        turn.backend = pool.backends[BACKEND]
+        turn._cache_lookup = await cache.lookup(turn.body.text, scope="alice")
+        async for _ in turn.stream(not_disconnected):
+            pass
+        turn.finish()
+        await pool.client.aclose()
+
+    asyncio.run(run())
+    return cache
+
+
+def test_complete_answer_is_cached(monkeypatch, tmp_path):
+    async def body():
+        yield RAG_CALL
+        yield sse("25 days.")
+
+    assert len(answer_first_turn(monkeypatch, tmp_path, body)) == 1
+
+
+def test_answer_cut_off_mid_stream_is_not_cached(monkeypatch, tmp_path):
+    recorders = []
+
+    class Recorder(TurnRecorder):
+        def __init__(self):
+            super().__init__()
+            recorders.append(self)
+
+    monkeypatch.setattr(main, "TurnRecorder", Recorder)
+
+    async def body():
+        yield RAG_CALL
+        yield sse("25 d")
+        raise main.httpx.ReadTimeout("idle")
+
+    assert len(answer_first_turn(monkeypatch, tmp_path, body)) == 0
+    assert not recorders[0].completed
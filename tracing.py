@@ -0,0 +1,298 @@
+"""
+Per-turn latency tracing across the proxy, the agents, tools and retrieval.
+
+- `with span("name", **attributes):` times a block as a child of the current
+  span, and @traced("name") does the same for a function (sync or async). The
+  current span lives in a contextvar, so it follows asyncio tasks and
+  contextvars.copy_context() into worker threads.
+- The proxy starts one trace per /chat request (continuing a W3C `traceparent`
+  header if the caller sent one) and passes it to ADK in the run's state_delta
+  under TRACE_STATE_KEY, where the agent callbacks pick it up.
+- Every finished span is observed in a `span_<name>_seconds` histogram and
+  handed to the exporters listed in TRACE_EXPORTERS (comma separated):
+    console  one JSON line per span on stdout
+    file     JSON lines appended to TRACE_FILE
+    otlp     OpenTelemetry SDK with the OTLP exporter (needs opentelemetry-sdk
+             and opentelemetry-exporter-otlp; set up by the standard OTEL_*
+             variables, e.g. OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME)
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+TRACE_EXPORTERS = [e.strip() for e in os.getenv("TRACE_EXPORTERS", "").split(",") if e.strip()]
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.jsonl")
+
+# Session state key (temp: keys are not persisted) holding the proxy's traceparent for one run.
+TRACE_STATE_KEY = "temp:traceparent"
+
+_CURRENT_PARENT = object()
+
+
+class SpanContext:
+    """Identifies a span, possibly one from another process (e.g. a traceparent header)."""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span(SpanContext):
+    __slots__ = ("name", "parent_id", "start_time", "_started", "duration", "attributes", "events", "error")
+
+    def __init__(self, name: str, parent: Optional[SpanContext] = None, attributes: Optional[Dict[str, Any]] = None):
+        super().__init__(parent.trace_id if parent is not None else os.urandom(16).hex(), os.urandom(8).hex())
+        self.name = name
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        """Marks a point in time within the span (e.g. the first upstream byte)."""
+        self.events.append({"name": name, "offset_ms": round(1000 * (time.perf_counter() - self._started), 3), **attributes})
+
+    def end(self, error: Optional[BaseException] = None):
+        """Finishes the span; later calls are ignored."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = repr(error)
+        _histogram(self.name).observe(self.duration)
+        for exporter in _exporters():
+            try:
+                exporter.export(self)
+            except Exception as e:
+                print(f"Trace exporter {type(exporter).__name__} failed: {e!r}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(1000 * self.duration, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "events": self.events,
+            "error": self.error,
+        }
+
+
+def current() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    parent = _current.get()
+    return parent.trace_id if parent is not None else None
+
+
+def activate(span: Optional[SpanContext]) -> contextvars.Token:
+    """Makes `span` the parent of spans started in this context from now on."""
+    return _current.set(span)
+
+
+def start_span(name: str, parent=_CURRENT_PARENT, **attributes) -> Span:
+    """
+    Starts a span without making it current; call end() on it. parent defaults
+    to the current span, and None starts a new trace.
+    """
+    if parent is _CURRENT_PARENT:
+        parent = _current.get()
+    return Span(name, parent, attributes)
+
+
+@contextlib.contextmanager
+def span(name: str, parent=_CURRENT_PARENT, **attributes):
+    s = start_span(name, parent, **attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.end(error=e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def annotate(**attributes):
+    """Adds attributes to the current span, if it is a local one."""
+    s = _current.get()
+    if isinstance(s, Span):
+        s.set(**attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator: runs every call of the function in a span (default name: its qualified name)."""
+
+    def decorate(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# --- W3C trace context ---
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+def traceparent(s: SpanContext) -> str:
+    return f"00-{s.trace_id}-{s.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None or set(match.group(1)) == {"0"}:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+# --- Latency histograms ---
+_HISTOGRAMS: Dict[str, metrics.Histogram] = {}
+
+
+def _histogram(name: str) -> metrics.Histogram:
+    histogram = _HISTOGRAMS.get(name)
+    if histogram is None:
+        metric_name = "span_" + re.sub(r"[^0-9a-zA-Z_]+", "_", name).strip("_").lower() + "_seconds"
+        histogram = _HISTOGRAMS[name] = metrics.histogram(metric_name, f"Duration of '{name}' spans")
+    return histogram
+
+
+# --- Exporters ---
+class ConsoleExporter:
+    def export(self, s: Span):
+        print(json.dumps(s.to_dict(), default=str))
+
+
+class FileExporter:
+    """Appends one JSON line per span; safe to share between threads."""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, s: Span):
+        line = json.dumps(s.to_dict(), default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line)
+
+
+class OTLPExporter:
+    """
+    Re-emits finished spans through the OpenTelemetry SDK, keeping their trace
+    and span ids so spans from the proxy and the agents join into one trace.
+    """
+
+    def __init__(self):
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.id_generator import IdGenerator
+
+        ids = threading.local()
+
+        class _SpanIds(IdGenerator):
+            def generate_span_id(self) -> int:
+                return ids.span_id
+
+            def generate_trace_id(self) -> int:
+                return ids.trace_id
+
+        provider = TracerProvider(resource=Resource.create(), id_generator=_SpanIds())
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self._trace = trace
+        self._ids = ids
+        self._tracer = provider.get_tracer("chat-tracing")
+
+    def export(self, s: Span):
+        trace = self._trace
+        context = None
+        if s.parent_id is not None:
+            parent = trace.SpanContext(
+                trace_id=int(s.trace_id, 16), span_id=int(s.parent_id, 16),
+                is_remote=True, trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+            )
+            context = trace.set_span_in_context(trace.NonRecordingSpan(parent))
+        self._ids.trace_id = int(s.trace_id, 16)
+        self._ids.span_id = int(s.span_id, 16)
+        start_ns = int(s.start_time * 1e9)
+        attributes = {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in s.attributes.items()}
+        otel_span = self._tracer.start_span(s.name, context=context, start_time=start_ns, attributes=attributes)
+        for event in s.events:
+            extra = {k: v for k, v in event.items() if k not in ("name", "offset_ms")}
+            otel_span.add_event(event["name"], attributes=extra, timestamp=start_ns + int(event["offset_ms"] * 1e6))
+        if s.error is not None:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR, s.error))
+        otel_span.end(end_time=start_ns + int(s.duration * 1e9))
+
+
+_EXPORTERS: Optional[List] = None
+_EXPORTERS_LOCK = threading.Lock()
+
+
+def _exporters() -> List:
+    global _EXPORTERS
+    if _EXPORTERS is None:
+        with _EXPORTERS_LOCK:
+            if _EXPORTERS is None:
+                _EXPORTERS = _create_exporters(TRACE_EXPORTERS)
+    return _EXPORTERS
+
+
+def _create_exporters(names: List[str]) -> List:
+    exporters = []
+    for name in names:
+        if name == "console":
+            exporters.append(ConsoleExporter())
+        elif name == "file":
+            exporters.append(FileExporter())
+        elif name == "otlp":
+            try:
+                exporters.append(OTLPExporter())
+            except ImportError:
+                print("TRACE_EXPORTERS=otlp needs 'opentelemetry-sdk' and 'opentelemetry-exporter-otlp'. Skipping it.")
+        else:
+            print(f"Unknown trace exporter '{name}' ignored.")
+    return exporters